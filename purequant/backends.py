@@ -0,0 +1,162 @@
+# -*- coding:utf-8 -*-
+
+"""
+指标计算后端
+
+TalibBackend调用TA-Lib，NumpyBackend使用purequant.vectorized中的纯numpy实现，两者的函数名、参数与返回值一致。
+未安装TA-Lib的环境（如不便安装TA-Lib的Linux服务器）可以使用NumpyBackend，计算结果与TA-Lib一致。
+"""
+
+import numpy as np
+from purequant import vectorized
+from purequant.config import config
+
+try:
+    import talib
+except ImportError:
+    talib = None
+
+
+def _skip_nan(function, arrays, *params):
+    """与TA-Lib一致，跳过输入序列开头的nan再计算，结果前面补nan与输入对齐"""
+    arrays = [np.asarray(array, dtype=np.float64) for array in arrays]
+    valid = ~np.any([np.isnan(array) for array in arrays], axis=0)
+    begin = int(np.argmax(valid)) if valid.any() else len(valid)
+    if begin == 0:
+        return function(*arrays, *params)
+    result = function(*(array[begin:] for array in arrays), *params)
+    if isinstance(result, tuple):
+        return tuple(vectorized._shifted(item, begin) for item in result)
+    return vectorized._shifted(result, begin)
+
+
+class TalibBackend:
+    """调用TA-Lib计算指标"""
+
+    name = "talib"
+
+    def __init__(self):
+        if talib is None:
+            raise ImportError("未安装TA-Lib，请安装TA-Lib或使用numpy后端!")
+
+    def SMA(self, close, timeperiod):
+        return talib.SMA(close, timeperiod)
+
+    def EMA(self, close, timeperiod):
+        return talib.EMA(close, timeperiod)
+
+    def KAMA(self, close, timeperiod):
+        return talib.KAMA(close, timeperiod)
+
+    def BBANDS(self, close, timeperiod, nbdevup=2, nbdevdn=2):
+        return talib.BBANDS(close, timeperiod=timeperiod, nbdevup=nbdevup, nbdevdn=nbdevdn, matype=0)
+
+    def ATR(self, high, low, close, timeperiod):
+        return talib.ATR(high, low, close, timeperiod=timeperiod)
+
+    def RSI(self, close, timeperiod):
+        return talib.RSI(close, timeperiod=timeperiod)
+
+    def MACD(self, close, fastperiod, slowperiod, signalperiod):
+        return talib.MACD(close, fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod)
+
+    def STOCH(self, high, low, close, fastk_period, slowk_period, slowd_period):
+        return talib.STOCH(high, low, close, fastk_period=fastk_period, slowk_period=slowk_period, slowk_matype=0,
+                           slowd_period=slowd_period, slowd_matype=0)
+
+    def STOCHRSI(self, close, timeperiod, fastk_period, fastd_period):
+        return talib.STOCHRSI(close, timeperiod=timeperiod, fastk_period=fastk_period, fastd_period=fastd_period,
+                              fastd_matype=0)
+
+    def SAR(self, high, low, acceleration=0.02, maximum=0.2):
+        return talib.SAR(high, low, acceleration=acceleration, maximum=maximum)
+
+    def TRIX(self, close, timeperiod):
+        return talib.TRIX(close, timeperiod=timeperiod)
+
+    def OBV(self, close, volume):
+        return talib.OBV(close, volume)
+
+    def ROC(self, close, timeperiod):
+        return talib.ROC(close, timeperiod=timeperiod)
+
+    def STDDEV(self, close, timeperiod, nbdev=1):
+        return talib.STDDEV(close, timeperiod=timeperiod, nbdev=nbdev)
+
+    def MAX(self, values, timeperiod):
+        return talib.MAX(values, timeperiod)
+
+    def MIN(self, values, timeperiod):
+        return talib.MIN(values, timeperiod)
+
+
+class NumpyBackend:
+    """使用纯numpy计算指标，不依赖TA-Lib"""
+
+    name = "numpy"
+
+    def SMA(self, close, timeperiod):
+        return _skip_nan(vectorized.sma, (close,), timeperiod)
+
+    def EMA(self, close, timeperiod):
+        return _skip_nan(vectorized.ema, (close,), timeperiod)
+
+    def KAMA(self, close, timeperiod):
+        return _skip_nan(vectorized.kama, (close,), timeperiod)
+
+    def BBANDS(self, close, timeperiod, nbdevup=2, nbdevdn=2):
+        return _skip_nan(vectorized.bbands, (close,), timeperiod, nbdevup, nbdevdn)
+
+    def ATR(self, high, low, close, timeperiod):
+        return _skip_nan(vectorized.atr, (high, low, close), timeperiod)
+
+    def RSI(self, close, timeperiod):
+        return _skip_nan(vectorized.rsi, (close,), timeperiod)
+
+    def MACD(self, close, fastperiod, slowperiod, signalperiod):
+        return _skip_nan(vectorized.macd, (close,), fastperiod, slowperiod, signalperiod)
+
+    def STOCH(self, high, low, close, fastk_period, slowk_period, slowd_period):
+        return _skip_nan(vectorized.stoch, (high, low, close), fastk_period, slowk_period, slowd_period)
+
+    def STOCHRSI(self, close, timeperiod, fastk_period, fastd_period):
+        return _skip_nan(vectorized.stochrsi, (close,), timeperiod, fastk_period, fastd_period)
+
+    def SAR(self, high, low, acceleration=0.02, maximum=0.2):
+        return _skip_nan(vectorized.sar, (high, low), acceleration, maximum)
+
+    def TRIX(self, close, timeperiod):
+        return _skip_nan(vectorized.trix, (close,), timeperiod)
+
+    def OBV(self, close, volume):
+        return _skip_nan(vectorized.obv, (close, volume))
+
+    def ROC(self, close, timeperiod):
+        return _skip_nan(vectorized.roc, (close,), timeperiod)
+
+    def STDDEV(self, close, timeperiod, nbdev=1):
+        return _skip_nan(vectorized.stddev, (close,), timeperiod, nbdev)
+
+    def MAX(self, values, timeperiod):
+        return _skip_nan(vectorized.highest, (values,), timeperiod)
+
+    def MIN(self, values, timeperiod):
+        return _skip_nan(vectorized.lowest, (values,), timeperiod)
+
+
+BACKENDS = {"talib": TalibBackend, "numpy": NumpyBackend}
+
+
+def get_backend(name=None):
+    """
+    获取指标计算后端
+    :param name: "talib"、"numpy"或"auto"，不传入时使用配置文件中的设置，
+                 "auto"在已安装TA-Lib时使用TA-Lib，否则使用numpy
+    :return: TalibBackend或NumpyBackend的实例
+    """
+    name = name or getattr(config, "indicators_backend", "auto")
+    if name == "auto":
+        name = "talib" if talib is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError("指标计算后端错误，只支持【talib numpy auto】!")
+    return BACKENDS[name]()
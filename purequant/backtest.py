@@ -0,0 +1,397 @@
+# -*- coding:utf-8 -*-
+
+"""
+向量化回测
+
+适用于开仓、平仓与止损条件可以写成布尔数组的策略（如双均线、布林强盗突破），
+信号、成交价格、持仓与资金曲线均用numpy数组计算，只在开平仓处循环，不再逐根k线运行begin_trade，
+可用于快速筛选大量参数组合。
+成交记录的格式与storage.mysql_save_strategy_run_info保存的数据一致，
+可以用compare_records与事件驱动回测（begin_trade）保存的成交记录逐笔核对。
+"""
+
+import bisect
+import numpy as np
+from purequant import time, report
+from purequant.backends import get_backend
+from purequant.kline import KlineFrame
+from purequant.ledger import RUN_INFO_FIELDS
+
+
+def _signal(values, length, delay):
+    """转换为布尔数组，并向后移动delay根k线：第t根k线收盘时产生的信号在第t+delay根k线上成交"""
+    if values is None:
+        return np.zeros(length, dtype=bool)
+    values = np.asarray(values, dtype=bool)
+    if delay:
+        values = np.concatenate((np.zeros(delay, dtype=bool), values[:-delay]))
+    return values
+
+
+def _price(values, default):
+    return default if values is None else np.asarray(values, dtype=np.float64)
+
+
+class _Events:
+    """某一类信号所在的k线位置，二分查找某根k线及之后的第一个信号"""
+
+    def __init__(self, mask):
+        self.bars = np.flatnonzero(mask).tolist()  # 对单个值二分查找时列表比numpy数组快
+        self.end = len(mask)
+
+    def next(self, start):
+        i = bisect.bisect_left(self.bars, start)
+        return self.bars[i] if i < len(self.bars) else self.end
+
+
+class Intrabar:
+    """
+    k线内部的成交顺序
+    用小周期k线（如1分钟k线）把每根k线分为若干段，开仓、平仓与止损按各自价格在小周期k线上首次被触及的先后顺序成交，
+    不再只凭同一根k线的最高价与最低价判断。小周期k线与k线的对应关系在创建时一次算好，参数优化时多次回测可共用同一个对象。
+    """
+
+    def __init__(self, frame, minute=None):
+        """
+        :param frame: 回测用的KlineFrame
+        :param minute: 覆盖同一时间段的小周期KlineFrame，如history_store.load("ltc_1m", ...)；
+                       为None或某根k线内没有小周期k线时，以这根k线自身作为唯一的一段
+        """
+        frame = frame if isinstance(frame, KlineFrame) else KlineFrame.from_records(frame)
+        n = len(frame)
+        bars = np.arange(n)
+        self.__open = frame.open
+        self.__open_times = None
+        if minute is None:
+            self.owner, self.start, self.end = bars, bars, bars + 1
+            self.high, self.low = frame.high, frame.low
+            self.trivial = True
+            return
+        minute = minute if isinstance(minute, KlineFrame) else KlineFrame.from_records(minute)
+        timestamp = frame.timestamp
+        owner = np.searchsorted(timestamp, minute.timestamp, side="right") - 1     # 每根小周期k线所属的k线
+        last_end = timestamp[-1] + (np.median(np.diff(timestamp)) if n > 1 else 0)
+        keep = (owner >= 0) & ((owner < n - 1) | (minute.timestamp < last_end))
+        missing = np.flatnonzero(np.bincount(owner[keep], minlength=n) == 0)
+        owner = np.concatenate((owner[keep], missing))
+        order = np.argsort(owner, kind="stable")
+        self.owner = owner[order]
+        self.high = np.concatenate((minute.high[keep], frame.high[missing]))[order]
+        self.low = np.concatenate((minute.low[keep], frame.low[missing]))[order]
+        self.start = np.searchsorted(self.owner, bars, side="left")
+        self.end = np.append(self.start[1:], len(self.owner))
+        self.trivial = False
+
+    def __len__(self):
+        return len(self.owner)
+
+    def times(self, price):
+        """
+        每根k线上某一价格首次被触及的小周期k线位置：高于等于开盘价时为最高价首次达到该价格的位置，
+        低于开盘价时为最低价首次达到该价格的位置，小周期k线中没有触及时为这根k线的最后一段
+        """
+        if self.trivial:
+            return self.start
+        if price is self.__open and self.__open_times is not None:
+            return self.__open_times
+        level = np.asarray(price, dtype=np.float64)[self.owner]
+        rising = (price >= self.__open)[self.owner]
+        touched = np.where(rising, self.high >= level, self.low <= level)
+        positions = np.where(touched, np.arange(len(self.owner)), len(self.owner))
+        times = np.minimum(np.minimum.reduceat(positions, self.start), self.end - 1)
+        if price is self.__open:
+            self.__open_times = times
+        return times
+
+
+class _Book:
+    """模拟账户，记录每笔成交与资金变化"""
+
+    def __init__(self, timestamp, start_asset, contract_value, fee, integer):
+        self.timestamp = timestamp
+        self.contract_value = contract_value
+        self.fee = fee
+        self.integer = integer
+        self.total_asset = start_asset
+        self.total_profit = 0
+        self.direction = 0
+        self.amount = 0
+        self.price = 0
+        self.entry_bar = 0
+        self.records = []
+        self.trades = []    # 每笔持仓的(开仓k线位置, 平仓k线位置, 方向, 数量, 开仓价格)
+        self.cash = []      # 每次资金变化的(k线位置, 变化量)
+
+    def __time(self, bar):
+        return time.ts_to_datetime_str(self.timestamp[bar] / 1000)
+
+    def __charge(self, bar, turnover):
+        cost = turnover * self.fee
+        if cost:
+            self.total_asset -= cost
+            self.total_profit -= cost
+            self.cash.append((bar, -cost))
+        return cost
+
+    def open(self, bar, direction, price, size_price, profit=0, action=None):
+        amount = self.total_asset / size_price / self.contract_value
+        amount = round(amount) if self.integer else amount
+        self.__charge(bar, amount * price * self.contract_value)
+        self.direction, self.amount, self.price, self.entry_bar = direction, amount, price, bar
+        action = action or ("买入开多" if direction > 0 else "卖出开空")
+        self.records.append((self.__time(bar), action, price, amount, amount * price * self.contract_value, price,
+                             "long" if direction > 0 else "short", amount, profit, self.total_profit, self.total_asset))
+
+    def close(self, bar, price, action=None):
+        """平仓并返回此次盈亏，不传入action时不保存成交记录（平仓后立即反手开仓）"""
+        profit = (price - self.price) * self.direction * self.amount * self.contract_value
+        self.total_asset += profit
+        self.total_profit += profit
+        self.cash.append((bar, profit))
+        profit -= self.__charge(bar, self.amount * price * self.contract_value)
+        self.trades.append((self.entry_bar, bar, self.direction, self.amount, self.price))
+        if action is not None:
+            self.records.append((self.__time(bar), action, price, self.amount, self.amount * price * self.contract_value,
+                                 0, "none", 0, profit, self.total_profit, self.total_asset))
+        self.direction, self.amount, self.price = 0, 0, 0
+        return profit
+
+
+class BacktestResult:
+    """
+    向量化回测结果
+    records: 成交记录列表，每行与storage.mysql_save_strategy_run_info保存的数据格式一致
+    position: 每根k线收盘时的持仓数量，多头为正、空头为负
+    equity: 每根k线收盘时的总资金，包含按收盘价计算的浮动盈亏
+    timestamp: 每根k线的毫秒时间戳
+    """
+
+    def __init__(self, records, position, equity, total_asset, total_profit, timestamp, start_asset):
+        self.records = records
+        self.position = position
+        self.equity = equity
+        self.total_asset = total_asset
+        self.total_profit = total_profit
+        self.timestamp = timestamp
+        self.start_asset = start_asset
+
+    def metrics(self):
+        """返回一个字典，{"总资金": 已平仓的总资金, "总盈亏": 已平仓的总盈亏, "成交次数": 成交记录条数, "最大回撤": 资金曲线的最大回撤比例}"""
+        drawdown = 0.0
+        if len(self.equity):
+            peak = np.maximum.accumulate(self.equity)
+            drawdown = float(np.max(1 - self.equity / peak))
+        return {"总资金": self.total_asset, "总盈亏": self.total_profit, "成交次数": len(self.records), "最大回撤": drawdown}
+
+    def report(self, risk_free=0.0):
+        """完整的绩效指标，见purequant.report.performance"""
+        profits, turnover = report.trade_arrays(self.records)
+        return report.performance(self.equity, self.timestamp, profits, turnover, self.position, self.start_asset, risk_free)
+
+
+def signal_backtest(frame, long_entry=None, short_entry=None, long_exit=None, short_exit=None,
+                    long_entry_price=None, short_entry_price=None, long_exit_price=None, short_exit_price=None,
+                    long_stop=None, short_stop=None, size_price=None, delay=1, reverse=True, exit_on_entry_bar=True,
+                    start_asset=1000, contract_value=1, fee=0.0, integer=True, intrabar=None):
+    """
+    向量化回测
+    同一根k线上依次处理开仓（反手）、止损与平仓信号，与示例策略中begin_trade的执行顺序一致；
+    传入intrabar时按小周期k线上成交的先后顺序处理，同一段小周期k线内仍按上述顺序
+    :param frame: 按时间先后排列的KlineFrame或k线数据列表
+    :param long_entry: 开多信号，布尔数组
+    :param short_entry: 开空信号，布尔数组，同一根k线上同时出现开多与开空信号时只开多
+    :param long_exit: 平多信号，布尔数组
+    :param short_exit: 平空信号，布尔数组
+    :param long_entry_price: 开多价格数组，默认为开盘价，以下价格数组均为成交所在k线上的价格，不随delay移动
+    :param short_entry_price: 开空价格数组，默认为开盘价
+    :param long_exit_price: 平多价格数组，默认为开盘价
+    :param short_exit_price: 平空价格数组，默认为开盘价
+    :param long_stop: 多单止损幅度，如0.95，最低价小于等于开仓价格*long_stop时以该价格止损
+    :param short_stop: 空单止损幅度，如1.05，最高价大于等于开仓价格*short_stop时以该价格止损
+    :param size_price: 计算开仓数量所用的价格数组，默认为开仓价格，开仓数量=总资金/size_price/合约面值
+    :param delay: 信号在第几根k线后成交，默认为1，即第t根k线收盘时产生的信号在第t+1根k线的开盘价成交
+    :param reverse: 持仓时出现反向开仓信号是否平仓后反手开仓，为False时只在无持仓时开仓
+    :param exit_on_entry_bar: 开仓的k线上是否可以止损或平仓，为False时开仓的k线上不再下单
+    :param start_asset: 初始资金
+    :param contract_value: 合约面值，现货为1
+    :param fee: 手续费率，按成交金额计算
+    :param integer: 开仓数量是否取整（合约张数）
+    :param intrabar: Intrabar或小周期KlineFrame（如1分钟k线），传入时同一根k线上的开仓、平仓与止损按小周期k线上
+                     触及各自价格的先后顺序成交，开仓的k线上只有开仓之后才会止损；为None时按上述固定顺序处理
+    :return: BacktestResult
+    """
+    frame = frame if isinstance(frame, KlineFrame) else KlineFrame.from_records(frame)
+    n = len(frame)
+    long_entry, short_entry = _signal(long_entry, n, delay), _signal(short_entry, n, delay)
+    long_exit, short_exit = _signal(long_exit, n, delay), _signal(short_exit, n, delay)
+    entry_price = {1: _price(long_entry_price, frame.open), -1: _price(short_entry_price, frame.open)}
+    exit_price = {1: _price(long_exit_price, frame.open), -1: _price(short_exit_price, frame.open)}
+    stop = {1: long_stop, -1: short_stop}
+    entries = {1: _Events(long_entry), -1: _Events(short_entry)}
+    exits = {1: _Events(long_exit), -1: _Events(short_exit)}
+    line = intrabar if isinstance(intrabar, Intrabar) else Intrabar(frame, intrabar)
+    if len(line.start) != n:
+        raise ValueError("Intrabar与回测的k线数量不一致!")
+    end = len(line)     # 以下时间均为小周期k线的位置，end表示回测结束之后
+    entry_time = {1: line.times(entry_price[1]), -1: line.times(entry_price[-1])}
+    exit_time = {1: line.times(exit_price[1]), -1: line.times(exit_price[-1])}
+    book = _Book(frame.timestamp, start_asset, contract_value, fee, integer)
+
+    def size(bar, direction):
+        return size_price[bar] if size_price is not None else entry_price[direction][bar]
+
+    bar = 0
+    entered = 0     # 当前持仓的开仓时间
+    while bar < n:
+        if book.direction == 0:     # 无持仓时找下一个开仓信号，同一根k线上先触及的先成交，同时触及时开多
+            long_bar, short_bar = entries[1].next(bar), entries[-1].next(bar)
+            bar = min(long_bar, short_bar)
+            if bar >= n:
+                break
+            direction = 1 if long_bar == bar and (short_bar > bar or entry_time[1][bar] <= entry_time[-1][bar]) else -1
+            book.open(bar, direction, entry_price[direction][bar], size(bar, direction))
+            entered = entry_time[direction][bar]
+        direction = book.direction
+        exit_bar = exits[direction].next(bar if exit_on_entry_bar else bar + 1)
+        if exit_bar == bar and exit_time[direction][bar] < entered:    # 开仓之前的平仓信号不成交
+            exit_bar = exits[direction].next(bar + 1)
+        opposite_bar = entries[-direction].next(bar + 1) if reverse else n
+        exit_at = exit_time[direction][exit_bar] if exit_bar < n else end
+        opposite_at = entry_time[-direction][opposite_bar] if opposite_bar < n else end
+        stop_at = end
+        if stop[direction] is not None:     # 在下一次反手开仓之前（含平仓成交的时间）查找第一次触发止损的时间
+            level = book.price * stop[direction]
+            first = entered if exit_on_entry_bar else (line.start[bar + 1] if bar + 1 < n else end)
+            last = min(opposite_at, exit_at + 1, end)
+            hit = line.low[first:last] <= level if direction > 0 else line.high[first:last] >= level
+            hits = np.flatnonzero(hit)
+            stop_at = first + int(hits[0]) if len(hits) else end
+        at = min(opposite_at, exit_at, stop_at)
+        if at >= end:
+            break
+        bar = int(line.owner[at])
+        if at == opposite_at:     # 平仓后反手开仓
+            price = entry_price[-direction][bar]
+            profit = book.close(bar, price)
+            book.open(bar, -direction, price, size(bar, -direction), profit, "平空开多" if direction < 0 else "平多开空")
+            entered = at
+            continue
+        if at == stop_at:
+            book.close(bar, book.price * stop[direction], "卖出止损" if direction > 0 else "买入止损")
+        else:
+            book.close(bar, exit_price[direction][bar], "卖出平多" if direction > 0 else "买入平空")
+        bar += 1
+    if book.direction != 0:     # 回测结束时仍有持仓
+        book.trades.append((book.entry_bar, n, book.direction, book.amount, book.price))
+
+    position = np.zeros(n)
+    holding_price = np.zeros(n)
+    for entry_bar, exit_bar, direction, amount, price in book.trades:
+        position[entry_bar:exit_bar] = direction * amount
+        holding_price[entry_bar:exit_bar] = price
+    cash = np.zeros(n)
+    for cash_bar, change in book.cash:
+        cash[cash_bar] += change
+    equity = start_asset + np.cumsum(cash) + position * contract_value * (frame.close - holding_price)
+    return BacktestResult(book.records, position, equity, book.total_asset, book.total_profit, frame.timestamp, start_asset)
+
+
+def compare_records(records, result, tolerance=1e-9):
+    """
+    逐笔核对事件驱动回测（begin_trade）保存的成交记录与向量化回测的成交记录，不比较交易类型的名称
+    :param records: storage.ledger(数据库名称, 数据表名称).rows()或storage.read_mysql_datas的返回值，
+                    类型为"none"的初始资金记录会被忽略；从mysql中读取的FLOAT是单精度，tolerance需设为1e-6左右
+    :param result: signal_backtest的返回值
+    :param tolerance: 数值的相对误差
+    :return: 不一致之处组成的列表，每项为(第几笔成交, 字段, begin_trade的值, 向量化回测的值)，完全一致时为空列表
+    """
+    expected = [row for row in records if row[1] != "none"]
+    mismatches = []
+    if len(expected) != len(result.records):
+        mismatches.append((None, "成交次数", len(expected), len(result.records)))
+    for i, (row, other) in enumerate(zip(expected, result.records)):
+        for field, a, b in zip(RUN_INFO_FIELDS, row, other):
+            if field == "类型":
+                continue
+            if isinstance(a, str) or isinstance(b, str):
+                equal = a == b
+            else:
+                equal = abs(a - b) <= tolerance * max(1.0, abs(a), abs(b))
+            if not equal:
+                mismatches.append((i, field, a, b))
+    return mismatches
+
+
+# 以下为示例策略的向量化版本，信号与示例中begin_trade的计算方法一致
+
+def _indicator(frame, backend, name, *args):
+    """用收盘价计算指标并缓存在frame.series中，参数优化时多组参数共享同一份k线数据，相同参数的指标只计算一次"""
+    key = ("backtest", backend.name, name) + args
+    if key not in frame.series:
+        frame.series[key] = getattr(backend, name)(frame.close, *args)
+    return frame.series[key]
+
+
+def _crosses(fast, slow):
+    cross_over = np.zeros(len(fast), dtype=bool)
+    cross_below = np.zeros(len(fast), dtype=bool)
+    cross_over[1:] = (fast[1:] >= slow[1:]) & (fast[:-1] < slow[:-1])
+    cross_below[1:] = (slow[1:] >= fast[1:]) & (slow[:-1] < fast[:-1])
+    return cross_over, cross_below
+
+
+def double_ma(frame, fast_length, slow_length, long_stop=None, short_stop=None, backend=None, **kwargs):
+    """
+    双均线多空策略（example/double_moving_average_strategy/fastly_backtest_doubale_ma_strategy.py）
+    金叉开多、死叉开空，持反向仓位时平仓后反手，在下一根k线的开盘价成交，开仓后按止损幅度止损
+    :param backend: 指标计算后端，与INDICATORS一致，默认使用配置文件中的设置
+    :param kwargs: 传给signal_backtest的其他参数，如start_asset、contract_value、fee
+    :return: BacktestResult
+    """
+    frame = frame if isinstance(frame, KlineFrame) else KlineFrame.from_records(frame)
+    backend = get_backend(backend)
+    cross_over, cross_below = _crosses(_indicator(frame, backend, "SMA", fast_length),
+                                       _indicator(frame, backend, "SMA", slow_length))
+    return signal_backtest(frame, long_entry=cross_over, short_entry=cross_below, long_stop=long_stop,
+                           short_stop=short_stop, delay=1, **kwargs)
+
+
+def boll_breakout(frame, bollinger_lengths=50, filter_length=30, backend=None, **kwargs):
+    """
+    布林强盗突破策略（example/boll_breakthrough_strategy/boll_breakthrough_strategy.py）
+    盘中突破上轨（下轨）时以上轨（下轨）价格开多（开空），跌破（突破）中轨时以中轨价格止损，
+    触及自适应出场均线时以均线价格平仓，开仓的k线上不平仓
+    :param kwargs: 传给signal_backtest的其他参数，如start_asset、contract_value、fee
+    :return: BacktestResult
+    """
+    frame = frame if isinstance(frame, KlineFrame) else KlineFrame.from_records(frame)
+    backend = get_backend(backend)
+    close, high, low = frame.close, frame.high, frame.low
+    n = len(frame)
+    bars = np.arange(n)
+    middleband = _indicator(frame, backend, "BBANDS", bollinger_lengths, 2, 2)[1]
+    deviation = _indicator(frame, backend, "STDDEV", bollinger_lengths, 1)
+    upperband = middleband + deviation
+    lowerband = middleband - deviation
+    close_change = np.full(n, np.nan)   # 过滤器：当日收盘价减去filter_length日前的收盘价
+    close_change[filter_length:] = close[filter_length:] - close[:n - filter_length]
+    # 自适应出场均线的长度从bollinger_lengths开始，每根k线减1，最小为10
+    out_day = np.full(n, bollinger_lengths + 1)
+    if bollinger_lengths + 1 > 10:
+        out_day = np.maximum(10, bollinger_lengths - (bars - (bollinger_lengths - 1)))
+    valid = (bars >= bollinger_lengths - 1) & (bars >= filter_length)
+    ma = np.full(n, np.nan)
+    for length in np.unique(out_day[valid]):
+        mask = valid & (out_day == length)
+        ma[mask] = _indicator(frame, backend, "SMA", int(length))[mask]
+    long_stop = low < middleband
+    short_stop = high > middleband
+    return signal_backtest(frame,
+                           long_entry=valid & (close_change > 0) & (high > upperband),
+                           short_entry=valid & (close_change < 0) & (low < lowerband),
+                           long_exit=valid & (long_stop | ((upperband > ma) & (ma > low))),
+                           short_exit=valid & (short_stop | ((lowerband < ma) & (ma < high))),
+                           long_entry_price=upperband, short_entry_price=lowerband,
+                           long_exit_price=np.where(long_stop, middleband, ma),
+                           short_exit_price=np.where(short_stop, middleband, ma),
+                           size_price=upperband, delay=0, reverse=False, exit_on_entry_bar=False, **kwargs)
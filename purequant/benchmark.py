@@ -0,0 +1,324 @@
+# -*- coding:utf-8 -*-
+
+"""
+离线性能测试
+
+使用随机生成的数据，不需要网络连接，测试INDICATORS的每个指标、MARKET的价格函数、time.utctime_str_to_ts
+以及各交易所k线数据格式（OKEx列表、火币字典、币安数组）转换为KlineFrame的耗时，
+在1千、1万、10万根k线上分别输出每根k线的耗时（纳秒）与内存分配峰值，并可保存为基准结果，
+修改关键代码后与基准结果对比即可发现性能退化。
+
+    python -m purequant.benchmark                               运行全部测试
+    python -m purequant.benchmark --save baseline.json          运行并保存基准结果
+    python -m purequant.benchmark --compare baseline.json       运行并与基准结果对比
+    python -m purequant.benchmark --backends                    numpy后端与TA-Lib的误差与速度对比，可据此为不同的部署环境选择后端
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from purequant import time as pqtime
+from purequant.backends import BACKENDS, talib
+from purequant.config import config
+from purequant.kline import KlineFrame
+
+
+def sample_frame(bars, seed=0):
+    """生成随机游走的k线数据，价格保留两位小数，包含价格不变的k线"""
+    rng = np.random.default_rng(seed)
+    close = np.round(1000 + np.cumsum(rng.normal(0, 2, bars)), 2)
+    close[bars // 2: bars // 2 + min(50, bars // 10)] = close[bars // 2]   # 一段横盘行情
+    open = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open, close) + np.round(rng.random(bars) * 2, 2)
+    low = np.minimum(open, close) - np.round(rng.random(bars) * 2, 2)
+    volume = np.round(rng.random(bars) * 1000, 3)
+    timestamp = 1577836800000 + np.arange(bars, dtype=np.int64) * 60000
+    return KlineFrame(timestamp, open, high, low, close, volume)
+
+
+# 指标名称与计算函数，计算函数的参数为后端与KlineFrame
+CASES = [
+    ("SMA", lambda backend, frame: backend.SMA(frame.close, 20)),
+    ("EMA", lambda backend, frame: backend.EMA(frame.close, 20)),
+    ("KAMA", lambda backend, frame: backend.KAMA(frame.close, 30)),
+    ("BBANDS", lambda backend, frame: backend.BBANDS(frame.close, 20, 2, 2)),
+    ("ATR", lambda backend, frame: backend.ATR(frame.high, frame.low, frame.close, 14)),
+    ("RSI", lambda backend, frame: backend.RSI(frame.close, 14)),
+    ("MACD", lambda backend, frame: backend.MACD(frame.close, 12, 26, 9)),
+    ("STOCH", lambda backend, frame: backend.STOCH(frame.high, frame.low, frame.close, 9, 3, 3)),
+    ("SAR", lambda backend, frame: backend.SAR(frame.high, frame.low, 0.02, 0.2)),
+    ("TRIX", lambda backend, frame: backend.TRIX(frame.close, 12)),
+    ("OBV", lambda backend, frame: backend.OBV(frame.close, frame.volume)),
+    ("ROC", lambda backend, frame: backend.ROC(frame.close, 10)),
+    ("STOCHRSI", lambda backend, frame: backend.STOCHRSI(frame.close, 14, 14, 3)),
+    ("STDDEV", lambda backend, frame: backend.STDDEV(frame.close, 20, 1)),
+    ("MAX", lambda backend, frame: backend.MAX(frame.high, 20)),
+    ("MIN", lambda backend, frame: backend.MIN(frame.low, 20)),
+]
+
+
+def _max_error(result, expected):
+    """两组结果的最大相对误差，nan的位置不一致时返回inf"""
+    result = np.atleast_2d(result)
+    expected = np.atleast_2d(expected)
+    error = 0.0
+    for actual, target in zip(result, expected):
+        if not np.array_equal(np.isnan(actual), np.isnan(target)):
+            return np.inf
+        valid = ~np.isnan(target)
+        if valid.any():
+            error = max(error, float(np.max(np.abs(actual[valid] - target[valid]) / np.maximum(1.0, np.abs(target[valid])))))
+    return error
+
+
+def parity(bars=(1, 2, 30, 1000, 100000), tolerance=1e-9):
+    """
+    检查numpy后端与TA-Lib的计算结果是否一致
+    :param bars: 测试数据的k线数量，分别生成数据进行检查
+    :param tolerance: 允许的最大相对误差
+    :return: 字典，{指标名称: 最大相对误差}
+    """
+    if talib is None:
+        raise ImportError("未安装TA-Lib，无法进行一致性检查!")
+    expected_backend = BACKENDS["talib"]()
+    numpy_backend = BACKENDS["numpy"]()
+    errors = {}
+    for count in bars:
+        frame = sample_frame(count, seed=count)
+        for name, function in CASES:
+            error = _max_error(function(numpy_backend, frame), function(expected_backend, frame))
+            errors[name] = max(errors.get(name, 0.0), error)
+    failed = [name for name, error in errors.items() if not error <= tolerance]
+    if failed:
+        raise AssertionError("numpy后端与TA-Lib的计算结果不一致：{}".format(
+            ", ".join("{}={}".format(name, errors[name]) for name in failed)))
+    return errors
+
+
+def benchmark(bars=100000, repeat=5, backends=None):
+    """
+    测试每种后端计算每个指标的速度
+    :param bars: 测试数据的k线数量
+    :param repeat: 重复次数，取最快的一次
+    :param backends: 要测试的后端名称列表，默认测试所有可用的后端
+    :return: 字典，{后端名称: {指标名称: 每秒处理的k线数量}}
+    """
+    if backends is None:
+        backends = [name for name in BACKENDS if name != "talib" or talib is not None]
+    frame = sample_frame(bars)
+    result = {}
+    for backend_name in backends:
+        backend = BACKENDS[backend_name]()
+        result[backend_name] = {}
+        for name, function in CASES:
+            best = np.inf
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function(backend, frame)
+                best = min(best, time.perf_counter() - start)
+            result[backend_name][name] = bars / best
+    return result
+
+
+def okex_payload(frame):
+    """OKEx的k线数据：最新的k线在前，[UTC时间字符串, 开, 高, 低, 收, 成交量, 成交额]，数值为字符串"""
+    rows = []
+    for i in range(len(frame) - 1, -1, -1):
+        rows.append([pqtime.ts_to_utc_str(frame.timestamp[i] // 1000), str(frame.open[i]), str(frame.high[i]),
+                     str(frame.low[i]), str(frame.close[i]), str(frame.volume[i]), str(frame.volume[i] * frame.close[i])])
+    return rows
+
+
+def huobi_payload(frame):
+    """火币的k线数据：最新的k线在前，每根k线是一个字典，id为秒级时间戳"""
+    return [{"id": int(frame.timestamp[i] // 1000), "open": float(frame.open[i]), "close": float(frame.close[i]),
+             "low": float(frame.low[i]), "high": float(frame.high[i]), "amount": float(frame.volume[i]),
+             "vol": float(frame.volume[i] * frame.close[i]), "count": 100}
+            for i in range(len(frame) - 1, -1, -1)]
+
+
+def binance_payload(frame):
+    """币安的k线数据：按时间先后排列，[开盘毫秒时间戳, 开, 高, 低, 收, 成交量, 收盘时间, ...]，价格为字符串"""
+    return [[int(frame.timestamp[i]), str(frame.open[i]), str(frame.high[i]), str(frame.low[i]), str(frame.close[i]),
+             str(frame.volume[i]), int(frame.timestamp[i]) + 59999, "0", 100, "0", "0", "0"]
+            for i in range(len(frame))]
+
+
+def ingest_okex(payload):
+    """与trade模块中OKEx的get_kline及INDICATORS的转换过程一致"""
+    return KlineFrame.from_records(payload, reverse=True)
+
+
+def ingest_huobi(payload):
+    """与trade模块中火币的get_kline及INDICATORS的转换过程一致"""
+    records = [[pqtime.ts_to_utc_str(item["id"]), item["open"], item["high"], item["low"], item["close"], item["vol"],
+                round(item["amount"], 2)] for item in payload]
+    return KlineFrame.from_records(records, reverse=True)
+
+
+def ingest_binance(payload):
+    """与trade模块中币安的get_kline及INDICATORS的转换过程一致"""
+    records = [[pqtime.ts_to_utc_str(int(item[0]) / 1000)] + item[1:6] for item in payload]
+    records.reverse()
+    return KlineFrame.from_records(records, reverse=True)
+
+
+# INDICATORS的测试项目，名称与调用方式，frame为KlineFrame
+INDICATOR_CASES = [
+    ("ATR(14)", lambda indicators, frame: indicators.ATR(14, kline=frame)),
+    ("BOLL(20)", lambda indicators, frame: indicators.BOLL(20, kline=frame)),
+    ("HIGHEST(20)", lambda indicators, frame: indicators.HIGHEST(20, kline=frame)),
+    ("MA(20)", lambda indicators, frame: indicators.MA(20, kline=frame)),
+    ("MA(5,10,20)", lambda indicators, frame: indicators.MA(5, 10, 20, kline=frame)),
+    ("MATRIX(SMA,5..45)", lambda indicators, frame: indicators.MATRIX("SMA", range(5, 50, 5), kline=frame)),
+    ("MACD(12,26,9)", lambda indicators, frame: indicators.MACD(12, 26, 9, kline=frame)),
+    ("EMA(20)", lambda indicators, frame: indicators.EMA(20, kline=frame)),
+    ("KAMA(30)", lambda indicators, frame: indicators.KAMA(30, kline=frame)),
+    ("KDJ(9,3,3)", lambda indicators, frame: indicators.KDJ(9, 3, 3, kline=frame)),
+    ("LOWEST(20)", lambda indicators, frame: indicators.LOWEST(20, kline=frame)),
+    ("OBV", lambda indicators, frame: indicators.OBV(kline=frame)),
+    ("RSI(14)", lambda indicators, frame: indicators.RSI(14, kline=frame)),
+    ("ROC(10)", lambda indicators, frame: indicators.ROC(10, kline=frame)),
+    ("STOCHRSI(14,14,3)", lambda indicators, frame: indicators.STOCHRSI(14, 14, 3, kline=frame)),
+    ("SAR", lambda indicators, frame: indicators.SAR(kline=frame)),
+    ("STDDEV(20)", lambda indicators, frame: indicators.STDDEV(20, kline=frame)),
+    ("TRIX(12)", lambda indicators, frame: indicators.TRIX(12, kline=frame)),
+    ("VOLUME", lambda indicators, frame: indicators.VOLUME(kline=frame)),
+    ("BarUpdate", lambda indicators, frame: indicators.BarUpdate(kline=frame)),
+    ("CurrentBar", lambda indicators, frame: indicators.CurrentBar(kline=frame)),
+]
+
+
+def _measure(function, bars, repeat):
+    """返回每根k线的耗时（纳秒，取最快的一次）与内存分配峰值（字节）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"ns_per_bar": best / bars, "peak_bytes": peak}
+
+
+def suite(sizes=(1000, 10000, 100000), repeat=3, backend=None):
+    """
+    运行全部测试项目
+    :param sizes: 测试数据的k线数量
+    :param repeat: 每个项目的重复次数，耗时取最快的一次
+    :param backend: 指标计算后端，默认使用配置文件中的设置
+    :return: 字典，{"分组/项目/k线数量": {"ns_per_bar": 每根k线的耗时, "peak_bytes": 内存分配峰值}}
+    """
+    from purequant.indicators import INDICATORS
+    from purequant.market import MARKET
+    previous = getattr(config, "backtest", None)
+    config.backtest = "enabled"     # 与回测模式一致，k线数据由参数传入，不请求交易所
+    results = {}
+    try:
+        for bars in sizes:
+            frame = sample_frame(bars, seed=bars)
+            records = [row[:6] for row in reversed(okex_payload(frame))]
+            indicators = INDICATORS(None, "BTC-USDT", "1m", backend=backend)
+            for name, function in INDICATOR_CASES:
+                results["indicators/{}/{}".format(name, bars)] = _measure(
+                    lambda: function(indicators, frame), bars, repeat)
+            results["indicators/MA(20)[records]/{}".format(bars)] = _measure(
+                lambda: indicators.MA(20, kline=records), bars, repeat)
+
+            market = MARKET(None, "BTC-USDT", "1m")
+            for name in ("open", "high", "low", "close"):
+                accessor = getattr(market, name)
+                results["market/{}[frame]/{}".format(name, bars)] = _measure(
+                    lambda: [accessor(i, kline=frame) for i in range(bars)], bars, repeat)
+                results["market/{}[records]/{}".format(name, bars)] = _measure(
+                    lambda: [accessor(i, kline=records) for i in range(bars)], bars, repeat)
+
+            strings = [row[0] for row in records]
+            results["time/utctime_str_to_ts/{}".format(bars)] = _measure(   # 每次先清空缓存，测试未命中缓存时的耗时
+                lambda: (pqtime._utctime_str_to_mts.cache_clear(), [pqtime.utctime_str_to_ts(string) for string in strings]),
+                bars, repeat)
+            results["time/utctime_str_to_ts[cached]/{}".format(bars)] = _measure(
+                lambda: [pqtime.utctime_str_to_ts(string) for string in strings], bars, repeat)
+            results["time/utctime_str_column_to_mts/{}".format(bars)] = _measure(
+                lambda: pqtime.utctime_str_column_to_mts(strings), bars, repeat)
+
+            for exchange, payload, ingest in (("okex", okex_payload(frame), ingest_okex),
+                                              ("huobi", huobi_payload(frame), ingest_huobi),
+                                              ("binance", binance_payload(frame), ingest_binance)):
+                results["ingest/{}/{}".format(exchange, bars)] = _measure(lambda: ingest(payload), bars, repeat)
+    finally:
+        config.backtest = previous
+    return results
+
+
+def save_baseline(results, path):
+    """将测试结果保存为基准结果"""
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def compare(results, path, threshold=1.2):
+    """
+    与基准结果对比
+    :param results: suite()的测试结果
+    :param path: 基准结果文件
+    :param threshold: 耗时或内存超过基准结果的倍数时视为性能退化
+    :return: 列表，[(项目, 指标, 基准值, 当前值), ...]
+    """
+    with open(path) as file:
+        baseline = json.load(file)
+    regressions = []
+    for key, current in results.items():
+        if key not in baseline:
+            continue
+        for metric in ("ns_per_bar", "peak_bytes"):
+            base = baseline[key][metric]
+            if base > 0 and current[metric] > base * threshold:
+                regressions.append((key, metric, base, current[metric]))
+    return regressions
+
+
+def _print_backends():
+    if talib is not None:
+        print("numpy后端与TA-Lib的最大相对误差：")
+        for name, error in parity().items():
+            print("{:<10}{:.2e}".format(name, error))
+    speeds = benchmark()
+    print("每秒处理的k线数量：")
+    print("{:<10}".format("") + "".join("{:>16}".format(name) for name in speeds))
+    for name, _ in CASES:
+        print("{:<10}".format(name) + "".join("{:>16,.0f}".format(speeds[backend][name]) for backend in speeds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PureQuant离线性能测试")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="测试数据的k线数量，以逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每个项目的重复次数")
+    parser.add_argument("--backend", default=None, help="指标计算后端：talib、numpy或auto")
+    parser.add_argument("--save", default=None, help="将测试结果保存为基准结果")
+    parser.add_argument("--compare", default=None, help="与基准结果对比")
+    parser.add_argument("--threshold", type=float, default=1.2, help="视为性能退化的倍数")
+    parser.add_argument("--backends", action="store_true", help="numpy后端与TA-Lib的误差与速度对比")
+    args = parser.parse_args()
+    if args.backends:
+        _print_backends()
+    else:
+        results = suite([int(size) for size in args.sizes.split(",")], args.repeat, args.backend)
+        print("{:<45}{:>16}{:>16}".format("项目", "纳秒/k线", "内存峰值(KB)"))
+        for key, result in results.items():
+            print("{:<45}{:>16,.1f}{:>16,.1f}".format(key, result["ns_per_bar"], result["peak_bytes"] / 1024))
+        if args.save:
+            save_baseline(results, args.save)
+        if args.compare:
+            regressions = compare(results, args.compare, args.threshold)
+            for key, metric, base, current in regressions:
+                print("性能退化：{} {} 基准 {:,.1f} 当前 {:,.1f}".format(key, metric, base, current))
+            if not regressions:
+                print("未发现性能退化")
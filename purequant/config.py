@@ -89,12 +89,47 @@ class __Config:
         self.mongodb_authorization = configures["MONGODB"]["authorization"]
         self.mongodb_user_name = configures["MONGODB"]["user_name"]
         self.mongodb_password = configures["MONGODB"]["password"]
+        # 可选配置，pool_size为共用客户端的连接池大小，batch_size与flush_interval为行情记录器累计多少条或距上次写入
+        # 多少秒时批量写入一次，write_concern为行情记录器的写入确认选项，如{"w": 1, "j": false}，
+        # max_buffer为无法连接mongodb时行情记录器最多缓存的消息条数，超出时丢弃最早的消息
+        self.mongodb_pool_size = configures["MONGODB"].get("pool_size", 100)
+        self.mongodb_batch_size = configures["MONGODB"].get("batch_size", 1000)
+        self.mongodb_flush_interval = configures["MONGODB"].get("flush_interval", 1.0)
+        self.mongodb_write_concern = configures["MONGODB"].get("write_concern")
+        self.mongodb_max_buffer = configures["MONGODB"].get("max_buffer", 100000)
         # MYSQL AUTHORIZATION
         self.mysql_authorization = configures["MYSQL"]["authorization"]
         self.mysql_user_name = configures["MYSQL"]["user_name"]
         self.mysql_password = configures["MYSQL"]["password"]
+        # 可选配置，pool_size为每个数据库的连接池大小，ping_interval为连接空闲超过多少秒后使用前先检查是否可用
+        self.mysql_pool_size = configures["MYSQL"].get("pool_size", 5)
+        self.mysql_ping_interval = configures["MYSQL"].get("ping_interval", 30)
         # BACKTEST
         self.backtest = configures["MODE"]["backtest"]
+        # KLINE_CACHE 可选配置，k线快照的缓存有效期（秒），0为不缓存，null为仅在新k线出现时刷新
+        self.kline_cache_ttl = configures.get("KLINE_CACHE", {}).get("ttl", 1)
+        # 可选配置，设置基础周期（如"1m"）后其他周期的k线均由基础周期的k线合成，offset为周期起点相对UTC零点的偏移秒数
+        self.kline_base_time_frame = configures.get("KLINE_CACHE", {}).get("base")
+        self.kline_resample_offset = configures.get("KLINE_CACHE", {}).get("offset", 0)
+        # LEDGER 可选配置，回测时策略运行信息先保存在内存中再批量写入，sink为"mysql"、"sqlite"或"parquet"，
+        # flush_rows为每累计多少行写入一次（0为回测结束时写入），path为SQLite数据库文件或Parquet文件所在的文件夹
+        self.ledger_sink = configures.get("LEDGER", {}).get("sink", "mysql")
+        self.ledger_flush_rows = configures.get("LEDGER", {}).get("flush_rows", 0)
+        self.ledger_path = configures.get("LEDGER", {}).get("path", ".")
+        # WRITE_BEHIND 可选配置，mode为"sync"（在调用处直接写入）或"async"（放入队列由后台线程成批写入），
+        # queue_size为队列容量，interval为后台线程等待新数据的秒数，batch为每批最多写入的条数，fsync_every为文件每写入多少行fsync一次
+        self.write_behind_mode = configures.get("WRITE_BEHIND", {}).get("mode", "sync")
+        self.write_behind_queue_size = configures.get("WRITE_BEHIND", {}).get("queue_size", 10000)
+        self.write_behind_interval = configures.get("WRITE_BEHIND", {}).get("interval", 0.2)
+        self.write_behind_batch = configures.get("WRITE_BEHIND", {}).get("batch", 1000)
+        self.write_behind_fsync_every = configures.get("WRITE_BEHIND", {}).get("fsync_every", 0)
+        # retries为连接中断等错误最多重试的次数，backoff为第一次重试前等待的秒数（之后每次加倍）
+        self.write_behind_retries = configures.get("WRITE_BEHIND", {}).get("retries", 3)
+        self.write_behind_backoff = configures.get("WRITE_BEHIND", {}).get("backoff", 0.5)
+        # HISTORY 可选配置，本地历史k线数据文件所在的文件夹
+        self.history_path = configures.get("HISTORY", {}).get("path", "history")
+        # INDICATORS 可选配置，指标计算后端，"talib"、"numpy"或"auto"（已安装TA-Lib时使用TA-Lib，否则使用numpy）
+        self.indicators_backend = configures.get("INDICATORS", {}).get("backend", "auto")
 
     def update_config(self, config_file, config_content):
         """
@@ -17,6 +17,7 @@ from purequant.logger import logger
 from purequant.config import config
 from purequant.time import *
 from purequant.storage import storage
+from purequant.kline import replay
 from purequant.push import push
 
 class Strategy:
@@ -57,7 +58,7 @@ class Strategy:
             if self.indicators.CurrentBar(kline=kline) < self.bollinger_lengths:  # 如果k线数据不够长就返回
                 return
 
-            timestamp = ts_to_datetime_str(utctime_str_to_ts(kline[-1][0])) if kline else get_localtime()  # 非回测模式下时间戳就是当前本地时间
+            timestamp = ts_to_datetime_str(kline.timestamp[-1] / 1000) if kline else get_localtime()  # 非回测模式下时间戳就是当前本地时间
 
             if self.indicators.BarUpdate(kline=kline):
                 self.counter = 0    # k线更新时还原计数器
@@ -161,11 +162,10 @@ if __name__ == "__main__":
     if config.backtest == "enabled":  # 回测模式
         print("正在回测，可能需要一段时间，请稍后...")
         start_time = get_cur_timestamp()
-        records = []
-        data = storage.read_purequant_server_datas(instrument_id.split("-")[0].lower() + "_" + time_frame)
-        for k in data:
-            records.append(k)
-            strategy.begin_trade(kline=records)
+        history = storage.read_history_klines(instrument_id.split("-")[0].lower() + "_" + time_frame)  # 优先读取本地历史k线数据
+        strategy.indicators.preload(history)  # 预计算模式，每个指标只在完整历史数据上计算一次
+        for kline in replay(history):    # 逐根k线回放，每次传入以当前k线结尾的只读视图，不复制数据
+            strategy.begin_trade(kline=kline)
         cost_time = get_cur_timestamp() - start_time
         print("回测用时{}秒，结果已保存至mysql数据库！".format(cost_time))
     else:  # 实盘模式
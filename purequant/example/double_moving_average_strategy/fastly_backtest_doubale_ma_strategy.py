@@ -2,7 +2,8 @@
 双均线策略
 此种策略的写法是手动记录持仓信息，而非读取数据库中的持仓信息(回测模式)或实时从交易所获取账户实际持仓信息(实盘模式)
 此策略也可兼容回测与实盘
-优点：由于回测时不再反复读取数据库中的持仓信息，回测速度大大提升
+优点：开平仓时不需要再通过POSITION获取持仓信息，实盘时可以减少向交易所请求持仓信息的次数
+（回测模式下POSITION已直接使用内存中最近一次保存的持仓信息，两种写法的回测速度相近）
 缺点：策略实盘时，如果策略重启，记录的持仓信息将回归初始值
 
 此策略适用于OKEX的USDT合约
@@ -13,12 +14,14 @@ email: interstella.ranger2020@gmail.com
 """
 
 from purequant.indicators import INDICATORS
+from purequant.backtest import double_ma, compare_records
 from purequant.trade import OKEXFUTURES
 from purequant.position import POSITION
 from purequant.market import MARKET
 from purequant.logger import logger
 from purequant.push import push
 from purequant.storage import storage
+from purequant.kline import replay
 from purequant.time import *
 from purequant.config import config
 
@@ -62,7 +65,7 @@ class Strategy:
             if self.indicators.CurrentBar(kline=kline) < self.slow_length:  # 如果k线数据不够长就返回
                 return
             # 非回测模式下时间戳就是当前本地时间
-            timestamp = ts_to_datetime_str(utctime_str_to_ts(kline[-1][0])) if kline else get_localtime()
+            timestamp = ts_to_datetime_str(kline.timestamp[-1] / 1000) if kline else get_localtime()
             # 计算策略信号
             ma = self.indicators.MA(self.fast_length, self.slow_length, kline=kline)
             fast_ma = ma[0]
@@ -184,13 +187,18 @@ if __name__ == "__main__":
     if config.backtest == "enabled":    # 回测模式
         print("正在回测，可能需要一段时间，请稍后...")
         start_time = get_cur_timestamp()
-        records = []
-        data = storage.read_purequant_server_datas(instrument_id.split("-")[0].lower() + "_" + time_frame)
-        for k in data:
-            records.append(k)
-            strategy.begin_trade(kline=records)
+        history = storage.read_history_klines(instrument_id.split("-")[0].lower() + "_" + time_frame)  # 优先读取本地历史k线数据
+        strategy.indicators.preload(history)  # 预计算模式，每个指标只在完整历史数据上计算一次
+        start_asset = strategy.total_asset
+        for kline in replay(history):    # 逐根k线回放，每次传入以当前k线结尾的只读视图，不复制数据
+            strategy.begin_trade(kline=kline)
         cost_time = get_cur_timestamp() - start_time
         print("回测用时{}秒，结果已保存至mysql数据库！".format(cost_time))
+        if config.first_run == "true":  # 用向量化回测逐笔核对此次回测的成交记录
+            result = double_ma(history, strategy.fast_length, strategy.slow_length, strategy.long_stop, strategy.short_stop,
+                               start_asset=start_asset, contract_value=strategy.contract_value)
+            mismatches = compare_records(storage.ledger(strategy.database, strategy.datasheet).rows(), result)
+            print("向量化回测核对结果：{}".format("逐笔一致" if not mismatches else mismatches[:10]))
     else:   # 实盘模式
         while True:     # 循环运行begin_trade函数
             strategy.begin_trade()
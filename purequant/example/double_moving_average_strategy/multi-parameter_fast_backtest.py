@@ -12,7 +12,10 @@ Date:   2020/08/21
 email: interstella.ranger2020@gmail.com
 """
 
+from functools import partial
 from purequant.indicators import INDICATORS
+from purequant.kline import replay
+from purequant.sweep import sweep, save_csv
 from purequant.trade import OKEXFUTURES
 from purequant.position import POSITION
 from purequant.market import MARKET
@@ -59,7 +62,7 @@ class Strategy:
             if self.indicators.CurrentBar(kline=kline) < self.slow_length:  # 如果k线数据不够长就返回
                 return
             # 非回测模式下时间戳就是当前本地时间
-            timestamp = ts_to_datetime_str(utctime_str_to_ts(kline[-1][0])) if kline else get_localtime()
+            timestamp = ts_to_datetime_str(kline.timestamp[-1] / 1000) if kline else get_localtime()
             # 计算策略信号
             ma = self.indicators.MA(self.fast_length, self.slow_length, kline=kline)
             fast_ma = ma[0]
@@ -171,6 +174,17 @@ class Strategy:
         except:
             logger.info()
 
+def backtest(history, instrument_id, time_frame, fast_length, slow_length):
+    """回测一组参数，在进程池的子进程中运行，history为共享内存中的KlineFrame"""
+    strategy = Strategy(instrument_id=instrument_id, time_frame=time_frame,
+                        fast_length=fast_length, slow_length=slow_length,
+                        long_stop=0.95, short_stop=1.05, start_asset=1000)
+    strategy.indicators.preload(history)  # 预计算模式，每个指标只在完整历史数据上计算一次
+    for kline in replay(history):   # 每次传入的k线都是共享内存的只读视图，不复制数据
+        strategy.begin_trade(kline=kline)
+    storage.reset_ledgers()     # 子进程退出时不会自动写入，此处写入此组参数的回测记录，并清除内存中的记录供下一组参数使用
+    return {"总资金": strategy.total_asset, "总盈亏": strategy.total_profit}
+
 if __name__ == "__main__":
 
     config.loads('config.json')
@@ -180,21 +194,17 @@ if __name__ == "__main__":
         fast_length_list = range(5, 20, 2)
         slow_length_list = range(10, 30, 2)
         start_time = get_cur_timestamp()
-        for i in fast_length_list:
-            fast_length = i
-            for j in slow_length_list:
-                slow_length = j
-                print("策略参数为{}和{},正在回测，可能需要一段时间，请稍后...".format(fast_length, slow_length))
-                strategy = Strategy(instrument_id=instrument_id, time_frame=time_frame,
-                                    fast_length=fast_length, slow_length=slow_length,
-                                    long_stop=0.95, short_stop=1.05, start_asset=1000)
-                records = []
-                data = storage.read_purequant_server_datas(instrument_id.split("-")[0].lower() + "_" + time_frame)
-                for k in data:
-                    records.append(k)
-                    strategy.begin_trade(kline=records)
-                cost_time = get_cur_timestamp() - start_time
-                print("回测用时{}秒，结果已保存至mysql数据库！".format(cost_time))
+        # 只读取一次k线数据，优先读取本地历史k线数据，可先运行storage.import_purequant_server_klines下载到本地
+        history = storage.read_history_klines(instrument_id.split("-")[0].lower() + "_" + time_frame)
+        print("正在回测，可能需要一段时间，请稍后...")
+        # 全部参数组合分配到进程池中并行回测，结果表的顺序与参数组合的顺序一致
+        results = sweep(partial(backtest, instrument_id=instrument_id, time_frame=time_frame),
+                        {"fast_length": fast_length_list, "slow_length": slow_length_list}, history)
+        save_csv(results, "multi-parameter_results.csv")
+        for row in results:
+            print("策略参数为{}和{}，总资金：{}，总盈亏：{}".format(row["fast_length"], row["slow_length"], row["总资金"], row["总盈亏"]))
+        cost_time = get_cur_timestamp() - start_time
+        print("回测用时{}秒，结果已保存至mysql数据库与multi-parameter_results.csv！".format(cost_time))
     else:   # 实盘模式
         instrument_id = "LTC-USDT-201225"
         time_frame = "1d"
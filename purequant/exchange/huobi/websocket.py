@@ -190,7 +190,7 @@ async def handle_ws_data(*args, **kwargs):
             if config.mongodb_console == "true":
                 print("callback param", *args, **kwargs)
             dict = {"data":("callback param", *args)}
-            storage.mongodb_save(dict, config.mongodb_database, config.mongodb_collection)
+            storage.mongodb_recorder(config.mongodb_database, config.mongodb_collection).record(dict)
     except:
         pass
 
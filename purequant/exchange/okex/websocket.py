@@ -216,7 +216,7 @@ async def subscribe_without_login(url, channels):
                     if config.mongodb_console == "true":
                         print(timestamp + res)
                     data = {'data':res}
-                    storage.mongodb_save(data, config.mongodb_database, config.mongodb_collection)
+                    storage.mongodb_recorder(config.mongodb_database, config.mongodb_collection).record(data)
 
                     res = eval(res)
                     if 'event' in res:
@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+
+"""
+本地历史k线数据
+
+每个交易对每个周期的k线保存为一个二进制文件，文件头之后依次是时间、开、高、低、收、成交量六列，
+时间为int64毫秒时间戳，其余为float64。读取时用内存映射打开文件，按时间范围切片得到的KlineFrame
+各列都是映射内存的只读视图，不复制数据，只有实际用到的部分才会从磁盘读入内存。
+回测时不再需要连接远程数据库，也不会把多年的1分钟k线转换为Python元组。
+
+写入时先写到临时文件再替换原文件。Linux与macOS下替换后，之前load返回的KlineFrame仍读取替换前的数据；
+Windows下文件被映射时不能替换，写入前需先释放（不再引用）load返回的全部KlineFrame，否则写入时报PermissionError。
+
+导入数据：history_store.import_csv导入csv文件（read_csv读取为KlineFrame），storage.import_mysql_klines导入mysql数据库中的k线数据表。
+"""
+
+import csv
+import os
+import numpy as np
+from purequant import time
+from purequant.config import config
+from purequant.kline import KlineFrame
+
+MAGIC = b"PQKLINE1"
+HEADER_SIZE = 64
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+def concatenate(frames):
+    """按顺序拼接多个KlineFrame"""
+    if len(frames) == 0:
+        return KlineFrame.from_records([])
+    return KlineFrame(*(np.concatenate([getattr(frame, name) for frame in frames]) for name in COLUMNS))
+
+
+class HistoryStore:
+    """本地历史k线数据文件的读写"""
+
+    def __init__(self, path=None):
+        """
+        :param path: 数据文件所在的文件夹，默认使用配置文件中HISTORY的path，未设置时为"history"
+        """
+        self.__path = path
+        self.__maps = {}    # 已映射的文件，{文件路径: (修改时间, np.memmap)}
+
+    def path(self, name=None):
+        """
+        :param name: 数据名称，与数据库中k线数据表的名称一致，如"ltc_1d"；不传入时返回文件夹路径
+        """
+        root = self.__path or getattr(config, "history_path", "history")
+        return root if name is None else os.path.join(root, "{}.kline".format(name))
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def names(self):
+        """返回已保存的全部数据名称"""
+        if not os.path.isdir(self.path()):
+            return []
+        return sorted(file[:-len(".kline")] for file in os.listdir(self.path()) if file.endswith(".kline"))
+
+    def __map(self, name):
+        path = self.path(name)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.__maps.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError("不是PureQuant历史k线数据文件：{}".format(path))
+        self.__maps[path] = (mtime, buffer)
+        return buffer
+
+    def load(self, name, start=None, end=None):
+        """
+        读取历史k线数据
+        :param name: 数据名称，如"ltc_1d"
+        :param start: 开始时间（包含），毫秒时间戳或UTC时间字符串，如"2020-01-01T00:00:00.000Z"
+        :param end: 结束时间（不包含）
+        :return: 按时间先后排列的只读KlineFrame，各列为映射内存的视图
+        """
+        buffer = self.__map(name)
+        length = int(np.frombuffer(buffer, dtype=np.int64, count=1, offset=len(MAGIC))[0])
+        columns = [np.ndarray((length,), dtype=np.int64 if column == "timestamp" else np.float64, buffer=buffer,
+                              offset=HEADER_SIZE + i * length * 8) for i, column in enumerate(COLUMNS)]
+        timestamp = columns[0]
+        first = 0 if start is None else int(np.searchsorted(timestamp, time.kline_time_to_mts(start), side="left"))
+        last = length if end is None else int(np.searchsorted(timestamp, time.kline_time_to_mts(end), side="left"))
+        return KlineFrame(*(column[first:last] for column in columns)).set_readonly()
+
+    def write(self, name, frame, merge=True):
+        """
+        保存k线数据，与已有数据合并时按时间排序，时间相同的k线以新数据为准
+        Windows下调用前需先释放之前load返回的KlineFrame，见模块说明
+        :param name: 数据名称
+        :param frame: KlineFrame或k线数据列表
+        :param merge: 是否与已有数据合并，为False时覆盖已有数据
+        :return: 保存后的k线数量
+        """
+        frame = frame if isinstance(frame, KlineFrame) else KlineFrame.from_records(frame)
+        path = self.path(name)
+        if merge and self.exists(name):
+            frame = concatenate([frame, self.load(name)])   # 拼接时复制数据，不再引用映射内存
+        self.__maps.pop(path, None)     # 替换前释放自己持有的映射，Windows下文件被映射时不能替换
+        timestamp, index = np.unique(frame.timestamp, return_index=True)     # 去重并排序，重复时保留第一次出现的新数据
+        os.makedirs(self.path(), exist_ok=True)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(MAGIC + np.int64(len(timestamp)).tobytes() + b"\0" * (HEADER_SIZE - len(MAGIC) - 8))
+            timestamp.astype(np.int64).tofile(f)
+            for column in COLUMNS[1:]:
+                np.ascontiguousarray(getattr(frame, column)[index], dtype=np.float64).tofile(f)
+        try:
+            os.replace(temporary, path)     # 写入完成后再替换，中途出错不会损坏已有数据
+        except PermissionError:
+            os.remove(temporary)
+            raise PermissionError("无法替换{}，Windows下需先释放load返回的KlineFrame再写入".format(path))
+        return len(timestamp)
+
+    def import_records(self, name, records, merge=True):
+        """导入k线数据列表，每一行为[时间, 开, 高, 低, 收, 成交量, ...]，时间可以是UTC时间字符串或时间戳"""
+        return self.write(name, KlineFrame.from_records(records), merge)
+
+    def import_csv(self, name, file, columns=(0, 1, 2, 3, 4, 5), header=None, batch=100000, merge=True):
+        """
+        导入csv文件，参数见read_csv
+        :param name: 数据名称
+        :return: 保存后的k线数量
+        """
+        return self.write(name, read_csv(file, columns, header, batch), merge)
+
+
+def read_csv(file, columns=(0, 1, 2, 3, 4, 5), header=None, batch=100000):
+    """
+    读取csv文件中的k线数据，分批转换为列数据，不会把整个文件转换为Python列表
+    :param file: csv文件路径
+    :param columns: 时间、开、高、低、收、成交量所在的列号
+    :param header: 是否有表头，默认根据第一行能否转换为数字自动判断
+    :param batch: 每批转换的行数
+    :return: KlineFrame
+    """
+    frames = []
+    with open(file, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        rows = []
+        for i, row in enumerate(reader):
+            if not row:
+                continue
+            if i == 0 and (header or (header is None and not _is_number(row[columns[1]]))):
+                continue
+            rows.append([row[column] for column in columns])
+            if len(rows) >= batch:
+                frames.append(KlineFrame.from_records(rows))
+                rows = []
+        if rows:
+            frames.append(KlineFrame.from_records(rows))
+    return concatenate(frames)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+history_store = HistoryStore()
@@ -1,16 +1,204 @@
-import numpy as np
-import talib
-from purequant import time
+import functools
+from collections import OrderedDict
+from purequant import streaming, vectorized
+from purequant.backends import get_backend
 from purequant.config import config
+from purequant.kline import kline_cache, KlineFrame
+from purequant.time import kline_time_to_mts
+
+
+def _series(method):
+    """标记返回指标序列的方法，回测时由INDICATORS._call_series决定是否使用预计算的结果"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._call_series(method, args, kwargs)
+    return wrapper
+
+
+def _head(result, end):
+    """截取指标结果的前end个值，结果可以是数组、数组列表或数组字典"""
+    if isinstance(result, dict):
+        return {key: value[:end] for key, value in result.items()}
+    if isinstance(result, list):
+        return [value[:end] for value in result]
+    return result[..., :end]
+
+
+def _readonly(result):
+    """返回结果的只读视图，不改变原数组（如VOLUME返回的是k线数据本身的成交量列）"""
+    def freeze(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(result, dict):
+        return {key: freeze(value) for key, value in result.items()}
+    if isinstance(result, list):
+        return [freeze(value) for value in result]
+    return freeze(result)
+
+
+class _MemoCache:
+    """按最近最少使用淘汰的指标结果缓存，分指标统计命中次数"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.__results = OrderedDict()
+        self.__stats = {}
+
+    def get(self, key):
+        """返回缓存的结果，未命中时返回None"""
+        stats = self.__stats.setdefault(key[0], {"hits": 0, "misses": 0})
+        result = self.__results.get(key)
+        if result is None:
+            stats["misses"] += 1
+            return None
+        stats["hits"] += 1
+        self.__results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.__results[key] = result
+        self.__results.move_to_end(key)
+        while len(self.__results) > self.maxsize:
+            self.__results.popitem(last=False)
+
+    def clear(self):
+        self.__results.clear()
+
+    def stats(self):
+        result = {}
+        for name, stats in self.__stats.items():
+            total = stats["hits"] + stats["misses"]
+            result[name] = dict(stats, hit_rate=stats["hits"] / total if total else 0.0)
+        return result
+
+    def reset_stats(self):
+        self.__stats.clear()
+
 
 class INDICATORS:
 
-    def __init__(self, platform, instrument_id, time_frame):
+    def __init__(self, platform, instrument_id, time_frame, incremental=False, memoize=False, memo_size=256,
+                 backend=None):
+        """
+        :param platform: 交易所
+        :param instrument_id: 交易对或合约ID
+        :param time_frame: k线周期
+        :param incremental: 增量模式，MA、EMA、ATR、RSI、BOLL、STDDEV、OBV保存滚动状态，
+                            每根新k线或最新k线的价格变动只需O(1)的计算量，返回值为只读数组
+        :param memoize: 缓存指标结果，最新一根k线的时间与收盘价均未变化时，相同参数的指标直接返回上一次的结果（只读数组）
+        :param memo_size: 缓存的最大结果数量，超出后淘汰最近最少使用的结果
+        :param backend: 指标计算后端，"talib"、"numpy"或"auto"，不传入时使用配置文件中的设置
+        """
         self.__platform = platform
         self.__instrument_id = instrument_id
         self.__time_frame = time_frame
         self.__last_time_stamp = 0
+        self.__incremental = incremental
+        self.__streams = {}
+        self.__history = None
+        self.__precomputed = {}
+        self.__memo = _MemoCache(memo_size) if memoize else None
+        self.__backend = get_backend(backend)
+
+    def memo_stats(self):
+        """
+        返回各指标的缓存命中情况
+        :return: 字典，{"MA": {"hits": 命中次数, "misses": 未命中次数, "hit_rate": 命中率}, ...}，未开启缓存时返回空字典
+        """
+        return self.__memo.stats() if self.__memo is not None else {}
 
+    def clear_memo(self):
+        """清空指标结果缓存与命中统计"""
+        if self.__memo is not None:
+            self.__memo.clear()
+            self.__memo.reset_stats()
+
+    def preload(self, history):
+        """
+        回测预计算模式：传入完整的历史k线数据，之后每个指标按参数只在完整历史上计算一次，
+        回测时传入的k线数据是历史数据的前i根时，直接返回预计算结果的前i个值，不会用到未来数据
+        :param history: 完整的历史k线数据列表（按时间先后排列）或KlineFrame，
+                        参数优化时多个策略传入同一个KlineFrame，相同参数的指标只计算一次
+        :return:
+        """
+        self.__history = history if isinstance(history, KlineFrame) else KlineFrame.from_records(history)
+        self.__precomputed = self.__history.series    # 多个INDICATORS预加载同一个KlineFrame时共享计算结果
+
+    def __history_end(self, kline):
+        """kline是预加载历史数据的前若干根k线时返回其长度，否则返回None"""
+        if self.__history is None or kline is None or config.backtest != "enabled":
+            return None
+        end = len(kline)
+        if end == 0 or end > len(self.__history):
+            return None
+        if isinstance(kline, KlineFrame):
+            last_timestamp = kline.timestamp[-1]
+        else:
+            last_timestamp = kline_time_to_mts(kline[-1][0])
+        if last_timestamp != self.__history.timestamp[end - 1]:
+            return None
+        return end
+
+    def __last_bar(self, kline):
+        """返回最新一根k线的(毫秒时间戳, 收盘价)，没有k线时返回None"""
+        if kline is None and config.backtest != "enabled":
+            kline = kline_cache.get_frame(self.__platform, self.__instrument_id, self.__time_frame)
+        if kline is None or len(kline) == 0:
+            return None
+        if isinstance(kline, KlineFrame):
+            return int(kline.timestamp[-1]), float(kline.close[-1])
+        return kline_time_to_mts(kline[-1][0]), float(kline[-1][4])
+
+    def _call_series(self, method, args, kwargs):
+        """
+        指标序列的统一入口，预计算模式下返回完整历史上计算结果的前若干个值，
+        开启缓存时最新一根k线未变化则返回上一次的计算结果
+        """
+        kline = kwargs.get("kline")
+        params = {key: value for key, value in kwargs.items() if key != "kline"}
+        args = tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+        key = (method.__name__, args, tuple(sorted(params.items())), self.__backend.name)    # 共享的预计算结果按后端区分
+        end = self.__history_end(kline)
+        if end is None:
+            if self.__memo is None:
+                return method(self, *args, **kwargs)
+            last_bar = self.__last_bar(kline)
+            if last_bar is None:
+                return method(self, *args, **kwargs)
+            memo_key = key + (self.__instrument_id, self.__time_frame) + last_bar
+            result = self.__memo.get(memo_key)
+            if result is None:
+                result = _readonly(method(self, *args, **kwargs))
+                self.__memo.put(memo_key, result)
+            return result
+        if key not in self.__precomputed:
+            self.__precomputed[key] = _readonly(method(self, *args, kline=self.__history, **params))
+        return _head(self.__precomputed[key], end)
+
+    def __frame(self, kline=None):
+        """
+        获取KlineFrame格式的k线数据
+        :param kline: 回测时传入指定k线数据，可以是k线数据列表或KlineFrame
+        :return: 按时间先后排列的KlineFrame
+        """
+        if isinstance(kline, KlineFrame):
+            return kline
+        if config.backtest == "enabled":    # 如果是回测模式传入了指定的k线数据
+            return KlineFrame.from_records(kline)
+        return kline_cache.get_frame(self.__platform, self.__instrument_id, self.__time_frame)    # 实盘模式下从交易所获取k线数据
+
+    def __stream(self, frame, indicator, *params):
+        """增量模式下按指标与参数保存各自的滚动状态，输入新的k线后返回与frame等长的结果"""
+        key = (indicator.__name__,) + params
+        stream = self.__streams.get(key)
+        if stream is None or (stream.last_timestamp is not None and len(frame)
+                              and frame.timestamp[-1] < stream.last_timestamp):
+            # 传入的k线早于已输入的k线（如预计算完整历史后又传入历史数据的前若干根），重新开始计算
+            stream = self.__streams[key] = indicator(*params)
+        return stream.feed(frame)
+
+    @_series
     def ATR(self,length, kline=None):
         """
         指数移动平均线
@@ -18,25 +206,15 @@ class INDICATORS:
         :param kline:回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":    # 如果是回测模式传入了指定的k线数据
-            records = kline
-        else:   # 实盘模式下从交易所获取k线数据
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()   # 将k线数据倒序排列
-        kline_length = len(records)     # 计算k线数据的长度
-        high_array = np.zeros(kline_length)     # 创建为零的数组
-        low_array = np.zeros(kline_length)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            high_array[t] = item[2]
-            low_array[t] = item[3]
-            close_array[t] = item[4]
-            t += 1
-        result = talib.ATR(high_array, low_array, close_array, timeperiod=length)
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = self.__stream(frame, streaming.ATR, length)
+        else:
+            result = self.__backend.ATR(frame.high, frame.low, frame.close, timeperiod=length)
         return result
 
 
+    @_series
     def BOLL(self, length, kline=None):
         """
         布林指标
@@ -44,18 +222,11 @@ class INDICATORS:
         :param kline:回测时传入指定k线数据
         :return: 返回一个字典 {"upperband": 上轨数组， "middleband": 中轨数组， "lowerband": 下轨数组}
         """
-        if config.backtest == "enabled":    # 如果是回测模式传入了指定的k线数据
-            records = kline
-        else:  # 实盘模式下从交易所获取k线数据
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.BBANDS(close_array, timeperiod=length, nbdevup=2, nbdevdn=2, matype=0))
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = self.__stream(frame, streaming.BBANDS, length, 2, 2)
+        else:
+            result = self.__backend.BBANDS(frame.close, timeperiod=length, nbdevup=2, nbdevdn=2)
         upperband = result[0]
         middleband = result[1]
         lowerband = result[2]
@@ -68,12 +239,10 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: k线更新，返回True；否则返回False
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-        kline_length = len(records)
-        current_timestamp = time.utctime_str_to_ts(records[kline_length - 1][0])
+        if config.backtest == "enabled" and not isinstance(kline, KlineFrame):
+            kline = kline[-1:]  # 只需转换最后一根k线
+        frame = self.__frame(kline)
+        current_timestamp = frame.timestamp[-1]
         if current_timestamp != self.__last_time_stamp:  # 如果当前时间戳不等于lastTime，说明k线更新
             if current_timestamp < self.__last_time_stamp:
                 return
@@ -89,13 +258,13 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: 返回一个整型数字
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-        kline_length = len(records)
+        if config.backtest == "enabled" and not isinstance(kline, KlineFrame):
+            return len(kline)
+        frame = self.__frame(kline)
+        kline_length = len(frame)
         return kline_length
 
+    @_series
     def HIGHEST(self, length, kline=None):
         """
         周期最高价
@@ -103,20 +272,11 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        high_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            high_array[t] = item[2]
-            t += 1
-        result = (talib.MAX(high_array, length))
+        frame = self.__frame(kline)
+        result = self.__backend.MAX(frame.high, length)
         return result
 
+    @_series
     def MA(self, length, *args, kline=None):
         """
         移动平均线(简单移动平均)
@@ -125,25 +285,41 @@ class INDICATORS:
         :param kline:回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":    # 如果是回测模式传入了指定的k线数据
-            records = kline
-        else:   # 实盘模式下从交易所获取k线数据
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = [self.__stream(frame, streaming.SMA, x) for x in (length,) + args]
+            return result[0] if len(args) < 1 else result
         if len(args) < 1:  # 如果无别的参数
-            result = talib.SMA(close_array, length)
-        else:   # 如果传入多个参数
-            result = [talib.SMA(close_array, length)]
-            for x in args:
-                result.append(talib.SMA(close_array, x))
+            result = self.__backend.SMA(frame.close, length)
+        else:   # 如果传入多个参数，逐个长度计算，预计算模式下每个长度只计算一次
+            result = [self.MA(x, kline=kline) for x in (length,) + args]
         return result
 
+    @_series
+    def MATRIX(self, indicator, lengths, kline=None):
+        """
+        一次计算多个长度参数的指标，适用于参数优化
+        :param indicator: 指标名称，"SMA"、"EMA"、"HIGHEST"、"LOWEST"或"STDDEV"
+        :param lengths: 长度参数列表，如range(5, 20, 2)
+        :param kline: 回测时传入指定k线数据
+        :return: 返回一个二维数组，形状为(长度参数个数, k线数量)，第i行是第i个长度参数的指标值
+        """
+        if indicator not in ("SMA", "EMA", "HIGHEST", "LOWEST", "STDDEV"):
+            raise ValueError("指标名称错误，只支持【SMA EMA HIGHEST LOWEST STDDEV】!")
+        frame = self.__frame(kline)
+        if indicator == "SMA":
+            result = vectorized.sma_matrix(frame.close, lengths)
+        elif indicator == "EMA":
+            result = vectorized.ema_matrix(frame.close, lengths)
+        elif indicator == "HIGHEST":
+            result = vectorized.highest_matrix(frame.high, lengths)
+        elif indicator == "LOWEST":
+            result = vectorized.lowest_matrix(frame.low, lengths)
+        else:
+            result = vectorized.stddev_matrix(frame.close, lengths)
+        return result
+
+    @_series
     def MACD(self, fastperiod, slowperiod, signalperiod, kline=None):
         """
         计算MACD
@@ -153,24 +329,15 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: 返回一个字典 {'DIF': DIF数组, 'DEA': DEA数组, 'MACD': MACD数组}
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.MACD(close_array, fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod))
+        frame = self.__frame(kline)
+        result = self.__backend.MACD(frame.close, fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod)
         DIF = result[0]
         DEA = result[1]
         MACD = result[2] * 2
         dict = {'DIF': DIF, 'DEA': DEA, 'MACD': MACD}
         return dict
 
+    @_series
     def EMA(self, length, *args, kline=None):
         """
         指数移动平均线
@@ -179,25 +346,17 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: 返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = [self.__stream(frame, streaming.EMA, x) for x in (length,) + args]
+            return result[0] if len(args) < 1 else result
         if len(args) < 1:  # 如果无别的参数
-            result = talib.EMA(close_array, length)
+            result = self.__backend.EMA(frame.close, length)
         else:
-            result = [talib.EMA(close_array, length)]
-            for x in args:
-                result.append(talib.EMA(close_array, x))
+            result = [self.EMA(x, kline=kline) for x in (length,) + args]
         return result
 
+    @_series
     def KAMA(self, length, *args, kline=None):
         """
         适应性移动平均线
@@ -206,25 +365,16 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: 返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
+        frame = self.__frame(kline)
         if len(args) < 1:  # 如果无别的参数
-            result = talib.KAMA(close_array, length)
+            result = self.__backend.KAMA(frame.close, length)
         else:
-            result = [talib.KAMA(close_array, length)]
+            result = [self.__backend.KAMA(frame.close, length)]
             for x in args:
-                result.append(talib.KAMA(close_array, x))
+                result.append(self.__backend.KAMA(frame.close, x))
         return result
 
+    @_series
     def KDJ(self, fastk_period, slowk_period, slowd_period, kline=None):
         """
         计算k值和d值
@@ -234,31 +384,16 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: 返回一个字典，{'k': k值数组， 'd': d值数组}
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        high_array = np.zeros(kline_length)
-        low_array = np.zeros(kline_length)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            high_array[t1] = item[2]
-            low_array[t2] = item[3]
-            close_array[t3] = item[4]
-            t += 1
-        result = (talib.STOCH(high_array, low_array, close_array, fastk_period=fastk_period,
-                                                                slowk_period=slowk_period,
-                                                                slowk_matype=0,
-                                                                slowd_period=slowd_period,
-                                                                slowd_matype=0))
+        frame = self.__frame(kline)
+        result = self.__backend.STOCH(frame.high, frame.low, frame.close, fastk_period=fastk_period,
+                                                                    slowk_period=slowk_period,
+                                                                    slowd_period=slowd_period)
         slowk = result[0]
         slowd = result[1]
         dict = {'k': slowk, 'd': slowd}
         return dict
 
+    @_series
     def LOWEST(self, length, kline=None):
         """
         周期最低价
@@ -266,40 +401,25 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return: 返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        low_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            low_array[t] = item[3]
-            t += 1
-        result = (talib.MIN(low_array, length))
+        frame = self.__frame(kline)
+        result = self.__backend.MIN(frame.low, length)
         return result
 
+    @_series
     def OBV(self, kline=None):
         """
         OBV
         :param kline: 回测时传入指定k线数据
         :return: 返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = self.__stream(frame, streaming.OBV)
         else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.OBV(close_array, self.VOLUME()))
+            result = self.__backend.OBV(frame.close, frame.volume)
         return result
 
+    @_series
     def RSI(self, length, kline=None):
         """
         RSI
@@ -307,20 +427,14 @@ class INDICATORS:
         :param kline: 回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = self.__stream(frame, streaming.RSI, length)
         else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.RSI(close_array, timeperiod=length))
+            result = self.__backend.RSI(frame.close, timeperiod=length)
         return result
 
+    @_series
     def ROC(self, length, kline=None):
         """
         变动率指标
@@ -328,20 +442,11 @@ class INDICATORS:
         :param kline:回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.ROC(close_array, timeperiod=length))
+        frame = self.__frame(kline)
+        result = self.__backend.ROC(frame.close, timeperiod=length)
         return result
 
+    @_series
     def STOCHRSI(self, timeperiod, fastk_period, fastd_period, kline=None):
         """
         计算STOCHRSI
@@ -351,45 +456,25 @@ class INDICATORS:
         :param kline:回测时传入指定k线数据
         :return: 返回一个字典  {'STOCHRSI': STOCHRSI数组, 'fastk': fastk数组}
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.STOCHRSI(close_array, timeperiod=timeperiod, fastk_period=fastk_period, fastd_period=fastd_period, fastd_matype=0))
+        frame = self.__frame(kline)
+        result = self.__backend.STOCHRSI(frame.close, timeperiod=timeperiod, fastk_period=fastk_period, fastd_period=fastd_period)
         STOCHRSI = result[1]
-        fastk = talib.MA(STOCHRSI, 3)
+        fastk = self.__backend.SMA(STOCHRSI, 3)
         dict = {'stochrsi': STOCHRSI, 'fastk': fastk}
         return dict
 
+    @_series
     def SAR(self, kline=None):
         """
         抛物线指标
         :param kline:回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        high_array = np.zeros(kline_length)
-        low_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            high_array[t1] = item[2]
-            low_array[t2] = item[3]
-            t += 1
-        result = (talib.SAR(high_array, low_array, acceleration=0.02, maximum=0.2))
+        frame = self.__frame(kline)
+        result = self.__backend.SAR(frame.high, frame.low, acceleration=0.02, maximum=0.2)
         return result
 
+    @_series
     def STDDEV(self, length, nbdev=None, kline=None):
         """
         求标准差
@@ -399,21 +484,15 @@ class INDICATORS:
         :return:返回一个一维数组
         """
         nbdev=1 or nbdev
-        if config.backtest == "enabled":
-            records = kline
+        frame = self.__frame(kline)
+        if self.__incremental:
+            result = self.__stream(frame, streaming.STDDEV, length, 1)
         else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.STDDEV(close_array, timeperiod=length, nbdev=1))
+            result = self.__backend.STDDEV(frame.close, timeperiod=length, nbdev=1)
         return result
 
 
+    @_series
     def TRIX(self, length, kline=None):
         """
         三重指数平滑平均线
@@ -421,38 +500,19 @@ class INDICATORS:
         :param kline:回测时传入指定k线数据
         :return:返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-        kline_length = len(records)
-        close_array = np.zeros(kline_length)
-        t = 0
-        for item in records:
-            close_array[t] = item[4]
-            t += 1
-        result = (talib.TRIX(close_array, timeperiod=length))
+        frame = self.__frame(kline)
+        result = self.__backend.TRIX(frame.close, timeperiod=length)
         return result
 
+    @_series
     def VOLUME(self, kline=None):
         """
         成交量
         :param kline: 回测时传入指定k线数据
         :return: 返回一个一维数组
         """
-        if config.backtest == "enabled":
-            records = kline
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-        length = len(records)
-        records.reverse()
-        t = 0
-        volume_array = np.zeros(length)
-        for item in records:
-            volume_array[t] = item[5]
-            t += 1
-        return volume_array
+        frame = self.__frame(kline)
+        return frame.volume
 
 
 
@@ -0,0 +1,297 @@
+# -*- coding:utf-8 -*-
+
+"""
+k线数据容器与k线数据快照
+
+KlineFrame以列的形式保存k线数据，开高低收与成交量均为连续的float64数组，时间为int64的毫秒时间戳。
+实盘模式下INDICATORS、MARKET与POSITION共享同一份k线快照，
+同一交易对同一周期的k线在一根k线内或缓存有效期内只向交易所请求一次。
+KlineFrame.resample与Resampler由一个基础周期（如1m）的k线合成任意更大的周期，包括交易所不提供的周期（如火币的2h、3h）。
+"""
+
+import time as _time
+import numpy as np
+from purequant import time
+from purequant.config import config
+
+
+WEEK_OFFSET = 4 * 86400    # 1970-01-01是星期四，周线以星期一为起点
+
+
+def bucket_start(timestamp, time_frame, offset=0):
+    """
+    计算每根k线所属的大周期k线的起始时间
+    :param timestamp: int64毫秒时间戳数组
+    :param time_frame: 大周期，如"3h"
+    :param offset: 周期起点相对UTC零点的偏移秒数，如日线以北京时间零点为起点时传入-28800
+    :return: int64毫秒时间戳数组
+    """
+    seconds = time.time_frame_to_seconds(time_frame)
+    if seconds is None:
+        raise ValueError("k线周期错误：{}".format(time_frame))
+    if time_frame[-1].lower() == "w":
+        offset += WEEK_OFFSET
+    period = seconds * 1000
+    offset = offset * 1000 % period
+    timestamp = np.asarray(timestamp, dtype=np.int64)
+    return (timestamp - offset) // period * period + offset
+
+
+class KlineFrame:
+    """
+    列式k线数据，按时间先后排列，最后一个元素是最新的一根k线
+    timestamp: int64毫秒时间戳数组
+    open, high, low, close, volume: float64数组
+    """
+
+    def __init__(self, timestamp, open, high, low, close, volume):
+        self.timestamp = np.ascontiguousarray(timestamp, dtype=np.int64)
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.volume = np.ascontiguousarray(volume, dtype=np.float64)
+        self.series = {}    # 在这份k线数据上预计算的指标序列，供INDICATORS.preload使用
+
+    @classmethod
+    def from_records(cls, records, reverse=False):
+        """
+        由交易所或数据库返回的k线数据列表创建KlineFrame，每一行为[时间, 开, 高, 低, 收, 成交量, ...]
+        :param records: k线数据列表，数值可以是字符串
+        :param reverse: 最新的k线在前时（如platform.get_kline的返回值）传入True
+        :return: KlineFrame
+        """
+        rows = records[::-1] if reverse else records
+        if len(rows) == 0:
+            values = np.zeros((0, 5))
+        else:
+            values = np.array([row[1:6] for row in rows], dtype=np.float64)
+        return cls(time.utctime_str_column_to_mts([row[0] for row in rows]),
+                   values[:, 0], values[:, 1], values[:, 2], values[:, 3], values[:, 4])
+
+    def __len__(self):
+        return len(self.close)
+
+    def __getitem__(self, item):
+        """切片返回新的KlineFrame，其中各列均为原数组的视图"""
+        if not isinstance(item, slice):
+            raise TypeError("KlineFrame只支持切片操作，获取单根k线请使用各列数组，如frame.close[-1]")
+        return KlineFrame(self.timestamp[item], self.open[item], self.high[item], self.low[item],
+                          self.close[item], self.volume[item])
+
+    def window(self, end, start=0):
+        """
+        返回第start到第end-1根k线组成的KlineFrame，与切片相同但省去了对各列的检查，用于逐根k线回放
+        各列均为原数组的视图，原数组只读时视图也是只读的
+        """
+        frame = KlineFrame.__new__(KlineFrame)
+        frame.timestamp = self.timestamp[start:end]
+        frame.open = self.open[start:end]
+        frame.high = self.high[start:end]
+        frame.low = self.low[start:end]
+        frame.close = self.close[start:end]
+        frame.volume = self.volume[start:end]
+        frame.series = {}
+        return frame
+
+    def resample(self, time_frame, offset=0):
+        """
+        合成大周期k线，开盘价取第一根、收盘价取最后一根、最高最低价取极值、成交量求和
+        数据开头与末尾的大周期k线可能是不完整的
+        :param time_frame: 大周期，如"2h"、"3h"、"1d"
+        :param offset: 周期起点相对UTC零点的偏移秒数
+        :return: KlineFrame，时间为大周期k线的起始时间
+        """
+        if len(self) == 0:
+            return KlineFrame(self.timestamp, self.open, self.high, self.low, self.close, self.volume)
+        buckets = bucket_start(self.timestamp, time_frame, offset)
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        ends = np.concatenate((starts[1:], [len(self)])) - 1
+        return KlineFrame(buckets[starts], self.open[starts], np.maximum.reduceat(self.high, starts),
+                          np.minimum.reduceat(self.low, starts), self.close[ends], np.add.reduceat(self.volume, starts))
+
+    def set_readonly(self):
+        """将各列设为只读，用于多个模块共享同一份数据时防止被意外修改"""
+        for array in (self.timestamp, self.open, self.high, self.low, self.close, self.volume):
+            array.flags.writeable = False
+        return self
+
+
+def replay(history, start=1):
+    """
+    逐根k线回放历史数据，用于事件驱动回测，如：
+        for kline in replay(history):
+            strategy.begin_trade(kline=kline)
+    每次返回以当前k线结尾的只读KlineFrame，各列均为history的视图，不复制数据，也不再逐根k线构建列表，
+    INDICATORS与MARKET直接从中读取数据
+    :param history: 按时间先后排列的KlineFrame（如history_store.load的返回值）或k线数据列表
+    :param start: 第一次返回的k线数量，如指标需要的最少k线数量
+    """
+    history = history if isinstance(history, KlineFrame) else KlineFrame.from_records(history)
+    history = history.window(len(history)).set_readonly()   # 只读视图，不改变传入的history
+    for end in range(max(start, 1), len(history) + 1):
+        yield history.window(end)
+
+
+class Resampler:
+    """
+    增量合成大周期k线
+    每次输入基础周期的k线（可以与上一次输入重叠，最后一根可以是尚未收盘的k线），
+    只处理新增的k线，已完成的大周期k线不再重复计算
+    """
+
+    def __init__(self, time_frame, offset=0):
+        """
+        :param time_frame: 大周期，如"3h"
+        :param offset: 周期起点相对UTC零点的偏移秒数
+        """
+        self.time_frame = time_frame
+        self.offset = offset
+        self.__columns = np.zeros((6, 256))   # 已完成的大周期k线，依次为时间、开、高、低、收、成交量
+        self.__length = 0
+        self.__pending = None   # 当前大周期内的基础周期k线
+
+    def __extend(self, frame):
+        if self.__length + len(frame) > self.__columns.shape[1]:
+            columns = np.zeros((6, max(self.__columns.shape[1] * 2, self.__length + len(frame))))
+            columns[:, :self.__length] = self.__columns[:, :self.__length]
+            self.__columns = columns
+        end = self.__length + len(frame)
+        for row, column in enumerate((frame.timestamp, frame.open, frame.high, frame.low, frame.close, frame.volume)):
+            self.__columns[row, self.__length:end] = column
+        self.__length = end
+
+    def update(self, frame):
+        """
+        输入基础周期的k线
+        :param frame: 按时间先后排列的KlineFrame
+        :return: 目前为止合成的全部大周期k线（KlineFrame），最后一根是尚未完成的大周期k线
+        """
+        pending = self.__pending
+        if pending is not None and len(pending):
+            start = int(np.searchsorted(frame.timestamp, pending.timestamp[-1], side="left"))
+            frame = frame[start:]
+            if len(frame) and frame.timestamp[0] == pending.timestamp[-1]:    # 最后一根基础k线的价格更新
+                pending = pending[:-1]
+            frame = _concatenate(pending, frame)
+        if len(frame):
+            buckets = bucket_start(frame.timestamp, self.time_frame, self.offset)
+            last = int(np.searchsorted(buckets, buckets[-1], side="left"))
+            self.__extend(frame[:last].resample(self.time_frame, self.offset))
+            self.__pending = frame[last:]
+        return self.frame()
+
+    def frame(self):
+        """返回目前为止合成的全部大周期k线"""
+        completed = KlineFrame(self.__columns[0, :self.__length].astype(np.int64), *self.__columns[1:, :self.__length])
+        if self.__pending is None or len(self.__pending) == 0:
+            return completed
+        return _concatenate(completed, self.__pending.resample(self.time_frame, self.offset))
+
+
+def _concatenate(first, second):
+    """按时间先后拼接两个KlineFrame"""
+    return KlineFrame(*(np.concatenate((getattr(first, name), getattr(second, name)))
+                        for name in ("timestamp", "open", "high", "low", "close", "volume")))
+
+
+class __KlineCache:
+    """按交易所、交易对与k线周期缓存get_kline的返回结果"""
+
+    def __init__(self):
+        self.__snapshots = {}
+        self.hits = 0     # 命中缓存的次数
+        self.misses = 0   # 向交易所请求k线的次数
+
+    def __key(self, platform, instrument_id, time_frame):
+        return (type(platform).__name__, instrument_id, time_frame)
+
+    def __ttl(self):
+        """缓存有效期（秒），0为不缓存，None为仅在新k线出现时刷新"""
+        return getattr(config, "kline_cache_ttl", 1)
+
+    def __expired(self, snapshot, time_frame, now):
+        ttl = self.__ttl()
+        if ttl is not None and now - snapshot["fetched_at"] >= ttl:
+            return True
+        bar_seconds = time.time_frame_to_seconds(time_frame)
+        if bar_seconds is not None and int(now // bar_seconds) != snapshot["bar_index"]:  # 已进入新的一根k线
+            return True
+        return False
+
+    def __snapshot(self, platform, instrument_id, time_frame):
+        key = self.__key(platform, instrument_id, time_frame)
+        now = _time.time()
+        snapshot = self.__snapshots.get(key)
+        if snapshot is not None and not self.__expired(snapshot, time_frame, now):
+            self.hits += 1
+            return snapshot
+        self.misses += 1
+        bar_seconds = time.time_frame_to_seconds(time_frame)
+        snapshot = {
+            "records": platform.get_kline(time_frame),
+            "frame": None,
+            "fetched_at": now,
+            "bar_index": int(now // bar_seconds) if bar_seconds is not None else None
+        }
+        self.__snapshots[key] = snapshot
+        return snapshot
+
+    def get_kline(self, platform, instrument_id, time_frame):
+        """
+        获取k线数据，返回值与platform.get_kline(time_frame)相同（最新的k线在前）
+        :param platform: 交易所
+        :param instrument_id: 交易对或合约ID
+        :param time_frame: k线周期
+        :return: 返回快照的浅拷贝，调用方可以放心地对其进行reverse等原地操作
+        """
+        return list(self.__snapshot(platform, instrument_id, time_frame)["records"])
+
+    def get_frame(self, platform, instrument_id, time_frame):
+        """
+        获取KlineFrame格式的k线数据，每次向交易所请求后只转换一次
+        :return: 按时间先后排列的只读KlineFrame
+        """
+        base = getattr(config, "kline_base_time_frame", None)
+        if base is not None and base != time_frame:    # 由基础周期的k线合成，不再单独请求该周期的k线
+            return self.get_resampled_frame(platform, instrument_id, base, time_frame)
+        snapshot = self.__snapshot(platform, instrument_id, time_frame)
+        if snapshot["frame"] is None:
+            snapshot["frame"] = KlineFrame.from_records(snapshot["records"], reverse=True).set_readonly()
+        return snapshot["frame"]
+
+    def get_resampled_frame(self, platform, instrument_id, base_time_frame, time_frame):
+        """
+        由基础周期的k线快照合成大周期k线，多个周期共用同一份基础周期的快照，每次向交易所请求后每个周期只合成一次
+        :param base_time_frame: 基础周期，如"1m"，合成后的k线数量受基础周期k线数量的限制
+        :param time_frame: 大周期，如"3h"
+        :return: 按时间先后排列的只读KlineFrame
+        """
+        snapshot = self.__snapshot(platform, instrument_id, base_time_frame)
+        if snapshot["frame"] is None:
+            snapshot["frame"] = KlineFrame.from_records(snapshot["records"], reverse=True).set_readonly()
+        resampled = snapshot.setdefault("resampled", {})
+        if time_frame not in resampled:
+            offset = getattr(config, "kline_resample_offset", 0)
+            resampled[time_frame] = snapshot["frame"].resample(time_frame, offset).set_readonly()
+        return resampled[time_frame]
+
+    def invalidate(self, platform=None, instrument_id=None, time_frame=None):
+        """使快照失效，不传参数时清空全部快照"""
+        if platform is None:
+            self.__snapshots.clear()
+        else:
+            self.__snapshots.pop(self.__key(platform, instrument_id, time_frame), None)
+
+    def stats(self):
+        """返回一个字典，{"hits": 命中次数, "misses": 请求次数, "hit_rate": 命中率}"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate}
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+kline_cache = __KlineCache()
@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测交易记录
+
+回测时策略运行信息（成交记录与资金曲线）先保存在内存中，数值列为按需扩容的float64数组，
+回测结束时（或每累计一定行数时）再一次性批量写入MySQL、SQLite或Parquet文件，
+避免每次模拟成交都连接一次数据库。
+"""
+
+import operator
+import numpy as np
+
+# 与storage.mysql_save_strategy_run_info保存的数据表字段一致
+RUN_INFO_FIELDS = ("时间", "类型", "价格", "数量", "成交金额", "当前持仓价格", "当前持仓方向", "当前持仓数量", "此次盈亏", "总盈亏", "总资金")
+TEXT_FIELDS = ("时间", "类型", "当前持仓方向")
+NUMBER_FIELDS = tuple(field for field in RUN_INFO_FIELDS if field not in TEXT_FIELDS)
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+             "=": operator.eq, "==": operator.eq, "!=": operator.ne, "<>": operator.ne}
+
+
+class Ledger:
+    """一张策略运行信息数据表在内存中的数据"""
+
+    def __init__(self, capacity=1024):
+        self.__texts = {field: [] for field in TEXT_FIELDS}
+        self.__numbers = np.zeros((len(NUMBER_FIELDS), capacity))
+        self.__length = 0
+        self.flushed = 0    # 已写入数据库的行数
+
+    def __len__(self):
+        return self.__length
+
+    def append(self, row):
+        """
+        添加一行数据
+        :param row: 按RUN_INFO_FIELDS顺序排列的一行数据
+        """
+        if self.__length == self.__numbers.shape[1]:
+            numbers = np.zeros((len(NUMBER_FIELDS), self.__length * 2))
+            numbers[:, :self.__length] = self.__numbers
+            self.__numbers = numbers
+        values = dict(zip(RUN_INFO_FIELDS, row))
+        for field in TEXT_FIELDS:
+            self.__texts[field].append(values[field])
+        self.__numbers[:, self.__length] = [values[field] for field in NUMBER_FIELDS]
+        self.__length += 1
+
+    def column(self, field):
+        """返回一列数据，数值列为只读的float64数组，文本列为列表"""
+        if field in self.__texts:
+            return self.__texts[field]
+        view = self.__numbers[NUMBER_FIELDS.index(field), :self.__length]
+        view.flags.writeable = False
+        return view
+
+    def last(self):
+        """返回最后一行数据，没有数据时返回None"""
+        if self.__length == 0:
+            return None
+        return self.row(self.__length - 1)
+
+    def row(self, index):
+        numbers = self.__numbers[:, index]
+        values = {field: float(numbers[i]) for i, field in enumerate(NUMBER_FIELDS)}
+        values.update({field: self.__texts[field][index] for field in TEXT_FIELDS})
+        return tuple(values[field] for field in RUN_INFO_FIELDS)
+
+    def rows(self, start=0):
+        """返回从start开始的全部行，每行为一个元组，与从MySQL数据库中读取的数据格式一致"""
+        numbers = self.__numbers[:, start:self.__length].T.tolist()
+        texts = [self.__texts[field][start:] for field in TEXT_FIELDS]
+        result = []
+        for i, row in enumerate(numbers):
+            values = dict(zip(NUMBER_FIELDS, row))
+            values.update({field: texts[j][i] for j, field in enumerate(TEXT_FIELDS)})
+            result.append(tuple(values[field] for field in RUN_INFO_FIELDS))
+        return result
+
+    def pending(self):
+        """尚未写入数据库的行"""
+        return self.rows(self.flushed)
+
+    def select(self, data, field, operator, start=0):
+        """
+        按条件筛选数据，与storage.read_mysql_datas的查询条件一致
+        :param data: 要比较的值
+        :param field: 字段
+        :param operator: 比较运算符，如">"
+        :param start: 从第几行开始筛选
+        :return: 满足条件的行组成的列表
+        """
+        compare = OPERATORS[operator.strip()]
+        if field in self.__texts:
+            column = self.__texts[field]
+            return [self.row(i) for i in range(start, self.__length) if compare(column[i], str(data))]
+        mask = compare(self.column(field)[start:], float(data))
+        return [self.row(start + i) for i in np.flatnonzero(mask)]
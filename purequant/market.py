@@ -9,6 +9,7 @@ email: interstella.ranger2020@gmail.com
 """
 
 from purequant.config import config
+from purequant.kline import kline_cache, KlineFrame
 
 class MARKET:
 
@@ -17,6 +18,15 @@ class MARKET:
         self.__instrument_id = instrument_id
         self.__time_frame = time_frame
 
+    def __price(self, column, index, param, kline=None):
+        """按列取出k线上的价格，column为KlineFrame中的列名，index为k线数据列表中的位置"""
+        if isinstance(kline, KlineFrame):
+            return float(getattr(kline, column)[param])
+        if config.backtest == "enabled":    # 回测模式
+            return float(kline[param][index])
+        frame = kline_cache.get_frame(self.__platform, self.__instrument_id, self.__time_frame)   # 实盘模式
+        return float(getattr(frame, column)[param])
+
     def last(self):
         """获取交易对的最新成交价"""
         result = float(self.__platform.get_ticker()['last'])
@@ -29,13 +39,7 @@ class MARKET:
         :param kline: 回测时传入指定k线数据
         :return:
         """
-        if config.backtest == "enabled":    # 回测模式
-            return float(kline[param][1])
-        else:   # 实盘模式
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-            result = float((records)[param][1])
-            return result
+        return self.__price("open", 1, param, kline)
 
     def high(self, param, kline=None):
         """
@@ -44,13 +48,7 @@ class MARKET:
         :param kline: 回测时传入指定k线数据
         :return:
         """
-        if config.backtest == "enabled":
-            return float(kline[param][2])
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-            result = float((records)[param][2])
-            return result
+        return self.__price("high", 2, param, kline)
 
     def low(self, param, kline=None):
         """
@@ -59,13 +57,7 @@ class MARKET:
         :param kline: 回测时传入指定k线数据
         :return:
         """
-        if config.backtest == "enabled":
-            return float(kline[param][3])
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-            result = float((records)[param][3])
-            return result
+        return self.__price("low", 3, param, kline)
 
     def close(self, param, kline=None):
         """
@@ -74,13 +66,7 @@ class MARKET:
         :param kline: 回测时传入指定k线数据
         :return:
         """
-        if config.backtest == "enabled":
-            return float(kline[param][4])
-        else:
-            records = self.__platform.get_kline(self.__time_frame)
-            records.reverse()
-            result = float((records)[param][4])
-            return result
+        return self.__price("close", 4, param, kline)
 
     def contract_value(self):
         """获取合约面值"""
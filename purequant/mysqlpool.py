@@ -0,0 +1,131 @@
+# -*- coding:utf-8 -*-
+
+"""
+mysql连接池
+
+进程内共用的连接池，每次存储或读取数据时从池中取出已建立的连接，用完后放回，不再每条语句都重新连接数据库。
+连接空闲超过ping_interval秒后，取出时先检查连接是否可用，断开时自动重连；
+执行过程中出现OperationalError或InterfaceError（如数据库重启、连接超时被服务器断开）时丢弃该连接；
+建立连接时出错，或执行的是只读取数据、可以重复执行的语句时用新连接重试一次，insert等语句可能已经执行，不会重试。
+每次执行后都会结束事务，放回池中的连接不保留读取时的快照，之后读取时能读到其他连接新提交的数据。
+"""
+
+import threading
+import time
+import mysql.connector
+
+RECONNECT_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+class UncertainCommitError(mysql.connector.errors.DatabaseError):
+    """提交事务时连接中断，无法确定数据是否已经写入，重新执行可能重复写入"""
+
+
+def commit(conn):
+    """提交事务，提交时连接中断则抛出UncertainCommitError"""
+    try:
+        conn.commit()
+    except RECONNECT_ERRORS as e:
+        raise UncertainCommitError("提交事务时连接中断，无法确定数据是否已写入：{}".format(e), errno=e.errno) from e
+
+
+class MysqlPool:
+    """线程安全的mysql连接池，连接在第一次需要时才建立"""
+
+    def __init__(self, size=5, ping_interval=30, **kwargs):
+        """
+        :param size: 最多同时打开的连接数量，连接都在使用中时等待其他线程放回
+        :param ping_interval: 连接空闲超过多少秒后，取出时先检查是否可用，0为每次都检查
+        :param kwargs: 传给mysql.connector.connect的参数，如user、password、database、host
+        """
+        self.size = size
+        self.ping_interval = ping_interval
+        self.kwargs = kwargs
+        self.__idle = []        # 空闲的连接，[(连接, 放回的时间)]
+        self.__opened = 0       # 已打开（包括正在建立）的连接数量
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        """取出一个可用的连接，用完后需调用release放回"""
+        with self.__condition:
+            while not self.__idle and self.__opened >= self.size:
+                self.__condition.wait()
+            if self.__idle:
+                conn, released = self.__idle.pop()
+            else:
+                conn, released = None, None
+                self.__opened += 1
+        try:
+            if conn is None:
+                conn = mysql.connector.connect(**self.kwargs)
+            elif time.monotonic() - released >= self.ping_interval:
+                conn.ping(reconnect=True, attempts=2, delay=0)
+        except Exception:
+            self.discard(conn)
+            raise
+        return conn
+
+    def release(self, conn):
+        """放回连接"""
+        with self.__condition:
+            self.__idle.append((conn, time.monotonic()))
+            self.__condition.notify()
+
+    def discard(self, conn):
+        """关闭并丢弃出错的连接"""
+        try:
+            if conn is not None:
+                conn.close()
+        except Exception:
+            pass
+        with self.__condition:
+            self.__opened -= 1
+            self.__condition.notify()
+
+    def run(self, work, retry=False):
+        """
+        用池中的连接执行work(conn)并返回其结果，建立连接时出错用新连接重试一次
+        work中需自行提交事务，执行后未提交的部分回滚；其他异常会回滚事务后抛出，连接仍放回池中
+        :param retry: work只读取数据或可以重复执行（如CREATE ... IF NOT EXISTS）时为True，执行中连接出错也用新连接重试一次
+        """
+        for attempt in range(2):
+            try:
+                conn = self.acquire()
+            except RECONNECT_ERRORS:
+                if attempt:
+                    raise
+                continue
+            try:
+                result = work(conn)
+            except RECONNECT_ERRORS:
+                self.discard(conn)
+                if attempt or not retry:
+                    raise
+                continue
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    self.discard(conn)
+                else:
+                    self.release(conn)
+                raise
+            try:
+                conn.rollback()     # 结束读取事务，连接放回池中时不保留REPEATABLE READ快照
+            except Exception:
+                self.discard(conn)
+            else:
+                self.release(conn)
+            return result
+
+    def close(self):
+        """关闭全部空闲的连接"""
+        with self.__condition:
+            idle, self.__idle = self.__idle, []
+            self.__opened -= len(idle)
+            self.__condition.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
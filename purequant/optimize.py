@@ -0,0 +1,184 @@
+# -*- coding:utf-8 -*-
+
+"""
+逐级淘汰参数优化（successive halving / Hyperband）
+
+参数网格很大时不再逐一完整回测：先在最近一小段历史数据上回测大量参数组合，只把得分最高的1/eta晋级，
+晋级的参数组合在eta倍长度的历史数据上再回测，如此直到完整的历史数据，得分低的参数组合在短数据上就被淘汰。
+hyperband用不同的起始长度重复多轮逐级淘汰，避免只在短数据上表现好的参数组合挤掉真正的最优组合。
+
+每一级用purequant.sweep在进程池中并行回测。传入path时每批回测结果都追加保存到文件，
+中断后用同样的参数重新运行会跳过已保存的回测，从中断处继续。
+"""
+
+import json
+import math
+import os
+import sys
+from functools import partial
+import numpy as np
+from purequant.kline import KlineFrame
+from purequant.sweep import sweep, parameter_grid
+from purequant.walkforward import bar_returns, window_scores
+
+
+def grid_size(grid):
+    """参数网格中参数组合的数量，不展开网格"""
+    if isinstance(grid, dict):
+        return int(np.prod([len(grid[name]) for name in grid], dtype=np.float64))
+    return len(grid)
+
+
+def sample_grid(grid, samples=None, seed=0):
+    """
+    从参数网格中不重复地随机抽取参数组合，不展开整个网格
+    :param grid: 参数网格，见purequant.sweep.parameter_grid
+    :param samples: 抽取的数量，为None或不小于参数组合数量时返回全部参数组合
+    :param seed: 随机数种子，相同的种子得到相同的参数组合，中断后继续时需保持一致
+    :return: 由参数字典组成的列表
+    """
+    total = grid_size(grid)
+    if samples is None or samples >= total:
+        return parameter_grid(grid)
+    indices = np.sort(np.random.default_rng(seed).choice(total, samples, replace=False))
+    if not isinstance(grid, dict):
+        return [dict(grid[i]) for i in indices]
+    names = list(grid)
+    values = [list(grid[name]) for name in names]
+    positions = np.unravel_index(indices, [len(value) for value in values])
+    return [{name: values[k][positions[k][i]] for k, name in enumerate(names)} for i in range(len(indices))]
+
+
+def _key(bars, params):
+    return json.dumps([bars, sorted(params.items())], ensure_ascii=False, default=str)
+
+
+class _Store:
+    """回测结果，{(k线数量, 参数): 得分}，传入path时追加保存为每行一条的JSON文件"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.scores = {}
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self.scores[_key(row["k线数量"], row["参数"])] = row["得分"]
+
+    def get(self, bars, params):
+        return self.scores.get(_key(bars, params), False)
+
+    def save(self, bars, rows):
+        lines = []
+        for params, score in rows:
+            self.scores[_key(bars, params)] = score
+            lines.append(json.dumps({"k线数量": bars, "参数": params, "得分": score}, ensure_ascii=False, default=str))
+        if self.path is not None and lines:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _score(history, function, score, **params):
+    """在子进程中运行：回测一组参数，返回整段数据的得分"""
+    returns = bar_returns(function(history, **params))
+    value = float(window_scores(returns, np.array([0]), np.array([len(returns)]), score)[0])
+    return {"得分": None if math.isnan(value) else value}
+
+
+def _evaluate(function, candidates, history, bars, score, store, processes, progress, batch):
+    """用最近bars根k线回测全部候选参数组合，已保存的结果不再回测，返回得分列表（无法计算时为None）"""
+    frame = history.window(len(history), len(history) - bars)
+    pending = [params for params in candidates if store.get(bars, params) is False]
+    for i in range(0, len(pending), batch):
+        chunk = pending[i:i + batch]
+        rows = sweep(partial(_score, function=function, score=score), chunk, frame, processes, progress)
+        store.save(bars, [(params, row["得分"]) for params, row in zip(chunk, rows)])
+    return [store.get(bars, params) for params in candidates]
+
+
+def _rank(candidates, scores):
+    """按得分从高到低排序，得分相同时保持原有顺序，无法计算得分的排在最后"""
+    order = sorted(range(len(candidates)), key=lambda i: (scores[i] is None, -(scores[i] or 0.0), i))
+    return [candidates[i] for i in order], [scores[i] for i in order]
+
+
+def successive_halving(function, grid, history, min_bars, eta=3, samples=None, seed=0, score="sharpe",
+                       processes=None, progress=True, path=None, batch=10000):
+    """
+    逐级淘汰参数优化
+    :param function: 定义在模块顶层的回测函数，function(history, **params)，返回带有equity与start_asset的回测结果，
+                     如purequant.backtest.double_ma；可以用functools.partial传入固定的参数
+    :param grid: 参数网格，见purequant.sweep.parameter_grid
+    :param history: 按时间先后排列的KlineFrame或k线数据列表
+    :param min_bars: 第一级至少使用的k线数量（取最近的k线），每晋级一次乘以eta，最后一级为完整的历史数据
+    :param eta: 每一级保留得分最高的1/eta
+    :param samples: 从参数网格中随机抽取的参数组合数量，默认为全部参数组合
+    :param seed: 抽取参数组合的随机数种子
+    :param score: 得分，见purequant.walkforward.window_scores
+    :param processes: 进程数，默认为CPU核数
+    :param progress: 是否显示每一级的参数组合数量与回测进度
+    :param path: 保存回测结果的文件，中断后再次运行时从文件中读取已完成的回测
+    :param batch: 每批回测的参数组合数量，每批完成后保存一次
+    :return: 最后一级（完整历史数据）的结果表，由字典组成的列表，每行为参数与"得分"，按得分从高到低排列
+    """
+    history = history if isinstance(history, KlineFrame) else KlineFrame.from_records(history)
+    return _halving(function, sample_grid(grid, samples, seed), history, min_bars, eta, score, processes, progress,
+                    _Store(path), batch)
+
+
+def _rungs(length, min_bars, eta):
+    """晋级的次数：第一级的k线数量不少于min_bars"""
+    rungs = 0
+    while length // eta ** (rungs + 1) >= max(min_bars, 1):
+        rungs += 1
+    return rungs
+
+
+def _halving(function, candidates, history, min_bars, eta, score, processes, progress, store, batch):
+    if eta < 2:
+        raise ValueError("eta需不小于2!")
+    rungs = _rungs(len(history), min_bars, eta)
+    for rung in range(rungs, -1, -1):
+        bars = len(history) // eta ** rung     # 每一级的k线数量是下一级的1/eta，最后一级为完整的历史数据
+        if progress:
+            sys.stderr.write("逐级淘汰：{}组参数，{}根k线\n".format(len(candidates), bars))
+            sys.stderr.flush()
+        scores = _evaluate(function, candidates, history, bars, score, store, processes, progress, batch)
+        candidates, scores = _rank(candidates, scores)
+        if rung:
+            candidates = candidates[:max(1, math.ceil(len(candidates) / eta))]
+    results = []
+    for params, value in zip(candidates, scores):
+        row = dict(params)
+        row["得分"] = value
+        results.append(row)
+    return results
+
+
+def hyperband(function, grid, history, min_bars, eta=3, samples=None, seed=0, score="sharpe", processes=None,
+              progress=True, path=None, batch=10000):
+    """
+    Hyperband参数优化：以不同的起始k线数量运行多轮逐级淘汰，起始数据越短，抽取的参数组合越多
+    其他参数见successive_halving，各轮的回测结果保存在同一个文件中，相同k线数量与参数的回测只运行一次
+    :param samples: 第一轮（起始数据最短）抽取的参数组合数量，其他轮按比例减少；默认为eta的晋级次数次方
+    :return: 各轮最后一级的结果合并后的结果表，按得分从高到低排列，重复的参数组合只保留一次
+    """
+    history = history if isinstance(history, KlineFrame) else KlineFrame.from_records(history)
+    store = _Store(path)
+    rounds = _rungs(len(history), min_bars, eta)
+    total = grid_size(grid)
+    scale = samples / eta ** rounds if samples else 1.0
+    results, seen = [], set()
+    for s in range(rounds, -1, -1):
+        count = min(total, math.ceil(scale * (rounds + 1) / (s + 1) * eta ** s))
+        rows = _halving(function, sample_grid(grid, count, seed + s), history, len(history) // eta ** s, eta, score,
+                        processes, progress, store, batch)
+        for row in rows:
+            key = _key(0, {name: value for name, value in row.items() if name != "得分"})
+            if key not in seen:
+                seen.add(key)
+                results.append(row)
+    return _rank(results, [row["得分"] for row in results])[0]
@@ -18,14 +18,15 @@ class POSITION:
         self.__instrument_id = instrument_id
         self.__time_frame = time_frame
         self.__market = MARKET(self.__platform, self.__instrument_id, self.__time_frame)
+        self.__datasheet = self.__instrument_id.split("-")[0].lower() + "_" + self.__time_frame   # 回测数据表名称
 
     def direction(self):
         """获取当前持仓方向"""
         if config.backtest != "enabled":    # 实盘模式下实时获取账户实际持仓方向
             result = self.__platform.get_position()['direction']
             return result
-        else:   # 回测模式下从数据库中读取持仓方向
-            result = storage.read_mysql_datas(0, "回测", self.__instrument_id.split("-")[0].lower() + "_" + self.__time_frame, "总资金", ">")[-1][6]
+        else:   # 回测模式下获取最近一次保存的持仓方向，不再读取整张数据表
+            result = storage.last_strategy_run_info("回测", self.__datasheet)[6]
             return result
 
     def amount(self):
@@ -33,8 +34,8 @@ class POSITION:
         if config.backtest != "enabled":    # 实盘模式下实时获取账户实际持仓数量
             result = self.__platform.get_position()['amount']
             return result
-        else:   # 回测模式下从数据库中读取持仓数量
-            result = storage.read_mysql_datas(0, "回测", self.__instrument_id.split("-")[0].lower() + "_" + self.__time_frame, "总资金", ">")[-1][7]
+        else:   # 回测模式下获取最近一次保存的持仓数量，不再读取整张数据表
+            result = storage.last_strategy_run_info("回测", self.__datasheet)[7]
             return result
 
     def price(self):
@@ -42,8 +43,8 @@ class POSITION:
         if config.backtest != "enabled":    # 实盘模式下实时获取账户实际持仓价格
             result = self.__platform.get_position()['price']
             return result
-        else:   # 回测模式下从数据库中读取持仓价格
-            result = storage.read_mysql_datas(0, "回测", self.__instrument_id.split("-")[0].lower() + "_" + self.__time_frame, "总资金", ">")[-1][5]
+        else:   # 回测模式下获取最近一次保存的持仓价格，不再读取整张数据表
+            result = storage.last_strategy_run_info("回测", self.__datasheet)[5]
             return result
 
 
@@ -14,6 +14,7 @@ from email.mime.text import MIMEText
 from email.utils import parseaddr, formataddr
 from twilio.rest import Client
 from purequant.storage import storage
+from purequant.writebehind import write_behind
 from purequant.time import get_localtime
 
 def __dingtalk(text):
@@ -79,11 +80,11 @@ def __twilio(message):
     twilioCli.messages.create(body=message, from_=twilio_Number, to=myNumber)
 
 def push(message):
-    """集成推送工具，配置模块中选择具体的推送渠道"""
+    """集成推送工具，配置模块中选择具体的推送渠道，异步写入时（见purequant.writebehind）在后台线程中发送"""
     if config.backtest != "enabled":    # 仅实盘模式时推送信息
         if config.sendmail == 'true':
-            __sendmail(message)
+            write_behind.call(__sendmail, message)
         if config.dingtalk == 'true':
-            __dingtalk(message)
+            write_behind.call(__dingtalk, message)
         if config.twilio == 'true':
-            __twilio(message)
+            write_behind.call(__twilio, message)
@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+
+"""
+行情数据批量记录
+
+websocket每收到一条消息就单独插入一条文档时，深度频道高峰期的消息量会超过mongodb单条插入的速度。
+MongoRecorder把消息先放在内存中，累计到batch_size条或距上次写入超过interval秒时由后台线程用一次insert_many写入，
+收到消息的线程（如websocket的事件循环）只把消息放入缓存，不等待数据库。
+ordered=False时某条文档出错不影响同一批中的其他文档。mongodb无法连接时消息保留在缓存中等待重试，
+缓存超过max_buffer条时丢弃最早的消息，避免长时间断开时内存无限增长。程序退出时自动写入剩余的消息，
+关闭之后收到的消息在收到消息的线程中逐条写入；关闭后写入失败的消息不再重试，计入丢弃条数并记录日志。
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
+
+
+class MongoRecorder:
+    """批量写入mongodb集合的记录器，线程安全"""
+
+    def __init__(self, collection, batch_size=1000, interval=1.0, ordered=False, write_concern=None,
+                 max_buffer=100000):
+        """
+        :param collection: pymongo的集合对象，如storage.mongodb_client()[数据库名称][集合名称]
+        :param batch_size: 累计多少条消息写入一次
+        :param interval: 距上次写入超过多少秒时写入，0为只按数量写入
+        :param ordered: 是否按顺序写入，为True时某条文档出错后同一批中其后的文档不再写入
+        :param write_concern: 写入确认选项，如{"w": 1, "j": False}，默认使用客户端的设置
+        :param max_buffer: 缓存最多保留的消息条数，超出时丢弃最早的消息
+        """
+        self.collection = collection.with_options(write_concern=WriteConcern(**write_concern)) if write_concern \
+            else collection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.ordered = ordered
+        self.max_buffer = max(max_buffer, batch_size)
+        self.__buffer = deque()
+        self.__lock = threading.Lock()          # 保护__buffer与__metrics
+        self.__write_lock = threading.Lock()    # 保证各批按顺序写入
+        self.__last_flush = time.monotonic()
+        self.__retry_at = 0.0                   # 写入失败后，后台线程在此之前不再重试
+        self.__worker = None
+        self.__wake = threading.Event()
+        self.__closed = threading.Event()
+        self.__metrics = {"已写入条数": 0, "批次数": 0, "失败条数": 0, "丢弃条数": 0, "最大写入耗时": 0.0}
+        atexit.register(self.close)
+
+    def record(self, document):
+        """记录一条消息，只放入缓存，达到batch_size条时由后台线程写入"""
+        with self.__lock:
+            self.__buffer.append(document)
+            self.__trim()
+            full = len(self.__buffer) >= self.batch_size
+        if self.__closed.is_set():  # 已关闭（程序退出中）时没有后台线程，在当前线程逐条写入
+            self.flush()
+            return
+        if self.__worker is None:
+            self.__start()
+        if full:
+            self.__wake.set()
+
+    def __trim(self):
+        """缓存超过max_buffer条时丢弃最早的消息，需持有__lock"""
+        while len(self.__buffer) > self.max_buffer:
+            self.__buffer.popleft()
+            self.__metrics["丢弃条数"] += 1
+
+    def __start(self):
+        with self.__lock:
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, name="purequant-mongo-recorder", daemon=True)
+                self.__worker.start()
+
+    def __run(self):
+        while not self.__closed.is_set():
+            self.__wake.wait(self.interval / 2 if self.interval else None)
+            self.__wake.clear()
+            now = time.monotonic()
+            if self.__closed.is_set() or now < self.__retry_at:
+                continue
+            with self.__lock:
+                size = len(self.__buffer)
+            if size >= self.batch_size or (self.interval and size and now - self.__last_flush >= self.interval):
+                self.flush()
+
+    def flush(self):
+        """写入缓存中的全部消息"""
+        with self.__write_lock:
+            with self.__lock:
+                documents = list(self.__buffer)
+                self.__buffer.clear()
+            self.__last_flush = time.monotonic()
+            if not documents:
+                return
+            start = time.perf_counter()
+            try:
+                self.collection.insert_many(documents, ordered=self.ordered)
+                written = len(documents)
+            except BulkWriteError as e:
+                written = e.details.get("nInserted", 0)
+                with self.__lock:
+                    self.__metrics["失败条数"] += len(documents) - written
+                logging.error("mongodb批量写入部分失败：{}.{} {}条中写入{}条".format(
+                    self.collection.database.name, self.collection.name, len(documents), written))
+            except PyMongoError:    # 连接中断等错误，消息放回缓存，稍后重试
+                if self.__closed.is_set() and (self.__worker is None or not self.__worker.is_alive()):
+                    with self.__lock:   # 已关闭，不会再重试
+                        self.__metrics["丢弃条数"] += len(documents)
+                    logging.exception("mongodb批量写入失败：{}.{} 记录器已关闭，{}条消息丢弃".format(
+                        self.collection.database.name, self.collection.name, len(documents)))
+                    return
+                with self.__lock:
+                    self.__buffer.extendleft(reversed(documents))
+                    self.__trim()
+                self.__retry_at = time.monotonic() + max(self.interval, 1.0)
+                logging.exception("mongodb批量写入失败：{}.{} {}条消息将在稍后重试".format(
+                    self.collection.database.name, self.collection.name, len(documents)))
+                return
+            elapsed = time.perf_counter() - start
+            with self.__lock:
+                self.__metrics["已写入条数"] += written
+                self.__metrics["批次数"] += 1
+                self.__metrics["最大写入耗时"] = max(self.__metrics["最大写入耗时"], elapsed)
+
+    def close(self):
+        """停止后台线程并写入剩余的消息"""
+        self.__closed.set()
+        self.__wake.set()
+        if self.__worker is not None and self.__worker is not threading.current_thread():
+            self.__worker.join()
+        self.flush()
+
+    def metrics(self):
+        """返回一个字典：缓存条数、已写入条数、批次数、失败条数、丢弃条数（缓存已满或关闭后写入失败时丢弃的消息）与最大写入耗时（秒）"""
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            metrics["缓存条数"] = len(self.__buffer)
+        return metrics
@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+
+"""
+回测绩效报告
+
+由资金曲线与成交记录计算收益率、最大回撤、夏普比率等指标，全部用numpy数组计算，
+可以在参数优化的每个回测任务中直接调用，结果可保存为JSON或HTML文件。
+"""
+
+import html
+import json
+import numpy as np
+from purequant import time
+
+MS_PER_YEAR = 365 * 86400 * 1000
+CLOSE_ACTIONS = ("平", "止损")     # 交易类型中含有这些字的成交记录是平仓记录，此次盈亏为平仓盈亏
+
+
+def trade_arrays(records):
+    """
+    从成交记录中取出每次平仓的盈亏与每笔成交的成交金额
+    :param records: 成交记录，格式与storage.mysql_save_strategy_run_info保存的数据一致，
+                    如BacktestResult.records、storage.ledger(...).rows()或storage.read_mysql_datas的返回值
+    :return: (平仓盈亏数组, 成交金额数组)，反手的成交记录中只有开仓部分的成交金额
+    """
+    rows = [row for row in records if row[1] != "none"]
+    closed = [float(row[8]) for row in rows if any(word in row[1] for word in CLOSE_ACTIONS)]
+    return np.array(closed, dtype=np.float64), np.array([float(row[4]) for row in rows], dtype=np.float64)
+
+
+def equity_from_records(records, timestamp, start_asset=None):
+    """
+    由成交记录中的总资金得到每根k线上的资金曲线（只含已平仓盈亏），用于事件驱动回测的结果
+    :param records: 成交记录，时间为本地时间字符串，如"2020-08-01 08:00:00"
+    :param timestamp: k线的毫秒时间戳数组
+    :param start_asset: 初始资金，默认为第一条记录的总资金
+    :return: 与timestamp等长的float64数组
+    """
+    rows = [row for row in records if row[1] != "none"]
+    start_asset = start_asset if start_asset is not None else float(records[0][10])
+    times = np.array([time.datetime_str_to_ts(row[0]) * 1000 for row in rows], dtype=np.int64)
+    assets = np.concatenate(([start_asset], [float(row[10]) for row in rows]))
+    return assets[np.searchsorted(times, np.asarray(timestamp, dtype=np.int64), side="right")]
+
+
+def _periods_per_year(timestamp):
+    if len(timestamp) < 2:
+        return 0.0
+    return MS_PER_YEAR / float(np.median(np.diff(timestamp)))
+
+
+def _ratio(numerator, denominator):
+    return float(numerator / denominator) if denominator else None
+
+
+def performance(equity, timestamp, profits=None, turnover=None, position=None, start_asset=None, risk_free=0.0):
+    """
+    计算回测绩效指标
+    :param equity: 每根k线收盘时的总资金
+    :param timestamp: 每根k线的毫秒时间戳
+    :param profits: 每次平仓的盈亏，用于计算胜率与盈利因子
+    :param turnover: 每笔成交的成交金额，用于计算换手率
+    :param position: 每根k线收盘时的持仓数量，用于计算持仓时间占比
+    :param start_asset: 初始资金，默认为资金曲线的第一个值
+    :param risk_free: 年化无风险利率
+    :return: 字典，无法计算的指标为None
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    timestamp = np.asarray(timestamp, dtype=np.int64)
+    start_asset = float(start_asset if start_asset is not None else equity[0])
+    report = {"开始时间": time.ts_to_datetime_str(timestamp[0] / 1000), "结束时间": time.ts_to_datetime_str(timestamp[-1] / 1000),
+              "初始资金": start_asset, "最终资金": float(equity[-1])}
+    # 收益率
+    total_return = equity[-1] / start_asset - 1
+    years = (timestamp[-1] - timestamp[0]) / MS_PER_YEAR
+    report["总收益率"] = float(total_return)
+    report["年化收益率"] = float((1 + total_return) ** (1 / years) - 1) if years > 0 and total_return > -1 else None
+    # 最大回撤与最长回撤持续时间（从前一个最高点到重新创新高的时间）
+    peak = np.maximum.accumulate(np.maximum(equity, start_asset))
+    drawdown = 1 - equity / peak
+    bars = np.arange(len(equity))
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, bars, 0))
+    duration = timestamp - timestamp[last_peak]
+    report["最大回撤"] = float(drawdown.max())
+    report["最大回撤持续天数"] = float(duration.max() / 86400000)
+    # 夏普比率与索提诺比率，按k线收益率计算后年化
+    returns = np.diff(np.concatenate(([start_asset], equity))) / np.concatenate(([start_asset], equity[:-1]))
+    periods = _periods_per_year(timestamp)
+    excess = returns - (risk_free / periods if periods else 0.0)
+    deviation = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    downside = np.sqrt(np.mean(np.minimum(excess, 0) ** 2))
+    report["夏普比率"] = _ratio(excess.mean() * np.sqrt(periods), deviation)
+    report["索提诺比率"] = _ratio(excess.mean() * np.sqrt(periods), downside)
+    # 交易统计
+    if profits is not None:
+        profits = np.asarray(profits, dtype=np.float64)
+        gain = profits[profits > 0].sum()
+        loss = -profits[profits < 0].sum()
+        report["平仓次数"] = len(profits)
+        report["胜率"] = _ratio(np.count_nonzero(profits > 0), len(profits))
+        report["盈利因子"] = _ratio(gain, loss)
+    if turnover is not None:
+        turnover = np.asarray(turnover, dtype=np.float64)
+        report["成交次数"] = len(turnover)
+        report["成交金额"] = float(turnover.sum())
+        report["换手率"] = _ratio(turnover.sum(), equity.mean())    # 成交金额/平均资金
+    if position is not None:
+        report["持仓时间占比"] = float(np.count_nonzero(np.asarray(position)) / len(equity))
+    return report
+
+
+def to_json(report, path=None):
+    """将报告转换为JSON字符串，传入path时同时保存为文件"""
+    content = json.dumps(report, ensure_ascii=False, indent=4)
+    if path is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return content
+
+
+def _svg(equity, timestamp, width=800, height=240, points=1000):
+    """资金曲线的SVG折线图，点数过多时等间隔抽样"""
+    index = np.unique(np.linspace(0, len(equity) - 1, min(points, len(equity))).astype(np.int64))
+    values = np.asarray(equity, dtype=np.float64)[index]
+    low, high = values.min(), values.max()
+    x = (index - index[0]) / max(index[-1] - index[0], 1) * width
+    y = height - (values - low) / ((high - low) or 1) * height
+    line = " ".join("{:.1f},{:.1f}".format(a, b) for a, b in zip(x, y))
+    return ('<svg width="{w}" height="{h}" viewBox="0 0 {w} {h}"><polyline fill="none" stroke="#1f77b4" '
+            'stroke-width="1" points="{line}"/></svg><p>{start} - {end}</p>').format(
+        w=width, h=height, line=line, start=time.ts_to_datetime_str(timestamp[0] / 1000),
+        end=time.ts_to_datetime_str(timestamp[-1] / 1000))
+
+
+def to_html(report, path=None, equity=None, timestamp=None, title="回测报告"):
+    """
+    将报告转换为HTML，传入资金曲线时附带资金曲线图
+    :param path: 传入时同时保存为文件
+    :return: HTML字符串
+    """
+    rows = "".join("<tr><th>{}</th><td>{}</td></tr>".format(html.escape(str(key)), html.escape(
+        "-" if value is None else "{:.6g}".format(value) if isinstance(value, float) else str(value)))
+        for key, value in report.items())
+    chart = _svg(equity, timestamp) if equity is not None and timestamp is not None and len(equity) else ""
+    content = ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title><style>'
+               'body{{font-family:sans-serif}}th{{text-align:left;padding-right:2em}}</style></head>'
+               '<body><h2>{title}</h2><table>{rows}</table>{chart}</body></html>').format(
+        title=html.escape(title), rows=rows, chart=chart)
+    if path is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return content
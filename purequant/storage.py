@@ -7,181 +7,288 @@ Author: Gary-Hertel
 Date:   2020/07/09
 email: interstella.ranger2020@gmail.com
 """
+import atexit, os, sqlite3, threading
 import logging, mysql.connector, pymongo
+from mysql.connector import errorcode
 from purequant import time
+from purequant.ledger import Ledger, RUN_INFO_FIELDS
+from purequant.mysqlpool import MysqlPool, RECONNECT_ERRORS, UncertainCommitError, commit
+from purequant.writebehind import write_behind
+from purequant.recorder import MongoRecorder
 from purequant.indicators import INDICATORS
+from purequant.kline import kline_cache, KlineFrame
+from purequant.history import history_store, concatenate, read_csv
+import numpy as np
 import pandas as pd
 from purequant.config import config
 
+KLINE_FIELDS = ("timestamp", "open", "high", "low", "close", "volume", "currency_volume")     # k线数据表的字段
+PUREQUANT_SERVER = {"host": "118.193.32.198", "user": "purequant", "password": '^C_U7TN.,+,KoV#W:Z_!'}   # PureQuant历史k线数据服务器
+
+
 class __Storage:
     """K线等各种数据的存储与读取"""
 
     def __init__(self):
         self.__old_kline = 0
+        self.__ledgers = {}     # 回测时保存在内存中的策略运行信息，{(数据库名称, 数据表名称): Ledger}
+        self.__last_run_infos = {}  # 每张策略运行信息数据表中总资金大于0的最后一行，{(数据库名称, 数据表名称): 元组}
+        self.__mysql_pools = {}     # mysql连接池，{(数据库名称, 服务器参数): MysqlPool}
+        self.__mysql_lock = threading.Lock()
+        self.__mysql_schemas = set()    # 已确认存在的数据表，{(数据库名称, 数据表名称, 字段定义)}
+        self.__mysql_kline_keys = {}    # k线数据表的时间字段是否有唯一索引，{(数据库名称, 数据表名称): bool}
+        self.__mongodb_client = None
+        self.__mongodb_lock = threading.Lock()    # 保护__mongodb_client与__mongodb_recorders
+        self.__mongodb_recorders = {}   # {(数据库名称, 集合名称): MongoRecorder}
+        self.__inherited = []   # fork前父进程的连接池与MongoClient，子进程中只保留引用，见reset_after_fork
+        # mysql的一批数据在一个事务中写入，出错时整批回滚，可以逐条重新写入；提交时连接中断则无法确定是否已写入，不再重新写入
+        write_behind.register("mysql", self.__write_mysql, transient=RECONNECT_ERRORS, split=True,
+                              uncertain=(UncertainCommitError,))
+        write_behind.register("text", self.__write_texts)
+        write_behind.register("mongodb", self.__write_mongodb, transient=(pymongo.errors.ConnectionFailure,))
+        atexit.register(self.flush_ledgers)     # 程序退出时写入尚未保存的回测数据
 
-    def save_asset_and_profit(self, database, data_sheet, profit, asset):
-        """存储单笔交易盈亏与总资金信息至mysql数据库"""
-        # 检查数据库是否存在，如不存在则创建
+    def __mysql_user(self):
         user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
         password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
+        return user, password
+
+    def mysql_pool(self, database=None, **server):
+        """
+        获取mysql连接池，进程内每个数据库共用一个连接池，第一次使用时创建
+        :param database: 数据库名称，为None时连接不指定数据库
+        :param server: 传给mysql.connector.connect的服务器参数，如host、user、password，默认为配置文件中的用户名与密码
+        :return: MysqlPool
+        """
+        if not server:
+            user, password = self.__mysql_user()
+            server = {"user": user, "password": password}
+        key = (database, tuple(sorted(server.items())))
+        with self.__mysql_lock:
+            pool = self.__mysql_pools.get(key)
+            if pool is None:
+                if database is not None:
+                    server["database"] = database
+                pool = self.__mysql_pools[key] = MysqlPool(getattr(config, "mysql_pool_size", 5),
+                                                           getattr(config, "mysql_ping_interval", 30), **server)
+        return pool
+
+    def reset_after_fork(self):
+        """
+        在fork出的子进程（如purequant.sweep的进程池）中调用：丢弃从父进程复制来的mysql连接池、MongoClient、记录器、
+        回测数据与缓存，子进程第一次使用时重新创建。复制来的连接属于父进程，不能关闭，只保留引用，不让垃圾回收关闭它们
+        """
+        self.__inherited.append((self.__mysql_pools, self.__mongodb_client, self.__mongodb_recorders))
+        self.__mysql_pools = {}
+        self.__mysql_lock = threading.Lock()
+        self.__mysql_schemas = set()
+        self.__mysql_kline_keys = {}
+        self.__mongodb_client = None
+        self.__mongodb_lock = threading.Lock()
+        self.__mongodb_recorders = {}
+        self.__ledgers = {}
+        self.__last_run_infos = {}
+
+    def close_mysql_pools(self, database=None):
+        """关闭连接池中的空闲连接，不传入database时关闭全部连接池"""
+        with self.__mysql_lock:
+            pools = [pool for (db, _), pool in self.__mysql_pools.items() if database is None or db == database]
+        for pool in pools:
+            pool.close()
+
+    def mysql_execute(self, sql, params=None, database=None, fetch=None, many=False, **server):
+        """
+        用连接池中的连接执行一条sql语句，连接断开时自动重连
+        :param sql: sql语句
+        :param params: 语句中的参数
+        :param database: 数据库名称
+        :param fetch: "all"返回全部结果，"one"返回第一行，为None时提交事务且不返回结果
+        :param many: 为True时用executemany执行，params为多行参数组成的列表
+        :param server: 服务器参数，见mysql_pool
+        """
+        def work(conn):
+            cursor = conn.cursor(buffered=True)
+            try:
+                if many:
+                    cursor.executemany(sql, params)
+                else:
+                    cursor.execute(sql, params)
+                if fetch == "all":
+                    return cursor.fetchall()
+                if fetch == "one":
+                    return cursor.fetchone()
+                commit(conn)
+            finally:
+                cursor.close()
+
+        return self.mysql_pool(database, **server).run(work, retry=fetch is not None)    # 只有查询可以重试
+
+    def mysql_ensure_table(self, database, data_sheet, columns):
+        """
+        确保数据库与数据表存在，不存在时创建，每个进程中每张数据表只在第一次写入时执行一次
+        :param columns: 建表时的字段定义，如"timestamp TEXT, profit FLOAT, asset FLOAT"
+        """
+        key = (database, data_sheet, columns)
+        if key in self.__mysql_schemas:
+            return
+
+        def create(conn):
+            cursor = conn.cursor()
+            cursor.execute("CREATE DATABASE IF NOT EXISTS {}".format(database))
+            cursor.execute("CREATE TABLE IF NOT EXISTS {}.{} ({})".format(database, data_sheet, columns))
+            conn.commit()
+            cursor.close()
+
+        self.mysql_pool().run(create, retry=True)
+        self.__mysql_schemas.add(key)
+
+    def __mysql_forget_schemas(self, database, data_sheet=None):
+        """数据库或数据表被删除时，清除已确认存在的记录与缓存的策略运行信息最后一行"""
+        for key in list(self.__mysql_schemas):
+            if key[0] == database and (data_sheet is None or key[1] == data_sheet):
+                self.__mysql_schemas.discard(key)
+        self.__forget_run_infos(self.__last_run_infos, database, data_sheet)
+
+    def __forget_run_infos(self, cache, database=None, data_sheet=None):
+        """删除cache（__ledgers或__last_run_infos）中属于某个数据库或数据表的项，database为None时全部删除"""
+        for key in list(cache):
+            if database is None or (key[0] == database and (data_sheet is None or key[1] == data_sheet)):
+                cache.pop(key, None)
+
+    def __mysql_insert_later(self, database, data_sheet, columns, sql, params):
+        """插入一行数据，经由写入队列（见purequant.writebehind），同一数据表的多行合并为一条executemany"""
+        write_behind.put("mysql", (database, data_sheet, columns, sql), params)
+
+    def __write_mysql(self, key, rows):
+        database, data_sheet, columns, sql = key
+        if len(rows) == 1:
+            self.mysql_insert(database, data_sheet, columns, sql, rows[0])
         else:
-            cursor2.execute("CREATE TABLE {} (timestamp TEXT, profit FLOAT, asset FLOAT)".format(data_sheet))
-        # 插入数据
-        cursor2.execute(
-            'insert into {} (timestamp, profit, asset) values (%s, %s, %s)'.format(
-                data_sheet),
-            [time.get_localtime(), profit, asset])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+            self.mysql_insert(database, data_sheet, columns, sql, rows, many=True)
+
+    def mysql_insert(self, database, data_sheet, columns, sql, params, many=False):
+        """
+        插入数据，只需一次往返；数据库或数据表不存在（如被其他程序删除）时重新创建并重试一次
+        :param columns: 建表时的字段定义，见mysql_ensure_table
+        :param sql: insert语句
+        :param params: 参数，many为True时为多行参数组成的列表
+        """
+        self.mysql_ensure_table(database, data_sheet, columns)
+        try:
+            self.mysql_execute(sql, params, database, many=many)
+        except mysql.connector.errors.ProgrammingError as e:
+            if e.errno not in (errorcode.ER_NO_SUCH_TABLE, errorcode.ER_BAD_DB_ERROR):
+                raise
+            self.__mysql_forget_schemas(database, data_sheet)
+            self.mysql_ensure_table(database, data_sheet, columns)
+            self.mysql_execute(sql, params, database, many=many)
+
+    def save_asset_and_profit(self, database, data_sheet, profit, asset):
+        """存储单笔交易盈亏与总资金信息至mysql数据库"""
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "timestamp TEXT, profit FLOAT, asset FLOAT", 'insert into {} (timestamp, profit, asset) values (%s, %s, %s)'.format(data_sheet), [time.get_localtime(), profit, asset])
 
     def mysql_save_strategy_position(self, database, data_sheet, direction, amount):
         """存储持仓方向与持仓数量信息至mysql数据库"""
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:
-            cursor2.execute("CREATE TABLE {} (timestamp TEXT, direction TEXT, amount FLOAT)".format(data_sheet))
-        # 插入数据
-        cursor2.execute(
-            'insert into {} (timestamp, direction, amount) values (%s, %s, %s)'.format(
-                data_sheet),
-            [time.get_localtime(), direction, amount])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "timestamp TEXT, direction TEXT, amount FLOAT", 'insert into {} (timestamp, direction, amount) values (%s, %s, %s)'.format(data_sheet), [time.get_localtime(), direction, amount])
 
     def __save_kline_func(self, database, data_sheet, timestamp, open, high, low, close, volume, currency_volume):
         """此函数专为k线存储的函数使用"""
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:
-            cursor2.execute("CREATE TABLE {} (timestamp TEXT, open FLOAT, high FLOAT, low FLOAT, close FLOAT, volume FLOAT, currency_volume FLOAT)".format(data_sheet))
-        # 插入数据
-        cursor2.execute(
-            'insert into {} (timestamp, open, high, low, close, volume, currency_volume) values (%s, %s, %s, %s, %s, %s, %s)'.format(
-                data_sheet),
-            [timestamp, open, high, low, close, volume, currency_volume])
-        # 提交事务
-        conn2.commit()
-        # 关闭游标和连接
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回；时间字段有唯一索引时时间相同的k线以新数据为准
+        self.__mysql_insert_later(database, data_sheet, "timestamp TEXT, open FLOAT, high FLOAT, low FLOAT, close FLOAT, volume FLOAT, currency_volume FLOAT", self.__kline_insert_sql(data_sheet, KLINE_FIELDS, self.__mysql_kline_index(database, data_sheet)), [timestamp, open, high, low, close, volume, currency_volume])
 
     def __binance_save_kline_func(self, database, data_sheet, timestamp, open, high, low, close, volume):
         """此函数专为存储币安交易所k线的函数使用"""
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:
-            cursor2.execute("CREATE TABLE {} (timestamp TEXT, open FLOAT, high FLOAT, low FLOAT, close FLOAT, volume FLOAT)".format(data_sheet))
-        # 插入数据
-        cursor2.execute(
-            'insert into {} (timestamp, open, high, low, close, volume) values (%s, %s, %s, %s, %s, %s)'.format(
-                data_sheet),
-            [timestamp, open, high, low, close, volume])
-        # 提交事务
-        conn2.commit()
-        # 关闭游标和连接
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回；时间字段有唯一索引时时间相同的k线以新数据为准
+        self.__mysql_insert_later(database, data_sheet, "timestamp TEXT, open FLOAT, high FLOAT, low FLOAT, close FLOAT, volume FLOAT", self.__kline_insert_sql(data_sheet, KLINE_FIELDS[:6], self.__mysql_kline_index(database, data_sheet)), [timestamp, open, high, low, close, volume])
+
+    def __kline_insert_sql(self, data_sheet, fields, unique):
+        """k线数据表的insert语句，时间字段有唯一索引时加上ON DUPLICATE KEY UPDATE，时间相同的k线以新数据为准"""
+        sql = "insert into {} ({}) values ({})".format(data_sheet, ", ".join(fields), ", ".join(["%s"] * len(fields)))
+        if unique:
+            sql += " ON DUPLICATE KEY UPDATE " + ", ".join("{0}=VALUES({0})".format(field) for field in fields[1:])
+        return sql
+
+    def mysql_save_klines(self, database, data_sheet, klines, batch=5000, unique_index=False):
+        """
+        批量保存k线数据至mysql数据库，整批数据在一个事务中用executemany写入，时间相同的k线以新数据为准
+        数据表与kline_storage、binance_kline_storage保存的数据表相同；时间字段有唯一索引时用ON DUPLICATE KEY UPDATE写入，
+        没有时先删除时间相同的旧数据再写入
+        :param database: 数据库名称
+        :param data_sheet: 数据表名称
+        :param klines: k线数据列表，每行为[时间, 开, 高, 低, 收, 成交量]或再加上成交量（币），如交易所get_kline的返回值；
+                       也可以是KlineFrame（如history_store.load的返回值）或csv文件路径（见purequant.history.read_csv），
+                       时间保存为"2020-01-01T00:00:00.000Z"格式的UTC时间字符串
+        :param batch: 每条insert语句的行数
+        :param unique_index: 为True时先为时间字段添加唯一索引（见mysql_add_kline_index），默认不修改已有数据表的结构
+        :return: 写入的k线数量
+        """
+        if isinstance(klines, str):
+            klines = read_csv(klines)
+        if isinstance(klines, KlineFrame):
+            timestamp = np.datetime_as_string(klines.timestamp.astype("datetime64[ms]"), unit="ms")
+            klines = list(zip([value + "Z" for value in timestamp.tolist()], klines.open.tolist(), klines.high.tolist(),
+                              klines.low.tolist(), klines.close.tolist(), klines.volume.tolist()))
+        rows = list({row[0]: tuple(row) for row in klines}.values())     # 同一批数据中时间重复时以后面的为准
+        if not rows:
+            return 0
+        fields = KLINE_FIELDS[:len(rows[0])]
+        self.mysql_ensure_table(database, data_sheet, ", ".join(
+            "{} {}".format(field, "TEXT" if field == "timestamp" else "FLOAT") for field in fields))
+        unique = self.mysql_add_kline_index(database, data_sheet) if unique_index else self.__mysql_kline_index(database, data_sheet)
+        sql = self.__kline_insert_sql(data_sheet, fields, unique)
+
+        def write(conn):
+            cursor = conn.cursor()
+            for i in range(0, len(rows), batch):
+                chunk = rows[i:i + batch]
+                if not unique:  # 时间字段没有唯一索引时先删除时间相同的旧数据
+                    cursor.execute("DELETE FROM {} WHERE timestamp IN ({})".format(data_sheet, ", ".join(["%s"] * len(chunk))),
+                                   [row[0] for row in chunk])
+                cursor.executemany(sql, chunk)
+            conn.commit()
+            cursor.close()
+
+        self.mysql_pool(database).run(write, retry=True)   # 重复执行时结果相同：时间相同的k线以新数据为准
+        return len(rows)
+
+    def __mysql_kline_index(self, database, data_sheet):
+        """k线数据表的时间字段是否有唯一索引，每个进程中每张数据表只查询一次，不修改数据表的结构"""
+        key = (database, data_sheet)
+        if key not in self.__mysql_kline_keys:
+            try:
+                rows = self.mysql_execute("SHOW INDEX FROM {} WHERE Non_unique = 0 AND Column_name = 'timestamp'".format(data_sheet),
+                                          database=database, fetch="all")
+            except mysql.connector.errors.ProgrammingError as e:
+                if e.errno not in (errorcode.ER_NO_SUCH_TABLE, errorcode.ER_BAD_DB_ERROR):
+                    raise
+                return False    # 数据表尚未创建，创建后再查询
+            self.__mysql_kline_keys[key] = bool(rows)
+        return self.__mysql_kline_keys[key]
+
+    def mysql_add_kline_index(self, database, data_sheet):
+        """
+        为k线数据表的时间字段添加唯一索引，之后批量与实时保存k线时都用ON DUPLICATE KEY UPDATE写入，时间相同的k线以新数据为准
+        会修改已有数据表的结构，只在调用此函数或mysql_save_klines传入unique_index=True时执行
+        :return: 是否有唯一索引，已有数据中时间有重复时无法添加，返回False
+        """
+        key = (database, data_sheet)
+        if self.__mysql_kline_index(database, data_sheet):
+            return True
+        try:
+            self.mysql_execute("ALTER TABLE {} ADD UNIQUE INDEX timestamp_unique (timestamp(32))".format(data_sheet),
+                               database=database)
+            self.__mysql_kline_keys[key] = True
+        except mysql.connector.errors.Error as e:
+            if e.errno == errorcode.ER_DUP_KEYNAME:     # 已经添加过
+                self.__mysql_kline_keys[key] = True
+            elif e.errno == errorcode.ER_DUP_ENTRY:     # 已有数据中时间有重复
+                logging.warning("数据表{}.{}中有时间重复的k线，无法添加唯一索引，批量写入时将先删除时间相同的旧数据".format(database, data_sheet))
+                self.__mysql_kline_keys[key] = False
+            else:
+                raise
+        return self.__mysql_kline_keys[key]
 
     def kline_save(self, database, data_sheet, platform, instrument_id, time_frame):
         """
@@ -195,16 +302,14 @@ class __Storage:
         """
         result = platform.get_kline(time_frame)
         result.reverse()
-        for data in result:
-            self.__save_kline_func(database, data_sheet, data[0], data[1], data[2], data[3], data[4], data[5], data[6])
+        self.mysql_save_klines(database, data_sheet, [data[:7] for data in result])
         print("获取的历史数据已存储至mysql数据库！")
 
     def binance_kline_save(self, database, data_sheet, platform, instrument_id, time_frame):
         """存储币安交易所历史k线"""
         result = platform.get_kline(time_frame)
         result.reverse()
-        for data in result:
-            self.__binance_save_kline_func(database, data_sheet, data[0], data[1], data[2], data[3], data[4], data[5])
+        self.mysql_save_klines(database, data_sheet, [data[:6] for data in result])
         print("{} {} {} 获取的币安交易所的历史k线数据已存储至mysql数据库！".format(time.get_localtime(), instrument_id, time_frame))
 
     def kline_storage(self, database, data_sheet, platform, instrument_id, time_frame):
@@ -218,7 +323,7 @@ class __Storage:
         """
         indicators = INDICATORS(platform, instrument_id, time_frame)
         if indicators.BarUpdate() == True:
-            last_kline = platform.get_kline(time_frame)[1]
+            last_kline = kline_cache.get_kline(platform, instrument_id, time_frame)[1]
             if last_kline != self.__old_kline:    # 若获取得k线不同于已保存的上一个k线
                 timestamp = last_kline[0]
                 open = last_kline[1]
@@ -237,7 +342,7 @@ class __Storage:
         """存储实时的币安交易所k线数据"""
         indicators = INDICATORS(platform, instrument_id, time_frame)
         if indicators.BarUpdate() == True:
-            last_kline = platform.get_kline(time_frame)[1]
+            last_kline = kline_cache.get_kline(platform, instrument_id, time_frame)[1]
             if last_kline != self.__old_kline:    # 若获取得k线不同于已保存的上一个k线
                 timestamp = last_kline[0]
                 open = last_kline[1]
@@ -260,17 +365,20 @@ class __Storage:
         :param field: 字段
         :return: 返回值查询到的数据，如未查询到则返回None
         """
-        # 连接数据库
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn = mysql.connector.connect(user=user, password=password, database=database, buffered = True)
-        # 打开游标
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM {} WHERE {} {} '{}'".format(datasheet, field, operator, data))
-        LogData = cursor.fetchall()  # 取出了数据库数据
-        # 关闭游标和连接
-        cursor.close()
-        conn.close()
+        ledger = self.__ledgers.get((database, datasheet))
+        if ledger is not None and getattr(config, "ledger_sink", "mysql") != "mysql":   # 回测数据不保存在mysql中
+            return ledger.select(data, field, operator)
+        write_behind.flush("mysql", (database, datasheet))    # 先写入队列中这张数据表尚未写入的数据
+        try:
+            LogData = self.mysql_execute("SELECT * FROM {} WHERE {} {} '{}'".format(datasheet, field, operator, data),
+                                         database=database, fetch="all")  # 取出了数据库数据
+        except mysql.connector.errors.ProgrammingError as e:
+            if ledger is None or e.errno not in (errorcode.ER_NO_SUCH_TABLE, errorcode.ER_BAD_DB_ERROR):
+                raise
+            # 回测数据还没有写入过数据库，数据库或数据表尚不存在，全部数据都在内存中
+            return ledger.select(data, field, operator)
+        if ledger is not None:  # 加上尚未写入数据库的回测数据
+            LogData = LogData + ledger.select(data, field, operator, start=ledger.flushed)
         return LogData
 
     def read_mysql_specific_data(self, data, database, datasheet, field):  # 获取数据库满足条件的数据
@@ -282,17 +390,9 @@ class __Storage:
         :param field: 字段
         :return: 返回值查询到的数据，如未查询到则返回None
         """
-        # 连接数据库
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn = mysql.connector.connect(user=user, password=password, database=database, buffered = True)
-        # 打开游标
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM {} WHERE {} = '{}'".format(datasheet, field, data))
-        LogData = cursor.fetchone()  # 取出了数据库数据
-        # 关闭游标和连接
-        cursor.close()
-        conn.close()
+        write_behind.flush("mysql", (database, datasheet))    # 先写入队列中这张数据表尚未写入的数据
+        LogData = self.mysql_execute("SELECT * FROM {} WHERE {} = '{}'".format(datasheet, field, data),
+                                     database=database, fetch="one")  # 取出了数据库数据
         return LogData
 
     def text_save(self, content, filename, mode='a'):
@@ -303,8 +403,17 @@ class __Storage:
         :param mode:
         :return:
         """
+        write_behind.put("text", (filename, mode), content)
+
+    def __write_texts(self, key, contents):
+        filename, mode = key
+        if mode == 'w':     # 覆盖写入时只有最后一次写入的内容会保留
+            contents = contents[-1:]
         with open(filename, mode=mode, encoding="utf-8") as file:
-            file.write(content + '\n')
+            file.write("".join(content + '\n' for content in contents))
+            if write_behind.need_fsync(filename, len(contents)):
+                file.flush()
+                os.fsync(file.fileno())
 
     def text_read(self, filename):
         """
@@ -312,6 +421,7 @@ class __Storage:
         :param filename: 文件路径、文件名称。
         :return:返回一个包含所有文件内容的列表，其中元素均为string格式
         """
+        write_behind.flush("text", (filename,))
         with open(filename, encoding="utf-8") as file:
             content = file.readlines()
         for i in range(len(content)):
@@ -320,20 +430,57 @@ class __Storage:
         return content
 
 
+    def mongodb_client(self):
+        """
+        进程内共用的MongoClient，第一次使用时创建并验证身份，之后各线程共用其连接池
+        连接池大小为配置文件中MONGODB的pool_size，默认为100
+        """
+        with self.__mongodb_lock:
+            if self.__mongodb_client is None:
+                options = {"maxPoolSize": getattr(config, "mongodb_pool_size", 100)}
+                if config.mongodb_authorization == "enabled":  # 如果启用了授权验证
+                    options.update(username=config.mongodb_user_name, password=config.mongodb_password,
+                                   authMechanism='SCRAM-SHA-1')
+                self.__mongodb_client = pymongo.MongoClient(host='localhost', port=27017, **options)
+        return self.__mongodb_client
+
+    def mongodb_recorder(self, database, collection):
+        """
+        获取某个集合的批量记录器（见purequant.recorder），用于websocket行情等高频数据，同一集合共用一个记录器
+        批量大小、写入间隔、写入确认选项与缓存上限为配置文件中MONGODB的batch_size、flush_interval、write_concern与max_buffer
+        :return: MongoRecorder，调用record(文档)记录数据
+        """
+        key = (database, collection)
+        with self.__mongodb_lock:
+            recorder = self.__mongodb_recorders.get(key)
+        if recorder is None:
+            recorder = MongoRecorder(self.mongodb_client()[database][collection],
+                                     batch_size=getattr(config, "mongodb_batch_size", 1000),
+                                     interval=getattr(config, "mongodb_flush_interval", 1.0),
+                                     write_concern=getattr(config, "mongodb_write_concern", None),
+                                     max_buffer=getattr(config, "mongodb_max_buffer", 100000))
+            with self.__mongodb_lock:
+                recorder = self.__mongodb_recorders.setdefault(key, recorder)
+        return recorder
+
     def mongodb_save(self, database, collection, data):
-        """保存数据至mongodb"""
-        client = pymongo.MongoClient(host='localhost', port=27017)
-        if config.mongodb_authorization == "enabled":   # 如果启用了授权验证
-            client.admin.authenticate(config.mongodb_user_name, config.mongodb_password, mechanism='SCRAM-SHA-1')
+        """保存数据至mongodb，异步写入时放入队列后立即返回"""
+        write_behind.put("mongodb", (database, collection), data)
+
+    def __write_mongodb(self, key, documents):
+        database, collection = key
+        client = self.mongodb_client()
         db = client[database]
         col = db[collection]
-        col.insert_one(data)
+        col.insert_many(documents)
 
     def mongodb_read_data(self, database, collection):
         """读取mongodb数据库中某集合中的所有数据，并保存至一个列表中"""
-        client = pymongo.MongoClient(host='localhost', port=27017)
-        if config.mongodb_authorization == "enabled":  # 如果启用了授权验证
-            client.admin.authenticate(config.mongodb_user_name, config.mongodb_password, mechanism='SCRAM-SHA-1')
+        write_behind.flush("mongodb", (database, collection))
+        recorder = self.__mongodb_recorders.get((database, collection))
+        if recorder is not None:    # 先写入记录器中缓存的数据
+            recorder.flush()
+        client = self.mongodb_client()
         db = client[database]
         col = db[collection]
         datalist = []
@@ -343,9 +490,7 @@ class __Storage:
 
     def export_mongodb_to_csv(self, database, collection, csv_file_path):
         """导出mongodb集合中的数据至csv文件"""
-        client = pymongo.MongoClient(host='localhost', port=27017)
-        if config.mongodb_authorization == "enabled":  # 如果启用了授权验证
-            client.admin.authenticate(config.mongodb_user_name, config.mongodb_password, mechanism='SCRAM-SHA-1')
+        client = self.mongodb_client()
         db = client[database]
         sheet_table = db[collection]
         df1 = pd.DataFrame(list(sheet_table.find()))
@@ -355,43 +500,8 @@ class __Storage:
     def mysql_save_okex_spot_accounts(self, database, data_sheet, currency, balance, frozen, available, timestamp=None):
         """存储okex现货账户信息至mysql数据库"""
         timestamp = timestamp if timestamp is not None else time.get_localtime()   # 默认是自动填充本地时间，也可以传入*****来做数据分割
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:  # 如果数据表不存在就创建
-            cursor2.execute("CREATE TABLE {} (时间 TEXT, 币种 TEXT, 余额 TEXT, 冻结 TEXT, 可用 TEXT)".format(data_sheet))
-        # 插入新数据
-        cursor2.execute(
-            'insert into {} (时间, 币种, 余额, 冻结, 可用) values (%s, %s, %s, %s, %s)'.format(
-                data_sheet),
-            [timestamp, currency, balance, frozen, available])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "时间 TEXT, 币种 TEXT, 余额 TEXT, 冻结 TEXT, 可用 TEXT", 'insert into {} (时间, 币种, 余额, 冻结, 可用) values (%s, %s, %s, %s, %s)'.format(data_sheet), [timestamp, currency, balance, frozen, available])
 
     def mysql_save_okex_fixedfutures_accounts(self, database, data_sheet, symbol, currency, margin_mode,
                                                                 equity, fixed_balance, available_qty, margin_frozen,
@@ -400,150 +510,35 @@ class __Storage:
                                                                 can_withdraw, timestamp=None):
         """存储okex逐仓模式交割合约账户信息至mysql数据库"""
         timestamp = timestamp if timestamp is not None else time.get_localtime()   # 默认是自动填充本地时间，也可以传入*****来做数据分割
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:  # 如果数据表不存在就创建
-            cursor2.execute("CREATE TABLE {} (时间 TEXT, 币对 TEXT, 余额币种 TEXT, 账户类型 TEXT, 账户权益 TEXT, 逐仓账户余额 TEXT, 逐仓可用余额 TEXT, 持仓已用保证金 TEXT, 挂单冻结保证金 TEXT, 已实现盈亏 TEXT, 未实现盈亏 TEXT, 账户静态权益 TEXT, 是否自动追加保证金 TEXT, 强平模式 TEXT, 可划转数量 TEXT)".format(data_sheet))
-        # 插入新数据
-        cursor2.execute(
-            'insert into {} (时间, 币对, 余额币种, 账户类型, 账户权益, 逐仓账户余额, 逐仓可用余额, 持仓已用保证金, 挂单冻结保证金, 已实现盈亏, 未实现盈亏, 账户静态权益, 是否自动追加保证金, 强平模式, 可划转数量) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(
-                data_sheet),
-            [timestamp, symbol, currency, margin_mode, equity, fixed_balance, available_qty, margin_frozen,
-             margin_for_unfilled, realized_pnl, unrealized_pnl, total_avail_balance, auto_margin, liqui_mode, can_withdraw])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "时间 TEXT, 币对 TEXT, 余额币种 TEXT, 账户类型 TEXT, 账户权益 TEXT, 逐仓账户余额 TEXT, 逐仓可用余额 TEXT, 持仓已用保证金 TEXT, 挂单冻结保证金 TEXT, 已实现盈亏 TEXT, 未实现盈亏 TEXT, 账户静态权益 TEXT, 是否自动追加保证金 TEXT, 强平模式 TEXT, 可划转数量 TEXT", 'insert into {} (时间, 币对, 余额币种, 账户类型, 账户权益, 逐仓账户余额, 逐仓可用余额, 持仓已用保证金, 挂单冻结保证金, 已实现盈亏, 未实现盈亏, 账户静态权益, 是否自动追加保证金, 强平模式, 可划转数量) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(data_sheet), [timestamp, symbol, currency, margin_mode, equity, fixed_balance, available_qty, margin_frozen, margin_for_unfilled, realized_pnl, unrealized_pnl, total_avail_balance, auto_margin, liqui_mode, can_withdraw])
 
     def mysql_save_okex_crossedfutures_accounts(self, database, data_sheet, symbol, currency, margin_mode, equity, total_avail_balance, margin,
                                                 margin_frozen, margin_for_unfilled, realized_pnl, unrealized_pnl, margin_ratio, maint_margin_ratio,
                                                 liqui_mode, can_withdraw, liqui_fee_rate, timestamp=None):
         """存储okex全仓模式交割合约账户信息至mysql数据库"""
         timestamp = timestamp if timestamp is not None else time.get_localtime()   # 默认是自动填充本地时间，也可以传入*****来做数据分割
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:  # 如果数据表不存在就创建
-            cursor2.execute("CREATE TABLE {} (时间 TEXT, 币对 TEXT, 余额币种 TEXT, 账户类型 TEXT, 账户权益 TEXT, 账户余额 TEXT, 保证金 TEXT, 持仓已用保证金 TEXT, 挂单冻结保证金 TEXT, 已实现盈亏 TEXT, 未实现盈亏 TEXT, 保证金率 TEXT, 维持保证金率 TEXT, 强平模式 TEXT, 可划转数量 TEXT, 强平手续费 TEXT)".format(data_sheet))
-        # 插入新数据
-        cursor2.execute(
-            'insert into {} (时间, 币对, 余额币种, 账户类型, 账户权益, 账户余额, 保证金, 持仓已用保证金, 挂单冻结保证金, 已实现盈亏, 未实现盈亏, 保证金率, 维持保证金率, 强平模式, 可划转数量, 强平手续费) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(
-                data_sheet),
-            [timestamp, symbol, currency, margin_mode, equity, total_avail_balance, margin,
-                                                margin_frozen, margin_for_unfilled, realized_pnl, unrealized_pnl, margin_ratio, maint_margin_ratio,
-                                                liqui_mode, can_withdraw, liqui_fee_rate])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "时间 TEXT, 币对 TEXT, 余额币种 TEXT, 账户类型 TEXT, 账户权益 TEXT, 账户余额 TEXT, 保证金 TEXT, 持仓已用保证金 TEXT, 挂单冻结保证金 TEXT, 已实现盈亏 TEXT, 未实现盈亏 TEXT, 保证金率 TEXT, 维持保证金率 TEXT, 强平模式 TEXT, 可划转数量 TEXT, 强平手续费 TEXT", 'insert into {} (时间, 币对, 余额币种, 账户类型, 账户权益, 账户余额, 保证金, 持仓已用保证金, 挂单冻结保证金, 已实现盈亏, 未实现盈亏, 保证金率, 维持保证金率, 强平模式, 可划转数量, 强平手续费) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(data_sheet), [timestamp, symbol, currency, margin_mode, equity, total_avail_balance, margin, margin_frozen, margin_for_unfilled, realized_pnl, unrealized_pnl, margin_ratio, maint_margin_ratio, liqui_mode, can_withdraw, liqui_fee_rate])
 
     def mysql_save_okex_swap_accounts(self, database, data_sheet, timestamp, symbol, currency, margin_mode, equity, total_avail_balance, fixed_balance, margin, margin_frozen, realized_pnl, unrealized_pnl, margin_ratio, maint_margin_ratio, max_withdraw):
         """存储okex全仓模式交割合约账户信息至mysql数据库"""
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:  # 如果数据表不存在就创建
-            cursor2.execute("CREATE TABLE {} (时间 TEXT, 币对 TEXT, 余额币种 TEXT, 账户类型 TEXT, 账户权益 TEXT, 账户余额 TEXT, 逐仓账户余额 TEXT, 持仓已用保证金 TEXT, 挂单冻结保证金 TEXT, 已实现盈亏 TEXT, 未实现盈亏 TEXT, 保证金率 TEXT, 维持保证金率 TEXT, 可划转数量 TEXT)".format(data_sheet))
-        # 插入新数据
-        cursor2.execute(
-            'insert into {} (时间, 币对, 余额币种, 账户类型, 账户权益, 账户余额, 逐仓账户余额, 持仓已用保证金, 挂单冻结保证金, 已实现盈亏, 未实现盈亏, 保证金率, 维持保证金率, 可划转数量) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(
-                data_sheet),
-            [timestamp, symbol, currency, margin_mode, equity, total_avail_balance, fixed_balance, margin, margin_frozen, realized_pnl, unrealized_pnl, margin_ratio, maint_margin_ratio, max_withdraw])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "时间 TEXT, 币对 TEXT, 余额币种 TEXT, 账户类型 TEXT, 账户权益 TEXT, 账户余额 TEXT, 逐仓账户余额 TEXT, 持仓已用保证金 TEXT, 挂单冻结保证金 TEXT, 已实现盈亏 TEXT, 未实现盈亏 TEXT, 保证金率 TEXT, 维持保证金率 TEXT, 可划转数量 TEXT", 'insert into {} (时间, 币对, 余额币种, 账户类型, 账户权益, 账户余额, 逐仓账户余额, 持仓已用保证金, 挂单冻结保证金, 已实现盈亏, 未实现盈亏, 保证金率, 维持保证金率, 可划转数量) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(data_sheet), [timestamp, symbol, currency, margin_mode, equity, total_avail_balance, fixed_balance, margin, margin_frozen, realized_pnl, unrealized_pnl, margin_ratio, maint_margin_ratio, max_withdraw])
 
     def delete_mysql_database(self, database):
         """删除mysql中的数据库"""
-        # 连接数据库
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn = mysql.connector.connect(user=user, password=password)
-        cursor = conn.cursor()
         # 删除数据库
-        sql = "DROP DATABASE IF EXISTS {}".format(database)
-        cursor.execute(sql)
-        # 保存更改并关闭连接
-        conn.commit()
-        cursor.close()
-        conn.close()
+        self.mysql_execute("DROP DATABASE IF EXISTS {}".format(database))
+        self.close_mysql_pools(database)  # 连接池中的连接仍指向已删除的数据库
+        self.__mysql_forget_schemas(database)
+        self.__forget_run_infos(self.__ledgers, database)     # 尚未写入的回测数据随数据库一起删除
+        for key in [key for key in self.__mysql_kline_keys if key[0] == database]:
+            del self.__mysql_kline_keys[key]
 
     def delete_mongodb_database(self, database):
         """删除mongodb的数据库"""
-        client = pymongo.MongoClient(host='localhost', port=27017)
-        if config.mongodb_authorization == "enabled":  # 如果启用了授权验证
-            client.admin.authenticate(config.mongodb_user_name, config.mongodb_password, mechanism='SCRAM-SHA-1')
+        client = self.mongodb_client()
         db = client[database]
         db.command("dropDatabase")
 
@@ -565,57 +560,157 @@ class __Storage:
         :param total_asset: 当前总资金
         :return:
         """
-        # 检查数据库是否存在，如不存在则创建
-        user = config.mysql_user_name if config.mysql_authorization == "enabled" else 'root'
-        password = config.mysql_password if config.mysql_authorization == "enabled" else 'root'
-        conn1 = mysql.connector.connect(user=user, password=password)
-        cursor1 = conn1.cursor()
-        cursor1.execute("SHOW DATABASES")
-        list1 = []
-        for item in cursor1:
-            for x in item:
-                list1.append(x)
-        if database in list1:
-            pass
-        else:
-            cursor1.execute("CREATE DATABASE {}".format(database))
-        conn1.commit()
-        cursor1.close()
-        conn1.close()
-        # 检查数据表是否存在，如不存在则创建
-        conn2 = mysql.connector.connect(user=user, password=password, database=database)
-        cursor2 = conn2.cursor()
-        cursor2.execute("SHOW TABLES")
-        list2 = []
-        for item in cursor2:
-            for x in item:
-                list2.append(x)
-        if data_sheet in list2:
-            pass
-        else:  # 如果数据表不存在就创建
-            cursor2.execute(
-                "CREATE TABLE {} (时间 TEXT, 类型 TEXT, 价格 FLOAT, 数量 FLOAT, 成交金额 FLOAT, 当前持仓价格 FLOAT, 当前持仓方向 TEXT, 当前持仓数量 FLOAT, 此次盈亏 FLOAT, 总盈亏 FLOAT, 总资金 FLOAT)".format(data_sheet))
-        # 插入新数据
-        cursor2.execute(
+        row = (timestamp, action, price, amount, turnover, hold_price, hold_direction, hold_amount, profit, total_profit, total_asset)
+        if total_asset > 0:
+            self.__last_run_infos[(database, data_sheet)] = row
+        if config.backtest == "enabled":    # 回测模式下先保存在内存中，回测结束时批量写入
+            self.__ledger_append(database, data_sheet, list(row))
+            return
+        # 插入数据，第一次写入该数据表时创建数据库与数据表；异步写入时放入队列后立即返回
+        self.__mysql_insert_later(database, data_sheet, "时间 TEXT, 类型 TEXT, 价格 FLOAT, 数量 FLOAT, 成交金额 FLOAT, 当前持仓价格 FLOAT, 当前持仓方向 TEXT, 当前持仓数量 FLOAT, 此次盈亏 FLOAT, 总盈亏 FLOAT, 总资金 FLOAT", 'insert into {} (时间, 类型, 价格, 数量, 成交金额, 当前持仓价格, 当前持仓方向, 当前持仓数量, 此次盈亏, 总盈亏, 总资金) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(data_sheet), [timestamp, action, price, amount, turnover, hold_price, hold_direction, hold_amount, profit, total_profit, total_asset])
+
+
+    def last_strategy_run_info(self, database, data_sheet):
+        """
+        获取策略运行信息数据表中总资金大于0的最后一行，与read_mysql_datas(0, database, data_sheet, "总资金", ">")[-1]相同
+        每次调用mysql_save_strategy_run_info时更新，只在第一次获取且此前未保存过数据时读取数据库
+        :param database: 数据库名称
+        :param data_sheet: 数据表名称
+        :return: 元组，字段顺序与数据表一致
+        """
+        key = (database, data_sheet)
+        if key not in self.__last_run_infos:
+            self.__last_run_infos[key] = self.read_mysql_datas(0, database, data_sheet, "总资金", ">")[-1]
+        return self.__last_run_infos[key]
+
+    def mysql_save_strategy_run_infos(self, database, data_sheet, rows):
+        """
+        批量保存策略运行信息到mysql数据库中，用一条executemany语句写入
+        :param database: 数据库名称
+        :param data_sheet: 数据表名称
+        :param rows: 列表，每一行的字段与mysql_save_strategy_run_info的参数顺序一致
+        :return:
+        """
+        self.mysql_insert(database, data_sheet, "时间 TEXT, 类型 TEXT, 价格 FLOAT, 数量 FLOAT, 成交金额 FLOAT, 当前持仓价格 FLOAT, 当前持仓方向 TEXT, 当前持仓数量 FLOAT, 此次盈亏 FLOAT, 总盈亏 FLOAT, 总资金 FLOAT",
             'insert into {} (时间, 类型, 价格, 数量, 成交金额, 当前持仓价格, 当前持仓方向, 当前持仓数量, 此次盈亏, 总盈亏, 总资金) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'.format(data_sheet),
-            [timestamp, action, price, amount, turnover, hold_price, hold_direction, hold_amount, profit, total_profit, total_asset])
-        conn2.commit()
-        cursor2.close()
-        conn2.close()
+            rows, many=True)
+
+    def sqlite_save_strategy_run_infos(self, database, data_sheet, rows):
+        """批量保存策略运行信息到SQLite数据库文件中，文件名为数据库名称"""
+        conn = sqlite3.connect(os.path.join(getattr(config, "ledger_path", "."), "{}.db".format(database)))
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS "{}" (时间 TEXT, 类型 TEXT, 价格 REAL, 数量 REAL, 成交金额 REAL, 当前持仓价格 REAL, 当前持仓方向 TEXT, 当前持仓数量 REAL, 此次盈亏 REAL, 总盈亏 REAL, 总资金 REAL)'.format(data_sheet))
+        conn.executemany('insert into "{}" values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(data_sheet), rows)
+        conn.commit()
+        conn.close()
+
+    def parquet_save_strategy_run_infos(self, database, data_sheet, rows):
+        """批量保存策略运行信息到Parquet文件中，文件名为"数据库名称_数据表名称.parquet"，已存在时追加"""
+        path = os.path.join(getattr(config, "ledger_path", "."), "{}_{}.parquet".format(database, data_sheet))
+        df = pd.DataFrame(rows, columns=list(RUN_INFO_FIELDS))
+        if os.path.exists(path):
+            df = pd.concat([pd.read_parquet(path), df], ignore_index=True)
+        df.to_parquet(path, index=False)
+
+    def __ledger_append(self, database, data_sheet, row):
+        ledger = self.__ledgers.get((database, data_sheet))
+        if ledger is None:
+            ledger = self.__ledgers[(database, data_sheet)] = Ledger()
+        ledger.append(row)
+        flush_rows = getattr(config, "ledger_flush_rows", 0)
+        if flush_rows and len(ledger) - ledger.flushed >= flush_rows:
+            self.flush_ledgers(database, data_sheet)
+
+    def ledger(self, database, data_sheet):
+        """获取回测时保存在内存中的策略运行信息（Ledger），没有时返回None"""
+        return self.__ledgers.get((database, data_sheet))
+
+    def flush_ledgers(self, database=None, data_sheet=None):
+        """
+        将回测时保存在内存中的策略运行信息批量写入配置文件中指定的数据库，程序退出时会自动调用
+        :param database: 数据库名称，不传入时写入全部数据表
+        :param data_sheet: 数据表名称
+        :return:
+        """
+        sink = getattr(config, "ledger_sink", "mysql")
+        for (db, sheet), ledger in list(self.__ledgers.items()):
+            if database is not None and (db, sheet) != (database, data_sheet):
+                continue
+            rows = ledger.pending()
+            if not rows:
+                continue
+            if sink == "sqlite":
+                self.sqlite_save_strategy_run_infos(db, sheet, rows)
+            elif sink == "parquet":
+                self.parquet_save_strategy_run_infos(db, sheet, rows)
+            else:
+                self.mysql_save_strategy_run_infos(db, sheet, rows)
+            ledger.flushed = len(ledger)
 
+    def reset_ledgers(self, database=None, data_sheet=None):
+        """
+        结束一次回测：写入尚未保存的回测数据，再清除内存中的策略运行信息与last_strategy_run_info的缓存，
+        同一进程中的下一次回测（如进程池中同一子进程回测的下一组参数）不会读到上一次回测的持仓与资金
+        :param database: 数据库名称，不传入时清除全部数据表
+        :param data_sheet: 数据表名称，不传入时清除该数据库中的全部数据表
+        """
+        for (db, sheet) in list(self.__ledgers):
+            if database is None or (db == database and (data_sheet is None or sheet == data_sheet)):
+                self.flush_ledgers(db, sheet)
+        self.__forget_run_infos(self.__ledgers, database, data_sheet)
+        self.__forget_run_infos(self.__last_run_infos, database, data_sheet)
 
     def read_purequant_server_datas(self, datasheet):  # 获取数据库满足条件的数据
-        # 连接数据库
-        user = 'purequant'
-        password = '^C_U7TN.,+,KoV#W:Z_!'
-        conn = mysql.connector.connect(host="118.193.32.198", user=user, password=password, database="kline", buffered=True)
-        cursor = conn.cursor()
-        # 打开游标
-        cursor.execute("SELECT * FROM {} WHERE {} {} '{}'".format(datasheet, "open", ">", 0))
-        LogData = cursor.fetchall()  # 取出了数据库数据
-        # 关闭游标和连接
-        cursor.close()
-        conn.close()
+        LogData = self.mysql_execute("SELECT * FROM {} WHERE {} {} '{}'".format(datasheet, "open", ">", 0),
+                                     database="kline", fetch="all", **PUREQUANT_SERVER)  # 取出了数据库数据
         return LogData
 
+    def read_history_klines(self, datasheet):
+        """
+        读取回测用的历史k线数据，本地历史k线数据文件（见purequant.history）中有该数据时直接用内存映射读取，否则从PureQuant服务器读取
+        :param datasheet: 数据表名称，如"ltc_1d"
+        :return: 按时间先后排列的KlineFrame
+        """
+        if history_store.exists(datasheet):
+            return history_store.load(datasheet)
+        return KlineFrame.from_records(self.read_purequant_server_datas(datasheet))
+
+    def import_mysql_klines(self, name, database, data_sheet=None, host="localhost", user=None, password=None, batch=100000):
+        """
+        将mysql数据库中的k线数据表导入本地历史k线数据文件（见purequant.history），分批读取，不会一次取出整张表
+        :param name: 本地数据名称，如"ltc_1d"
+        :param database: 数据库名称
+        :param data_sheet: 数据表名称，默认与name相同，每一行为(时间, 开, 高, 低, 收, 成交量, ...)，如kline_storage保存的数据表
+        :param host: 数据库地址
+        :param user: 用户名，默认与其他mysql操作相同
+        :param password: 密码
+        :param batch: 每批读取的行数
+        :return: 保存后的k线数量
+        """
+        if user is None:
+            user, password = self.__mysql_user()
+
+        def read(conn):
+            cursor = conn.cursor()  # 非缓冲游标，用fetchmany分批取出
+            cursor.execute("SELECT * FROM {}".format(data_sheet or name))
+            frames = []
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                frames.append(KlineFrame.from_records(rows))
+            cursor.close()
+            return frames
+
+        frames = self.mysql_pool(database, host=host, user=user, password=password).run(read, retry=True)
+        return history_store.write(name, concatenate(frames))
+
+    def import_purequant_server_klines(self, datasheet, batch=100000):
+        """
+        将PureQuant服务器上的历史k线数据下载到本地历史k线数据文件，之后回测时用history_store.load读取，不再需要连接服务器
+        :param datasheet: 数据表名称，如"ltc_1d"，同时作为本地数据名称
+        :return: 保存后的k线数量
+        """
+        return self.import_mysql_klines(datasheet, "kline", datasheet, batch=batch, **PUREQUANT_SERVER)
+
 storage = __Storage()
\ No newline at end of file
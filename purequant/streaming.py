@@ -0,0 +1,355 @@
+# -*- coding:utf-8 -*-
+
+"""
+增量指标引擎
+
+每个指标保存滚动状态（滑动窗口累加和、EMA状态、Wilder平滑、Welford方差），
+新增一根k线或最新一根k线的价格变动时只需O(1)的计算量即可得到最新的指标值。
+在相同的k线历史上，预热期之后的结果与TA-Lib的计算结果一致。
+"""
+
+import math
+from collections import deque
+import numpy as np
+
+
+class _ValueBuffer:
+    """按需扩容的指标值数组，追加与替换最后一个值均为O(1)"""
+
+    def __init__(self, outputs, capacity=256):
+        self.__array = np.full((capacity, outputs), np.nan)
+        self.__length = 0
+
+    def __len__(self):
+        return self.__length
+
+    def append(self, value):
+        if self.__length == len(self.__array):
+            array = np.full((len(self.__array) * 2, self.__array.shape[1]), np.nan)
+            array[:self.__length] = self.__array[:self.__length]
+            self.__array = array
+        self.__array[self.__length] = value
+        self.__length += 1
+
+    def replace(self, value):
+        self.__array[self.__length - 1] = value
+
+    def column(self, index):
+        view = self.__array[:self.__length, index]
+        view.flags.writeable = False
+        return view
+
+
+class _RollingWindow:
+    """
+    固定长度的滑动窗口，维护窗口内的累加和以及Welford均值与方差
+    每滑动一整个窗口重新精确计算一次，避免长时间运行后的累计误差
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = deque()
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.__pushes = 0
+        self.__run = 0   # 窗口末尾连续相同值的个数
+
+    def full(self):
+        return len(self.items) == self.size
+
+    def push(self, value):
+        if self.size == 0:
+            return
+        if self.full():
+            removed = self.items.popleft()
+            self.total -= removed
+            count = len(self.items)
+            if count == 0:
+                self.mean = 0.0
+                self.m2 = 0.0
+            else:
+                delta = removed - self.mean
+                self.mean -= delta / count
+                self.m2 -= delta * (removed - self.mean)
+        self.__run = self.__run + 1 if self.items and value == self.items[-1] else 1
+        self.items.append(value)
+        self.total += value
+        count = len(self.items)
+        delta = value - self.mean
+        self.mean += delta / count
+        self.m2 += delta * (value - self.mean)
+        self.__pushes += 1
+        if self.__pushes % self.size == 0:
+            self.__resync()
+
+    def __resync(self):
+        self.total = math.fsum(self.items)
+        self.mean = self.total / len(self.items)
+        self.m2 = math.fsum((item - self.mean) ** 2 for item in self.items)
+
+    def variance_with(self, value):
+        """窗口再加入value后的总体方差，不改变窗口本身"""
+        if self.__run >= len(self.items) and (not self.items or value == self.items[-1]):  # 窗口内的值全部相同
+            return 0.0
+        count = len(self.items) + 1
+        delta = value - self.mean
+        mean = self.mean + delta / count
+        m2 = self.m2 + delta * (value - mean)
+        return max(m2 / count, 0.0)
+
+
+class StreamingIndicator:
+    """
+    增量指标基类
+    子类实现_value(bar)：根据已收盘k线的状态与当前k线计算指标值，不修改状态；
+    以及_push(bar)：当前k线收盘后将其并入状态。
+    """
+
+    outputs = 1
+
+    def __init__(self):
+        self.__values = _ValueBuffer(self.outputs)
+        self.__bar = None
+        self.last_timestamp = None
+
+    def update(self, timestamp, open, high, low, close, volume):
+        """
+        输入一根k线，时间戳与上一次相同时视为最新一根k线的价格变动，否则视为新的一根k线
+        :return: 最新的指标值
+        """
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:    # 忽略更早的k线
+            return self.last
+        bar = (open, high, low, close, volume)
+        if timestamp == self.last_timestamp:
+            value = self._value(bar)
+            self.__values.replace(value)
+        else:
+            if self.__bar is not None:  # 上一根k线已收盘
+                self._push(self.__bar)
+            value = self._value(bar)
+            self.__values.append(value)
+            self.last_timestamp = timestamp
+        self.__bar = bar
+        return value
+
+    def feed(self, frame):
+        """
+        输入KlineFrame，只处理时间戳不早于上一次输入的k线
+        :param frame: KlineFrame
+        :return: 与frame等长的指标值数组（只读视图），多个输出时返回元组
+        """
+        start = 0
+        if self.last_timestamp is not None:
+            start = int(np.searchsorted(frame.timestamp, self.last_timestamp, side="left"))
+        for i in range(start, len(frame)):
+            self.update(int(frame.timestamp[i]), frame.open[i], frame.high[i], frame.low[i],
+                        frame.close[i], frame.volume[i])
+        return self.values(len(frame))
+
+    def values(self, length=None):
+        """返回最近length个指标值，默认返回全部"""
+        length = len(self.__values) if length is None else min(length, len(self.__values))
+        columns = tuple(self.__values.column(i)[len(self.__values) - length:] for i in range(self.outputs))
+        return columns[0] if self.outputs == 1 else columns
+
+    @property
+    def last(self):
+        if len(self.__values) == 0:
+            return None
+        values = self.values(1)
+        return values[0] if self.outputs == 1 else tuple(column[0] for column in values)
+
+    def _value(self, bar):
+        raise NotImplementedError
+
+    def _push(self, bar):
+        raise NotImplementedError
+
+
+class SMA(StreamingIndicator):
+    """简单移动平均，对应talib.SMA"""
+
+    def __init__(self, timeperiod):
+        super().__init__()
+        self.timeperiod = timeperiod
+        self.__window = _RollingWindow(timeperiod - 1)
+
+    def _value(self, bar):
+        if not self.__window.full():
+            return np.nan
+        return (self.__window.total + bar[3]) / self.timeperiod
+
+    def _push(self, bar):
+        self.__window.push(bar[3])
+
+
+class EMA(StreamingIndicator):
+    """指数移动平均，以前timeperiod根k线的简单平均作为初始值，对应talib.EMA"""
+
+    def __init__(self, timeperiod):
+        super().__init__()
+        self.timeperiod = timeperiod
+        self.__k = 2.0 / (timeperiod + 1)
+        self.__count = 0    # 已收盘k线数量
+        self.__seed = 0.0
+        self.__ema = None
+
+    def _value(self, bar):
+        close = bar[3]
+        if self.__ema is not None:
+            return (close - self.__ema) * self.__k + self.__ema
+        if self.__count == self.timeperiod - 1:
+            return (self.__seed + close) / self.timeperiod
+        return np.nan
+
+    def _push(self, bar):
+        value = self._value(bar)
+        self.__count += 1
+        if self.__ema is None and self.__count < self.timeperiod:
+            self.__seed += bar[3]
+        else:
+            self.__ema = value
+
+
+class ATR(StreamingIndicator):
+    """平均真实波幅，Wilder平滑，对应talib.ATR"""
+
+    def __init__(self, timeperiod):
+        super().__init__()
+        self.timeperiod = timeperiod
+        self.__prev_close = None
+        self.__count = 0    # 已收盘k线的真实波幅数量
+        self.__total = 0.0
+        self.__atr = None
+
+    def __true_range(self, bar):
+        high, low = bar[1], bar[2]
+        return max(high - low, abs(high - self.__prev_close), abs(low - self.__prev_close))
+
+    def _value(self, bar):
+        if self.__prev_close is None:
+            return np.nan
+        true_range = self.__true_range(bar)
+        if self.timeperiod == 1:
+            return true_range
+        if self.__atr is not None:
+            return (self.__atr * (self.timeperiod - 1) + true_range) / self.timeperiod
+        if self.__count == self.timeperiod - 1:
+            return (self.__total + true_range) / self.timeperiod
+        return np.nan
+
+    def _push(self, bar):
+        if self.__prev_close is not None:
+            value = self._value(bar)
+            self.__count += 1
+            if self.__count < self.timeperiod:
+                self.__total += self.__true_range(bar)
+            else:
+                self.__atr = value
+        self.__prev_close = bar[3]
+
+
+class RSI(StreamingIndicator):
+    """相对强弱指标，Wilder平滑，对应talib.RSI"""
+
+    def __init__(self, timeperiod):
+        super().__init__()
+        self.timeperiod = timeperiod
+        self.__prev_close = None
+        self.__count = 0    # 已收盘k线的涨跌幅数量
+        self.__gain = 0.0
+        self.__loss = 0.0
+
+    def __state(self, bar):
+        """返回并入当前k线后的平均涨幅与平均跌幅，预热期内返回累计涨跌幅"""
+        diff = bar[3] - self.__prev_close
+        gain = diff if diff > 0 else 0.0
+        loss = -diff if diff < 0 else 0.0
+        count = self.__count + 1
+        if count < self.timeperiod:
+            return self.__gain + gain, self.__loss + loss
+        if count == self.timeperiod:
+            return (self.__gain + gain) / self.timeperiod, (self.__loss + loss) / self.timeperiod
+        return ((self.__gain * (self.timeperiod - 1) + gain) / self.timeperiod,
+                (self.__loss * (self.timeperiod - 1) + loss) / self.timeperiod)
+
+    def _value(self, bar):
+        if self.__prev_close is None or self.__count + 1 < self.timeperiod:
+            return np.nan
+        gain, loss = self.__state(bar)
+        if gain == 0 and loss == 0:     # 与TA-Lib一致，横盘很久后两者都很小时仍按比值计算
+            return 0.0
+        return 100 * (gain / (gain + loss))
+
+    def _push(self, bar):
+        if self.__prev_close is not None:
+            self.__gain, self.__loss = self.__state(bar)
+            self.__count += 1
+        self.__prev_close = bar[3]
+
+
+class STDDEV(StreamingIndicator):
+    """总体标准差，Welford方差，对应talib.STDDEV"""
+
+    def __init__(self, timeperiod, nbdev=1):
+        super().__init__()
+        self.timeperiod = timeperiod
+        self.nbdev = nbdev
+        self.__window = _RollingWindow(timeperiod - 1)
+
+    def _value(self, bar):
+        if not self.__window.full():
+            return np.nan
+        variance = self.__window.variance_with(bar[3])
+        return 0.0 if variance < 0.00000000000001 else math.sqrt(variance) * self.nbdev
+
+    def _push(self, bar):
+        self.__window.push(bar[3])
+
+
+class BBANDS(StreamingIndicator):
+    """布林带，中轨为简单移动平均，输出(上轨, 中轨, 下轨)，对应talib.BBANDS(matype=0)"""
+
+    outputs = 3
+
+    def __init__(self, timeperiod, nbdevup=2, nbdevdn=2):
+        super().__init__()
+        self.timeperiod = timeperiod
+        self.nbdevup = nbdevup
+        self.nbdevdn = nbdevdn
+        self.__window = _RollingWindow(timeperiod - 1)
+
+    def _value(self, bar):
+        if not self.__window.full():
+            return (np.nan, np.nan, np.nan)
+        middle = (self.__window.total + bar[3]) / self.timeperiod
+        variance = self.__window.variance_with(bar[3])
+        deviation = 0.0 if variance < 0.00000000000001 else math.sqrt(variance)
+        return (middle + deviation * self.nbdevup, middle, middle - deviation * self.nbdevdn)
+
+    def _push(self, bar):
+        self.__window.push(bar[3])
+
+
+class OBV(StreamingIndicator):
+    """能量潮，对应talib.OBV"""
+
+    def __init__(self):
+        super().__init__()
+        self.__prev_close = None
+        self.__obv = None
+
+    def _value(self, bar):
+        close, volume = bar[3], bar[4]
+        if self.__prev_close is None:
+            return volume
+        if close > self.__prev_close:
+            return self.__obv + volume
+        if close < self.__prev_close:
+            return self.__obv - volume
+        return self.__obv
+
+    def _push(self, bar):
+        self.__obv = self._value(bar)
+        self.__prev_close = bar[3]
@@ -0,0 +1,169 @@
+# -*- coding:utf-8 -*-
+
+"""
+参数优化
+
+sweep将历史k线数据只加载一次并放入共享内存，再用进程池并行回测全部参数组合，
+子进程直接映射共享内存中的k线数据，不再各自读取或复制一份。
+结果按参数组合的顺序返回，与进程数和各组合的完成先后无关。
+子进程启动时丢弃从父进程复制来的mysql连接池、MongoClient、回测数据与异步写入队列，用到时在子进程中重新创建。
+
+回测函数需定义在模块顶层（子进程需要按名称找到它），第一个参数为KlineFrame，其余为参数组合中的关键字参数，
+返回一个字典，如{"总资金": 1200, "总盈亏": 200}，字典中的各项作为结果表中的列。
+"""
+
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from purequant.kline import KlineFrame
+from purequant.storage import storage
+from purequant.writebehind import write_behind
+
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+_history = None     # 子进程中映射共享内存得到的KlineFrame
+_memory = None
+
+
+def _frame(buffer, length):
+    """在共享内存上创建KlineFrame，各列均为共享内存的视图"""
+    columns = [np.ndarray((length,), dtype=np.int64 if name == "timestamp" else np.float64, buffer=buffer,
+                          offset=i * length * 8) for i, name in enumerate(COLUMNS)]
+    return KlineFrame(*columns)
+
+
+class SharedKlines:
+    """保存在共享内存中的k线数据，六列依次连续存放"""
+
+    def __init__(self, frame):
+        """
+        :param frame: 按时间先后排列的KlineFrame，数据会被复制一次到共享内存中
+        """
+        self.length = len(frame)
+        self.__memory = shared_memory.SharedMemory(create=True, size=max(len(COLUMNS) * self.length * 8, 8))
+        self.name = self.__memory.name
+        shared = _frame(self.__memory.buf, self.length)
+        for name in COLUMNS:
+            getattr(shared, name)[:] = getattr(frame, name)
+        self.frame = shared.set_readonly()
+
+    @staticmethod
+    def attach(name, length):
+        """
+        在其他进程中按名称映射共享内存
+        :return: (SharedMemory, 只读的KlineFrame)，使用KlineFrame期间需保留SharedMemory对象
+        """
+        memory = shared_memory.SharedMemory(name=name)
+        return memory, _frame(memory.buf, length).set_readonly()
+
+    def close(self):
+        """释放共享内存，之后不能再使用frame"""
+        self.frame = None
+        self.__memory.close()
+        self.__memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parameter_grid(grid):
+    """
+    展开参数网格
+    :param grid: 字典，如{"fast_length": range(5, 20), "slow_length": range(10, 30)}，按键的顺序求笛卡尔积；
+                 也可以直接传入由字典组成的列表
+    :return: 由参数字典组成的列表
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    return [dict(params) for params in grid]
+
+
+class _Progress:
+    """在终端同一行显示进度、已用时间与预计剩余时间"""
+
+    def __init__(self, total, stream=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.start = time.perf_counter()
+
+    def update(self, done):
+        elapsed = time.perf_counter() - self.start
+        eta = elapsed / done * (self.total - done) if done else 0.0
+        self.stream.write("\r参数优化进度：{}/{} 已用时{:.1f}秒 预计剩余{:.1f}秒".format(done, self.total, elapsed, eta))
+        self.stream.flush()
+
+    def close(self):
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+def _attach(name, length):
+    global _history, _memory
+    storage.reset_after_fork()
+    write_behind.reset_after_fork()
+    _memory, _history = SharedKlines.attach(name, length)
+
+
+def _run(task):
+    function, index, params = task
+    return index, function(_history, **params)
+
+
+def _row(params, result):
+    row = dict(params)
+    row.update(result if isinstance(result, dict) else {"result": result})
+    return row
+
+
+def sweep(function, grid, history, processes=None, progress=True):
+    """
+    并行回测全部参数组合
+    :param function: 回测函数，function(history, **params)，返回由指标组成的字典
+    :param grid: 参数网格，见parameter_grid
+    :param history: 完整的历史k线数据列表（按时间先后排列）或KlineFrame
+    :param processes: 进程数，默认为CPU核数，为1时在当前进程中依次运行
+    :param progress: 是否显示进度与预计剩余时间
+    :return: 结果表，由字典组成的列表，每行为参数与回测指标，顺序与参数组合的顺序一致
+    """
+    history = history if isinstance(history, KlineFrame) else KlineFrame.from_records(history)
+    combinations = parameter_grid(grid)
+    processes = processes or os.cpu_count() or 1
+    bar = _Progress(len(combinations)) if progress else None
+    results = [None] * len(combinations)
+    if processes == 1 or len(combinations) <= 1:
+        for index, params in enumerate(combinations):
+            results[index] = function(history, **params)
+            if bar is not None:
+                bar.update(index + 1)
+    else:
+        with SharedKlines(history) as shared:
+            tasks = [(function, index, params) for index, params in enumerate(combinations)]
+            with multiprocessing.Pool(min(processes, len(tasks)), initializer=_attach,
+                                      initargs=(shared.name, shared.length)) as pool:
+                for done, (index, result) in enumerate(pool.imap_unordered(_run, tasks), 1):
+                    results[index] = result
+                    if bar is not None:
+                        bar.update(done)
+    if bar is not None:
+        bar.close()
+    return [_row(params, result) for params, result in zip(combinations, results)]
+
+
+def save_csv(results, path):
+    """将结果表保存为csv文件，用Excel打开时中文不会乱码"""
+    fields = []
+    for row in results:
+        fields.extend(field for field in row if field not in fields)
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
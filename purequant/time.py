@@ -7,6 +7,10 @@
 import time
 import decimal
 import datetime
+import functools
+import numpy as np
+
+UTC_FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
 def sleep(seconds):
     time.sleep(seconds)
@@ -108,7 +112,13 @@ def ts_to_datetime_str(ts=None, fmt='%Y-%m-%d %H:%M:%S'):
     """
     if not ts:
         ts = get_cur_timestamp()
-    dt = datetime.datetime.fromtimestamp(int(ts))
+    return _ts_to_datetime_str(int(ts), fmt)
+
+
+@functools.lru_cache(maxsize=65536)
+def _ts_to_datetime_str(ts, fmt):
+    """ 回测时每根k线都会转换一次时间，缓存转换结果 """
+    dt = datetime.datetime.fromtimestamp(ts)
     return dt.strftime(fmt)
 
 
@@ -135,27 +145,122 @@ def datetime_to_timestamp(dt=None, tzinfo=None):
     return ts
 
 
-def utctime_str_to_ts(utctime_str, fmt="%Y-%m-%dT%H:%M:%S.%fZ"):
+@functools.lru_cache(maxsize=65536)
+def _utctime_str_to_mts(utctime_str):
+    """ 默认格式的UTC日期时间字符串转换为毫秒时间戳，不经过strptime，并缓存转换结果 """
+    return int(np.datetime64(utctime_str.rstrip("zZ"), "ms").astype(np.int64))
+
+
+def utctime_str_to_ts(utctime_str, fmt=UTC_FMT):
     """ 将UTC日期时间格式字符串转换成时间戳
     @param utctime_str 日期时间字符串 eg: 2019-03-04T09:14:27.806Z
     @param fmt 日期时间字符串格式
     @return timestamp 时间戳(秒)
     """
+    if fmt == UTC_FMT:
+        return _utctime_str_to_mts(utctime_str) // 1000
     dt = datetime.datetime.strptime(utctime_str, fmt)
     timestamp = int(dt.replace(tzinfo=datetime.timezone.utc).astimezone(tz=None).timestamp())
     return timestamp
 
 
-def utctime_str_to_mts(utctime_str, fmt="%Y-%m-%dT%H:%M:%S.%fZ"):
+def utctime_str_to_mts(utctime_str, fmt=UTC_FMT):
     """ 将UTC日期时间格式字符串转换成时间戳（毫秒）
     @param utctime_str 日期时间字符串 eg: 2019-03-04T09:14:27.806Z
     @param fmt 日期时间字符串格式
     @return timestamp 时间戳(毫秒)
     """
+    if fmt == UTC_FMT:
+        return _utctime_str_to_mts(utctime_str)
     dt = datetime.datetime.strptime(utctime_str, fmt)
     timestamp = int(dt.replace(tzinfo=datetime.timezone.utc).astimezone(tz=None).timestamp() * 1000)
     return timestamp
 
+def utctime_str_column_to_mts(column):
+    """ 将一列k线时间批量转换为毫秒时间戳
+    @param column 列表或数组，元素为UTC日期时间字符串（eg: 2019-03-04T09:14:27.806Z）、秒或毫秒时间戳
+    @return numpy int64数组，毫秒时间戳
+    """
+    if len(column) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if isinstance(column[0], str) and not column[0].isdigit():     # 全为数字的字符串按时间戳处理
+        try:
+            result = _iso_column_to_mts(np.array(column, dtype="S"))
+        except UnicodeEncodeError:
+            result = None
+        if result is None:  # 不是固定格式时由numpy逐个解析
+            strings = np.char.rstrip(np.array(column), "zZ")   # 去掉UTC时间字符串末尾的z
+            result = strings.astype("datetime64[ms]").astype(np.int64)
+        return result
+    result = np.asarray(column, dtype=np.float64)
+    if result[-1] < 1e11:   # 秒级时间戳
+        result = result * 1000
+    return result.astype(np.int64)
+
+
+_ISO_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_ISO_SEPARATORS = {4: b"-", 7: b"-", 13: b":", 16: b":"}
+_MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])   # 平年每月的天数
+
+
+def _iso_column_to_mts(strings):
+    """ 按固定位置解析YYYY-MM-DDTHH:MM:SS[.fff][Z]格式的字节串数组，不符合该格式时返回None """
+    width = strings.dtype.itemsize
+    if width < 19 or len(strings) == 0:
+        return None
+    codes = strings.view(np.uint8).reshape(len(strings), width)
+    digits = codes - np.uint8(ord("0"))     # 非数字字符相减后溢出为大于9的值
+    if (digits[:, _ISO_DIGITS] > 9).any():
+        return None
+    for index, char in _ISO_SEPARATORS.items():
+        if (codes[:, index] != ord(char)).any():
+            return None
+    if not np.isin(codes[:, 10], (ord("T"), ord(" "))).all():
+        return None
+    rest = 19
+    milliseconds = 0
+    if width >= 23 and (codes[:, 19] == ord(".")).all():
+        if (digits[:, 20:23] > 9).any():
+            return None
+        fraction = digits[:, 20:23].astype(np.int64)
+        milliseconds = fraction[:, 0] * 100 + fraction[:, 1] * 10 + fraction[:, 2]
+        rest = 23
+    if not np.isin(codes[:, rest:], (0, ord("Z"), ord("z"))).all():   # 末尾只允许z或空白
+        return None
+    fields = digits[:, :19].T.astype(np.int64, order="C")  # 每一行是一个字符位置上的全部数字
+    year = fields[0] * 1000 + fields[1] * 100 + fields[2] * 10 + fields[3]
+    month, day = fields[5] * 10 + fields[6], fields[8] * 10 + fields[9]
+    if month.min() < 1 or month.max() > 12 or day.min() < 1:
+        return None
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    if (day > _MONTH_DAYS[month] + ((month == 2) & leap)).any():     # 如2020-02-30，由numpy逐个解析时报错
+        return None
+    if (fields[11] * 10 + fields[12]).max() > 23 or (fields[14] * 10 + fields[15]).max() > 59 \
+            or (fields[17] * 10 + fields[18]).max() > 59:
+        return None
+    # 公历日期转换为1970-01-01以来的天数
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    seconds = (days * 86400 + (fields[11] * 10 + fields[12]) * 3600 + (fields[14] * 10 + fields[15]) * 60
+               + fields[17] * 10 + fields[18])
+    return seconds * 1000 + milliseconds
+
+
+def kline_time_to_mts(value):
+    """ 将单个k线时间转换为毫秒时间戳
+    @param value UTC日期时间字符串、秒或毫秒时间戳
+    @return timestamp 时间戳(毫秒)
+    """
+    if isinstance(value, str) and not value.isdigit():
+        return _utctime_str_to_mts(value)
+    value = float(value)
+    return int(value * 1000) if value < 1e11 else int(value)
+
+
 def float_to_str(f, p=20):
     """ 将给定的float转换为字符串，而无需借助科学计数法。
     @param f 浮点数参数
@@ -167,3 +272,18 @@ def float_to_str(f, p=20):
     d1 = ctx.create_decimal(repr(f))
     return format(d1, 'f')
 
+
+def time_frame_to_seconds(time_frame):
+    """ 将k线周期字符串转换为秒数，如'1m'为60，'4h'为14400，'1d'为86400
+    @param time_frame k线周期，与trade模块中get_kline函数的写法一致，大写的'M'同样表示分钟
+    @return seconds 周期对应的秒数，无法识别时返回None
+    """
+    units = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    try:
+        number = int(time_frame[:-1])
+    except (TypeError, ValueError):
+        return None
+    unit = units.get(time_frame[-1].lower())
+    if unit is None or number <= 0:
+        return None
+    return number * unit
@@ -0,0 +1,438 @@
+# -*- coding:utf-8 -*-
+
+"""
+纯numpy向量化指标计算
+
+一次计算多个长度参数的指标，返回形状为(长度参数个数, k线数量)的二维矩阵，
+每一行与对应长度参数的TA-Lib计算结果一致，预热期内的值为nan。
+单个指标的计算函数（sma、ema、kama、bbands、atr、rsi、macd、stoch、sar、trix、obv、roc、stochrsi等）
+的参数与返回值与TA-Lib中的同名函数一致，供indicators模块的NumpyBackend使用。
+"""
+
+import numpy as np
+
+
+def _lengths(lengths):
+    lengths = np.atleast_1d(np.asarray(lengths, dtype=np.int64))
+    if lengths.ndim != 1 or len(lengths) == 0 or lengths.min() < 1:
+        raise ValueError("长度参数必须是大于0的整数或整数列表!")
+    return lengths
+
+
+def sma_matrix(values, lengths):
+    """简单移动平均矩阵，每一行对应talib.SMA(values, length)，用一次累加和求出所有长度参数的窗口和"""
+    values = np.asarray(values, dtype=np.float64)
+    lengths = _lengths(lengths)
+    n = len(values)
+    result = np.full((len(lengths), n), np.nan)
+    if n == 0:
+        return result
+    offset = values.mean()  # 先减去均值，减小累加和的数量级以降低误差
+    cumsum = np.concatenate(([0.0], np.cumsum(values - offset)))
+    for row, length in enumerate(lengths):
+        if length <= n:
+            result[row, length - 1:] = (cumsum[length:] - cumsum[:n + 1 - length]) / length + offset
+    return result
+
+
+def _window_view(values, lengths, pad):
+    """在前面补齐longest-1个pad值后的滑动窗口视图，每一行是以当前k线结尾、长度为最大长度参数的窗口"""
+    longest = int(lengths.max())
+    padded = np.concatenate((np.full(longest - 1, pad), values))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, longest)
+    return windows, max(1, (1 << 22) // longest)
+
+
+def stddev_matrix(values, lengths, nbdev=1):
+    """
+    总体标准差矩阵，每一行对应talib.STDDEV(values, length, nbdev)
+    在滑动窗口视图上从当前k线向前累加与当前价格的差值及其平方，一次得到所有长度参数的方差，
+    差值的数量级很小，窗口内价格全部相同时方差严格为0
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lengths = _lengths(lengths)
+    n = len(values)
+    result = np.full((len(lengths), n), np.nan)
+    if n == 0:
+        return result
+    windows, block = _window_view(values, lengths, np.nan)
+    for start in range(0, n, block):
+        reverse = windows[start:start + block, ::-1]
+        deviation = reverse - reverse[:, :1]
+        sums = np.cumsum(deviation, axis=1)[:, lengths - 1] / lengths
+        squares = np.cumsum(deviation ** 2, axis=1)[:, lengths - 1] / lengths
+        result[:, start:start + block] = (squares - sums ** 2).T     # 窗口不足时包含nan，结果为nan
+    with np.errstate(invalid="ignore"):
+        valid = ~np.isnan(result)
+        result[valid] = np.where(result[valid] < 0.00000000000001, 0.0, np.sqrt(np.abs(result[valid])) * nbdev)
+    return result
+
+
+def _linear_recursion(values, decay, gain, initial):
+    """
+    向量化计算 y[i] = decay * y[i-1] + gain * values[i]，y[-1] = initial
+    将序列分成长度为block的块，块内用累加和求解，块与块之间的递推系数decay**block不大于1e-3，
+    只需累加少数几项即可达到双精度
+    """
+    n = len(values)
+    block = max(1, int(np.log(1000.0) / -np.log(decay)))
+    blocks = -(-n // block)
+    padded = np.zeros(blocks * block)
+    padded[:n] = values
+    matrix = padded.reshape(blocks, block)
+    exponents = np.arange(block)
+    # 假设每块起点之前的值为0时块内的结果
+    local = gain * np.cumsum(matrix * decay ** -exponents, axis=1) * decay ** exponents
+    carry_decay = decay ** block
+    ends = local[:, -1]
+    carry = initial * carry_decay ** np.arange(1, blocks + 1)   # 初始值对各块末尾的影响
+    term = ends.copy()
+    power = 1.0
+    while power > 1e-18 and term.any():
+        carry += term * power
+        term = np.concatenate(([0.0], term[:-1]))
+        power *= carry_decay
+    previous = np.concatenate(([initial], carry[:-1]))    # 每块起点之前的值
+    result = local + previous[:, None] * decay ** (exponents + 1)
+    return result.ravel()[:n]
+
+
+def ema(values, length):
+    """指数移动平均，以前length个值的简单平均作为初始值，对应talib.EMA(values, length)"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if length > n:
+        return result
+    k = 2.0 / (length + 1)
+    result[length - 1] = values[:length].sum() / length
+    if length == 1:
+        result[:] = values
+    elif n > length:
+        result[length:] = _linear_recursion(values[length:], 1 - k, k, result[length - 1])
+    return result
+
+
+def ema_matrix(values, lengths):
+    """指数移动平均矩阵，每一行对应talib.EMA(values, length)"""
+    values = np.asarray(values, dtype=np.float64)
+    lengths = _lengths(lengths)
+    return np.array([ema(values, length) for length in lengths]).reshape(len(lengths), len(values))
+
+
+def _extreme_matrix(values, lengths, accumulate, pad):
+    """在滑动窗口视图上从当前k线向前累计极值，一次得到所有长度参数的周期极值"""
+    values = np.asarray(values, dtype=np.float64)
+    lengths = _lengths(lengths)
+    n = len(values)
+    result = np.full((len(lengths), n), np.nan)
+    if n == 0:
+        return result
+    windows, block = _window_view(values, lengths, pad)
+    for start in range(0, n, block):
+        extremes = accumulate(windows[start:start + block, ::-1], axis=1)
+        result[:, start:start + block] = extremes[:, lengths - 1].T
+    for row, length in enumerate(lengths):
+        result[row, :length - 1] = np.nan
+    return result
+
+
+def highest_matrix(values, lengths):
+    """周期最高价矩阵，每一行对应talib.MAX(values, length)"""
+    return _extreme_matrix(values, lengths, np.maximum.accumulate, -np.inf)
+
+
+def lowest_matrix(values, lengths):
+    """周期最低价矩阵，每一行对应talib.MIN(values, length)"""
+    return _extreme_matrix(values, lengths, np.minimum.accumulate, np.inf)
+
+
+def _scan(decay, values, initial=0.0):
+    """
+    向量化计算 y[i] = decay[i] * y[i-1] + values[i]，y[-1] = initial，decay可以逐项不同
+    采用倍增扫描，只做乘法与加法，共log2(n)轮数组运算
+    """
+    a = np.array(decay, dtype=np.float64)
+    b = np.array(values, dtype=np.float64)
+    if len(b) == 0:
+        return b
+    b[0] += a[0] * initial
+    shift = 1
+    while shift < len(b):
+        b[shift:] = b[shift:] + a[shift:] * b[:-shift]
+        a[shift:] = a[shift:] * a[:-shift]
+        shift *= 2
+    return b
+
+
+def _wilder(values, length, initial):
+    """Wilder平滑，y[i] = (y[i-1] * (length - 1) + values[i]) / length"""
+    if len(values) == 0:
+        return np.zeros(0)
+    return _linear_recursion(values, (length - 1) / length, 1.0 / length, initial)
+
+
+def _shifted(values, start):
+    """从start开始的序列前面补nan，使其与原始k线对齐"""
+    result = np.full(len(values) + start, np.nan)
+    result[start:] = values
+    return result
+
+
+def sma(values, length):
+    """简单移动平均，对应talib.SMA"""
+    return sma_matrix(values, [length])[0]
+
+
+def stddev(values, length, nbdev=1):
+    """总体标准差，对应talib.STDDEV"""
+    return stddev_matrix(values, [length], nbdev)[0]
+
+
+def highest(values, length):
+    """周期最大值，对应talib.MAX"""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if length <= len(values):
+        result[length - 1:] = np.lib.stride_tricks.sliding_window_view(values, length).max(axis=1)
+    return result
+
+
+def lowest(values, length):
+    """周期最小值，对应talib.MIN"""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if length <= len(values):
+        result[length - 1:] = np.lib.stride_tricks.sliding_window_view(values, length).min(axis=1)
+    return result
+
+
+def kama(values, length=30):
+    """
+    考夫曼适应性移动平均，对应talib.KAMA
+    效率系数 = |values[i] - values[i-length]| / 最近length个逐根涨跌幅绝对值之和，
+    平滑系数 = (效率系数 * (2/3 - 2/31) + 2/31) ** 2
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if n <= length:
+        return result
+    fastest, slowest = 2.0 / 3, 2.0 / 31
+    volatility = np.concatenate(([0.0], np.cumsum(np.abs(np.diff(values)))))
+    total = volatility[length:] - volatility[:n - length]
+    change = values[length:] - values[:n - length]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        efficiency = np.where((total <= change) | (np.abs(total) < 0.00000000000001), 1.0, np.abs(change / total))
+    smooth = (efficiency * (fastest - slowest) + slowest) ** 2
+    result[length:] = _scan(1 - smooth, smooth * values[length:], values[length - 1])
+    return result
+
+
+def bbands(values, length=5, nbdevup=2, nbdevdn=2):
+    """布林带，中轨为简单移动平均，返回(上轨, 中轨, 下轨)，对应talib.BBANDS(matype=0)"""
+    middle = sma(values, length)
+    deviation = stddev(values, length)
+    return middle + deviation * nbdevup, middle, middle - deviation * nbdevdn
+
+
+def atr(high, low, close, length=14):
+    """平均真实波幅，Wilder平滑，对应talib.ATR"""
+    high, low, close = (np.asarray(array, dtype=np.float64) for array in (high, low, close))
+    n = len(close)
+    result = np.full(n, np.nan)
+    if n <= length:
+        return result
+    previous = close[:-1]
+    true_range = np.maximum(high[1:] - low[1:], np.maximum(np.abs(high[1:] - previous), np.abs(low[1:] - previous)))
+    if length == 1:
+        result[1:] = true_range
+        return result
+    result[length] = true_range[:length].sum() / length
+    result[length + 1:] = _wilder(true_range[length:], length, result[length])
+    return result
+
+
+def rsi(values, length=14):
+    """相对强弱指标，Wilder平滑，对应talib.RSI"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if n <= length:
+        return result
+    diff = np.diff(values)
+    gain = np.where(diff > 0, diff, 0.0)
+    loss = np.where(diff < 0, -diff, 0.0)
+    # 横盘时平均涨幅与平均跌幅按(length-1)/length逐根衰减到很小的值，TA-Lib仍按两者之比计算，
+    # 用只有乘法与加法的倍增扫描保持两者的相对精度，不用_wilder（分块累加和在数值很小时相对误差很大）
+    decay = np.full(len(diff) - length, (length - 1) / length)
+    average_gain = np.concatenate(([gain[:length].sum() / length],
+                                   _scan(decay, gain[length:] / length, gain[:length].sum() / length)))
+    average_loss = np.concatenate(([loss[:length].sum() / length],
+                                   _scan(decay, loss[length:] / length, loss[:length].sum() / length)))
+    with np.errstate(divide="ignore", invalid="ignore"):   # 与TA-Lib一致，只有平均涨幅与平均跌幅都为0时为0
+        result[length:] = np.where((average_gain == 0) & (average_loss == 0), 0.0,
+                                   100 * (average_gain / (average_gain + average_loss)))
+    return result
+
+
+def macd(values, fastperiod=12, slowperiod=26, signalperiod=9):
+    """
+    平滑异同移动平均，返回(DIF, DEA, 柱状值)，对应talib.MACD
+    与TA-Lib一致，快线从慢线的第一个有效值处开始计算初始平均值
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if slowperiod < fastperiod:
+        fastperiod, slowperiod = slowperiod, fastperiod
+    n = len(values)
+    lookback = slowperiod - 1 + signalperiod - 1
+    dif, dea, histogram = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    if n <= lookback:
+        return dif, dea, histogram
+    start = slowperiod - 1
+    fast = ema(values[slowperiod - fastperiod:], fastperiod)[fastperiod - 1:]
+    slow = ema(values, slowperiod)[start:]
+    line = fast - slow
+    signal = ema(line, signalperiod)
+    dif[lookback:] = line[signalperiod - 1:]
+    dea[lookback:] = signal[signalperiod - 1:]
+    histogram[lookback:] = dif[lookback:] - dea[lookback:]
+    return dif, dea, histogram
+
+
+def _stochastic(high, low, close, length):
+    """
+    快速随机值 (close - 最低价) / (最高价 - 最低价) * 100，区间为0时返回0
+    与TA-Lib一致，最高价与最低价之差不大于两者绝对值之和的1e-14时视为区间为0
+    """
+    lowest_low = lowest(low, length)
+    highest_high = highest(high, length)
+    difference = (highest_high - lowest_low) / 100.0
+    flat = highest_high - lowest_low <= 0.00000000000001 * (np.abs(highest_high) + np.abs(lowest_low))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(flat, 0.0, (close - lowest_low) / difference)
+
+
+def stoch(high, low, close, fastk_period=5, slowk_period=3, slowd_period=3):
+    """随机指标，返回(slowk, slowd)，对应talib.STOCH(slowk_matype=0, slowd_matype=0)"""
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    lookback = fastk_period - 1 + slowk_period - 1 + slowd_period - 1
+    slowk, slowd = np.full(n, np.nan), np.full(n, np.nan)
+    if n <= lookback:
+        return slowk, slowd
+    fastk = _stochastic(high, low, close, fastk_period)[fastk_period - 1:]
+    k = sma(fastk, slowk_period)[slowk_period - 1:]
+    d = sma(k, slowd_period)
+    slowk[lookback:] = k[slowd_period - 1:]
+    slowd[lookback:] = d[slowd_period - 1:]
+    return slowk, slowd
+
+
+def stochrsi(values, timeperiod=14, fastk_period=5, fastd_period=3):
+    """RSI的随机指标，返回(fastk, fastd)，对应talib.STOCHRSI(fastd_matype=0)"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    lookback = timeperiod + fastk_period - 1 + fastd_period - 1
+    fastk, fastd = np.full(n, np.nan), np.full(n, np.nan)
+    if n <= lookback:
+        return fastk, fastd
+    strength = rsi(values, timeperiod)[timeperiod:]
+    k = _stochastic(strength, strength, strength, fastk_period)[fastk_period - 1:]
+    d = sma(k, fastd_period)
+    fastk[lookback:] = k[fastd_period - 1:]
+    fastd[lookback:] = d[fastd_period - 1:]
+    return fastk, fastd
+
+
+def sar(high, low, acceleration=0.02, maximum=0.2):
+    """
+    抛物线指标，对应talib.SAR
+    每根k线的转向判断依赖上一根k线的状态，无法向量化，在Python列表上逐根计算
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    n = len(high)
+    result = np.full(n, np.nan)
+    if n < 2:
+        return result
+    if acceleration > maximum:
+        acceleration = maximum
+    highs, lows = high.tolist(), low.tolist()
+    down = lows[0] - lows[1]
+    is_long = not (down > 0 and highs[1] - highs[0] < down)    # 与TA-Lib一致，用第二根k线的-DM判断初始方向
+    if is_long:
+        extreme, value = highs[1], lows[0]
+    else:
+        extreme, value = lows[1], highs[0]
+    factor = acceleration
+    new_low, new_high = lows[1], highs[1]
+    output = []
+    for i in range(1, n):
+        prev_low, prev_high = new_low, new_high
+        new_low, new_high = lows[i], highs[i]
+        if is_long:
+            if new_low <= value:    # 转为空头
+                is_long = False
+                value = max(extreme, prev_high, new_high)
+                output.append(value)
+                factor = acceleration
+                extreme = new_low
+                value = max(value + factor * (extreme - value), prev_high, new_high)
+            else:
+                output.append(value)
+                if new_high > extreme:
+                    extreme = new_high
+                    factor = min(factor + acceleration, maximum)
+                value = min(value + factor * (extreme - value), prev_low, new_low)
+        else:
+            if new_high >= value:   # 转为多头
+                is_long = True
+                value = min(extreme, prev_low, new_low)
+                output.append(value)
+                factor = acceleration
+                extreme = new_high
+                value = min(value + factor * (extreme - value), prev_low, new_low)
+            else:
+                output.append(value)
+                if new_low < extreme:
+                    extreme = new_low
+                    factor = min(factor + acceleration, maximum)
+                value = max(value + factor * (extreme - value), prev_high, new_high)
+    result[1:] = output
+    return result
+
+
+def roc(values, length=10):
+    """变动率指标 (values[i] / values[i-length] - 1) * 100，对应talib.ROC"""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if len(values) <= length:
+        return result
+    previous = values[:-length]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result[length:] = np.where(previous != 0, (values[length:] / previous - 1.0) * 100, 0.0)
+    return result
+
+
+def trix(values, length=30):
+    """三重指数平滑平均线的一日变动率，对应talib.TRIX"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    lookback = 3 * (length - 1) + 1
+    if n <= lookback:
+        return np.full(n, np.nan)
+    smoothed = values
+    for _ in range(3):
+        smoothed = ema(smoothed, length)[length - 1:]
+    return _shifted(roc(smoothed, 1)[1:], lookback)
+
+
+def obv(close, volume):
+    """能量潮，对应talib.OBV"""
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    if len(close) == 0:
+        return np.zeros(0)
+    direction = np.concatenate(([1.0], np.sign(np.diff(close))))
+    return np.cumsum(direction * volume)
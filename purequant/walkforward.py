@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+
+"""
+滚动窗口参数优化（walk-forward）
+
+把历史数据分为若干个依次向后滚动的样本内/样本外窗口，在每个样本内窗口上选出得分最高的参数，
+再把这些参数在紧随其后的样本外窗口上的收益拼接成样本外资金曲线。
+
+每组参数只在完整的历史数据上回测一次（用purequant.sweep在进程池中并行），各窗口的得分由这次回测的
+逐根k线收益率切片计算，指标也只在完整历史上计算一次；选中的参数的回测结果会被缓存，
+多个窗口选中同一组参数时不再重复回测。因此24个窗口的滚动优化，计算量接近一次完整的参数优化，而不是24次。
+窗口边界处沿用完整回测中的持仓，与策略连续运行时的情况一致。
+"""
+
+from functools import partial
+import numpy as np
+from purequant import time, report
+from purequant.kline import KlineFrame
+from purequant.sweep import sweep, parameter_grid
+
+
+def folds(length, in_sample, out_of_sample, anchored=False):
+    """
+    划分窗口，样本外窗口首尾相接，不重叠
+    :param length: k线数量
+    :param in_sample: 样本内窗口的k线数量
+    :param out_of_sample: 样本外窗口的k线数量，也是每次向后滚动的k线数量
+    :param anchored: 为True时样本内窗口都从第一根k线开始
+    :return: int64数组，每行为一个窗口的(样本内开始位置, 样本外开始位置, 样本外结束位置)，结束位置不包含在内
+    """
+    out_starts = np.arange(in_sample, length - out_of_sample + 1, out_of_sample, dtype=np.int64)
+    in_starts = np.zeros_like(out_starts) if anchored else out_starts - in_sample
+    return np.column_stack((in_starts, out_starts, out_starts + out_of_sample))
+
+
+def bar_returns(result):
+    """由回测结果（如BacktestResult）的资金曲线计算逐根k线的收益率"""
+    equity = np.asarray(result.equity, dtype=np.float64)
+    previous = np.concatenate(([result.start_asset], equity[:-1]))
+    return equity / previous - 1
+
+
+def window_scores(returns, starts, ends, score="sharpe"):
+    """
+    计算多个窗口的得分，用累加和一次算出全部窗口
+    :param returns: 逐根k线的收益率
+    :param starts: 各窗口的开始位置数组
+    :param ends: 各窗口的结束位置数组（不包含）
+    :param score: "sharpe"（逐根k线收益率的均值/标准差）、"return"（窗口内的总收益率），
+                  或函数score(窗口内的收益率数组)，返回一个数值
+    :return: float64数组，无法计算的窗口为nan
+    """
+    if callable(score):
+        return np.array([score(returns[start:end]) for start, end in zip(starts, ends)], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if score == "return":
+            growth = np.concatenate(([0.0], np.cumsum(np.log1p(returns))))
+            return np.expm1(growth[ends] - growth[starts])
+        if score == "sharpe":
+            total = np.concatenate(([0.0], np.cumsum(returns)))
+            squares = np.concatenate(([0.0], np.cumsum(returns * returns)))
+            count = ends - starts
+            mean = (total[ends] - total[starts]) / count
+            variance = np.maximum((squares[ends] - squares[starts] - count * mean * mean) / (count - 1), 0)
+            return np.where(variance > 0, mean / np.sqrt(variance), np.nan)
+    raise ValueError("得分计算方法错误，只支持【sharpe return】或函数!")
+
+
+def _fold_scores(history, function, starts, ends, score, **params):
+    """在子进程中运行：用一组参数回测完整历史，返回各样本内窗口的得分"""
+    return {"得分": window_scores(bar_returns(function(history, **params)), starts, ends, score)}
+
+
+class WalkForwardResult:
+    """
+    滚动窗口参数优化结果
+    folds: 各窗口的选中参数与得分，由字典组成的列表
+    equity: 拼接后的样本外资金曲线
+    timestamp: 样本外资金曲线对应的毫秒时间戳
+    """
+
+    def __init__(self, folds, equity, timestamp, start_asset):
+        self.folds = folds
+        self.equity = equity
+        self.timestamp = timestamp
+        self.start_asset = start_asset
+
+    def report(self, risk_free=0.0):
+        """样本外资金曲线的绩效指标，见purequant.report.performance"""
+        return report.performance(self.equity, self.timestamp, start_asset=self.start_asset, risk_free=risk_free)
+
+
+def walk_forward(function, grid, history, in_sample, out_of_sample, anchored=False, score="sharpe", processes=None,
+                 progress=True):
+    """
+    滚动窗口参数优化
+    :param function: 定义在模块顶层的回测函数，function(history, **params)，返回带有equity与start_asset的回测结果，
+                     如purequant.backtest.double_ma；可以用functools.partial传入固定的参数
+    :param grid: 参数网格，见purequant.sweep.parameter_grid
+    :param history: 按时间先后排列的KlineFrame或k线数据列表
+    :param in_sample: 样本内窗口的k线数量
+    :param out_of_sample: 样本外窗口的k线数量
+    :param anchored: 为True时样本内窗口都从第一根k线开始
+    :param score: 样本内选参的得分，见window_scores，得分相同时取参数网格中靠前的一组
+    :param processes: 进程数，默认为CPU核数
+    :param progress: 是否显示进度
+    :return: WalkForwardResult
+    """
+    history = history if isinstance(history, KlineFrame) else KlineFrame.from_records(history)
+    windows = folds(len(history), in_sample, out_of_sample, anchored)
+    if len(windows) == 0:
+        raise ValueError("k线数量不足一个样本内窗口加一个样本外窗口!")
+    combinations = parameter_grid(grid)
+    rows = sweep(partial(_fold_scores, function=function, starts=windows[:, 0], ends=windows[:, 1], score=score),
+                 combinations, history, processes, progress)
+    scores = np.array([row["得分"] for row in rows], dtype=np.float64).reshape(len(combinations), len(windows))
+    best = np.argmax(np.where(np.isnan(scores), -np.inf, scores), axis=0)
+    chosen = {}     # 选中参数的回测结果，{参数序号: (逐根k线收益率, 初始资金)}
+    result_folds, pieces = [], []
+    for fold, (in_start, out_start, out_end) in enumerate(windows):
+        index = int(best[fold])
+        if index not in chosen:
+            result = function(history, **combinations[index])
+            chosen[index] = (bar_returns(result), result.start_asset)
+        returns = chosen[index][0][out_start:out_end]
+        pieces.append(returns)
+        row = {"样本内开始": time.ts_to_datetime_str(history.timestamp[in_start] / 1000),
+               "样本外开始": time.ts_to_datetime_str(history.timestamp[out_start] / 1000),
+               "样本外结束": time.ts_to_datetime_str(history.timestamp[out_end - 1] / 1000)}
+        row.update(combinations[index])
+        row["样本内得分"] = float(scores[index, fold])
+        row["样本外收益率"] = float(np.prod(1 + returns) - 1)
+        result_folds.append(row)
+    start_asset = next(iter(chosen.values()))[1]
+    equity = start_asset * np.cumprod(1 + np.concatenate(pieces))
+    timestamp = history.timestamp[windows[0, 1]:windows[-1, 2]]
+    return WalkForwardResult(result_folds, equity, timestamp, start_asset)
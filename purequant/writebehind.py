@@ -0,0 +1,282 @@
+# -*- coding:utf-8 -*-
+
+"""
+异步写入队列（write-behind）
+
+实盘下单后保存策略运行信息、持仓信息与推送记录时，不再在交易线程中等待数据库与磁盘，
+而是放入进程内的有界队列，由后台线程按数据表（或文件）合并成批写入。队列满时放入数据的线程等待，不会丢弃数据。
+程序退出时自动写入队列中剩余的数据；读取数据库之前会先写入队列中这张数据表的数据（见flush），读到的总是最新的数据。
+
+配置文件中WRITE_BEHIND的mode为"sync"时（默认）在调用处直接写入，与不使用队列时相同；为"async"时使用队列。
+fsync_every为文件每写入多少行调用一次os.fsync（0为不调用），同步与异步模式下都有效。
+
+异步模式下写入出错时不会整批丢弃：数据库连接中断等可以重试的错误最多重试retries次，每次等待的秒数从backoff开始加倍；
+其他错误（如某一行数据不合法）时，可以逐条写入的数据（如在一个事务中写入的mysql数据）逐条重新写入，只丢弃出错的数据。
+推送消息等调用（见call）由另一个后台线程执行，推送重试时不会耽误数据库与文件的写入。
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from purequant.config import config
+
+_STOP = object()
+
+
+class WriteBehind:
+    """有界队列加后台写入线程，写入函数按数据类型注册"""
+
+    def __init__(self, mode=None, queue_size=None, interval=None, batch=None, fsync_every=None, retries=None,
+                 backoff=None):
+        """
+        参数默认使用配置文件中WRITE_BEHIND的设置
+        :param mode: "sync"在调用处直接写入，"async"放入队列由后台线程写入
+        :param queue_size: 队列最多容纳的数据条数
+        :param interval: 后台线程等待新数据的最长秒数
+        :param batch: 每批最多写入的数据条数
+        :param fsync_every: 文件每写入多少行调用一次os.fsync，0为不调用
+        :param retries: 异步模式下可以重试的错误最多重试的次数
+        :param backoff: 第一次重试前等待的秒数，之后每次加倍
+        """
+        self.__options = {"mode": mode, "queue_size": queue_size, "interval": interval, "batch": batch,
+                          "fsync_every": fsync_every, "retries": retries, "backoff": backoff}
+        self.__handlers = {"call": (self.__call, (), False, ())}
+        self.__queues = {}      # {"data"或"call": 队列}，数据库与文件的数据、推送消息等调用各用一个队列与后台线程
+        self.__threads = {}
+        self.__lock = threading.Lock()
+        self.__metrics_lock = threading.Lock()    # 放入数据的线程与后台写入线程都会更新__metrics
+        self.__unsynced = {}    # 每个文件自上次fsync后写入的行数
+        self.__pending = {}     # 队列中每类数据每个key尚未写入的条数，{(数据类型, key): 条数}
+        self.__written = threading.Condition()     # 保护__pending，一组数据写入后通知等待的flush
+        self.__metrics = {"已写入条数": 0, "批次数": 0, "失败次数": 0, "重试次数": 0, "丢弃条数": 0, "最大队列长度": 0,
+                          "写入耗时": 0.0, "最大写入耗时": 0.0, "最大等待时间": 0.0}
+        atexit.register(self.close)
+
+    def __option(self, name, default):
+        value = self.__options[name]
+        return value if value is not None else getattr(config, "write_behind_" + name, default)
+
+    @property
+    def asynchronous(self):
+        return self.__option("mode", "sync") == "async"
+
+    def register(self, kind, handler, transient=(), split=False, uncertain=()):
+        """
+        注册某一类数据的写入函数
+        :param kind: 数据类型，如"mysql"
+        :param handler: handler(key, items)，key相同的数据合并为一批，items为按放入顺序排列的列表
+        :param transient: 可以重试的异常类型，如数据库连接中断，异步模式下等待后重试
+        :param split: 整批写入出现其他异常时是否逐条重新写入，只丢弃出错的数据；
+                      只有出错时整批都不会写入的写入函数（如在一个事务中写入）才能设为True，否则会重复写入
+        :param uncertain: 无法确定数据是否已写入的异常类型（如提交事务时连接中断），不重试也不逐条重新写入
+        """
+        self.__handlers[kind] = (handler, tuple(transient), split, tuple(uncertain))
+
+    def put(self, kind, key, item):
+        """
+        写入一条数据，异步模式下放入队列后立即返回，队列满时等待
+        :param kind: 数据类型，见register
+        :param key: 可以合并写入的数据的标识，如(数据库名称, 数据表名称)
+        :param item: 数据
+        """
+        if not self.asynchronous or threading.current_thread() in self.__threads.values():
+            self.__write(kind, key, [item])
+            return
+        lane = self.__lane(kind)
+        self.__start(lane)
+        with self.__written:
+            self.__pending[(kind, key)] = self.__pending.get((kind, key), 0) + 1
+        self.__queues[lane].put((kind, key, item, time.monotonic()))
+        depth = self.__queues[lane].qsize()
+        with self.__metrics_lock:
+            self.__metrics["最大队列长度"] = max(self.__metrics["最大队列长度"], depth)
+
+    def call(self, function, *args, **kwargs):
+        """在后台线程中调用function(*args, **kwargs)，如发送推送消息，同步模式下直接调用"""
+        self.put("call", None, (function, args, kwargs))
+
+    def need_fsync(self, name, lines):
+        """
+        写入函数在写入文件后调用，返回是否需要os.fsync
+        :param name: 文件名称
+        :param lines: 此次写入的行数
+        """
+        every = self.__option("fsync_every", 0)
+        if not every:
+            return False
+        count = self.__unsynced.get(name, 0) + lines
+        self.__unsynced[name] = 0 if count >= every else count
+        return count >= every
+
+    @staticmethod
+    def __lane(kind):
+        return "call" if kind == "call" else "data"
+
+    def __start(self, lane):
+        with self.__lock:
+            thread = self.__threads.get(lane)
+            if thread is None or not thread.is_alive():
+                self.__queues.setdefault(lane, queue.Queue(self.__option("queue_size", 10000)))
+                name = "purequant-write-behind" if lane == "data" else "purequant-write-behind-call"
+                self.__threads[lane] = threading.Thread(target=self.__run, args=(self.__queues[lane],), name=name,
+                                                        daemon=True)
+                self.__threads[lane].start()
+
+    def __alive(self, lane):
+        thread = self.__threads.get(lane)
+        return thread is not None and thread.is_alive()
+
+    def __run(self, items_queue):
+        interval = self.__option("interval", 0.2)
+        batch = self.__option("batch", 1000)
+        while True:
+            try:
+                items = [items_queue.get(timeout=interval)]
+            except queue.Empty:
+                continue
+            while len(items) < batch:
+                try:
+                    items.append(items_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in items)
+            groups = OrderedDict()  # 同一数据表的数据保持放入的顺序
+            for item in items:
+                if item is not _STOP:
+                    kind, key, data, queued = item
+                    groups.setdefault((kind, key), []).append(data)
+                    with self.__metrics_lock:
+                        self.__metrics["最大等待时间"] = max(self.__metrics["最大等待时间"], time.monotonic() - queued)
+            for (kind, key), data in groups.items():
+                if kind == "call":  # 推送消息等逐个调用，一个出错不影响其他，也不会重复调用
+                    for item in data:
+                        self.__write(kind, key, [item])
+                else:
+                    self.__write(kind, key, data)
+                with self.__written:
+                    count = self.__pending.pop((kind, key)) - len(data)
+                    if count:
+                        self.__pending[(kind, key)] = count
+                    self.__written.notify_all()
+            for _ in items:
+                items_queue.task_done()
+            if stop:
+                return
+
+    def __call(self, key, items):
+        for function, args, kwargs in items:
+            function(*args, **kwargs)
+
+    def __attempt(self, kind, key, items):
+        """写入一批数据，异步模式下可以重试的错误等待后重试"""
+        handler, transient, _, uncertain = self.__handlers[kind]
+        retries = self.__option("retries", 3) if self.asynchronous else 0
+        delay = self.__option("backoff", 0.5)
+        for attempt in range(retries + 1):
+            try:
+                handler(key, items)
+                return
+            except uncertain:
+                raise
+            except transient as e:
+                if attempt == retries:
+                    raise
+                with self.__metrics_lock:
+                    self.__metrics["重试次数"] += 1
+                logging.warning("异步写入出错，{}秒后重试：{} {} {}".format(delay, kind, key, e))
+                time.sleep(delay)
+                delay *= 2
+
+    def __write(self, kind, key, items):
+        start = time.perf_counter()
+        written = 0
+        try:
+            self.__attempt(kind, key, items)
+            written = len(items)
+        except Exception as e:
+            if not self.asynchronous:
+                with self.__metrics_lock:
+                    self.__metrics["失败次数"] += 1
+                raise
+            _, _, split, uncertain = self.__handlers[kind]
+            if isinstance(e, uncertain):    # 可能已经写入，重新写入会重复
+                logging.exception("异步写入结果不确定，{}条数据可能未写入：{} {}".format(len(items), kind, key))
+            elif split and len(items) > 1:    # 逐条重新写入，只丢弃出错的数据
+                logging.exception("异步写入失败：{} {}，{}条数据逐条重新写入".format(kind, key, len(items)))
+                for item in items:
+                    try:
+                        self.__attempt(kind, key, [item])
+                        written += 1
+                    except Exception:
+                        logging.exception("异步写入失败，丢弃1条数据：{} {} {}".format(kind, key, item))
+            else:
+                logging.exception("异步写入失败，丢弃{}条数据：{} {}".format(len(items), kind, key))
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.__metrics_lock:
+                self.__metrics["批次数"] += 1
+                self.__metrics["写入耗时"] += elapsed
+                self.__metrics["最大写入耗时"] = max(self.__metrics["最大写入耗时"], elapsed)
+        with self.__metrics_lock:
+            self.__metrics["已写入条数"] += written
+            if written < len(items):
+                self.__metrics["失败次数"] += 1
+                self.__metrics["丢弃条数"] += len(items) - written
+
+    def flush(self, kind=None, key=None):
+        """
+        等待队列中的数据写入，在后台写入线程中调用时直接返回
+        :param kind: 只等待这一类数据，如读取mysql之前只等待"mysql"，不等待推送消息等其他数据的重试；为None时等待队列中的全部数据
+        :param key: 只等待key以此开头的数据，如(数据库名称, 数据表名称)只等待这张数据表的数据
+        """
+        if threading.current_thread() in self.__threads.values():
+            return
+        if kind is None:
+            for lane, items_queue in list(self.__queues.items()):
+                if self.__alive(lane):
+                    items_queue.join()
+            return
+
+        def pending():
+            return any(k == kind and (key is None or tuple(data_key[:len(key)]) == tuple(key))
+                       for k, data_key in self.__pending)
+        with self.__written:
+            while pending() and self.__alive(self.__lane(kind)):
+                self.__written.wait(self.__option("interval", 0.2))
+
+    def reset_after_fork(self):
+        """
+        在fork出的子进程（如purequant.sweep的进程池）中调用：丢弃从父进程复制来的队列、后台线程与锁，
+        队列中的数据由父进程写入，子进程再写入会重复；之后放入数据时在子进程中重新启动后台线程
+        """
+        self.__lock = threading.Lock()
+        self.__metrics_lock = threading.Lock()
+        self.__written = threading.Condition()
+        self.__queues = {}
+        self.__threads = {}
+        self.__pending = {}
+        self.__unsynced = {}
+
+    def close(self):
+        """写入队列中剩余的数据并停止后台线程，之后再放入数据时会重新启动"""
+        for lane, thread in list(self.__threads.items()):
+            if thread.is_alive() and threading.current_thread() is not thread:
+                self.__queues[lane].put(_STOP)
+                thread.join()
+
+    def metrics(self):
+        """
+        返回一个字典：队列长度、最大队列长度、已写入条数、批次数、失败次数、重试次数、丢弃条数（写入失败后丢弃的数据条数），
+        平均写入耗时与最大写入耗时（每批写入所用的秒数），最大等待时间（数据从放入队列到写入的最长秒数）
+        """
+        with self.__metrics_lock:
+            metrics = dict(self.__metrics)
+        metrics["队列长度"] = sum(items_queue.qsize() for items_queue in list(self.__queues.values()))
+        metrics["平均写入耗时"] = metrics.pop("写入耗时") / metrics["批次数"] if metrics["批次数"] else 0.0
+        return metrics
+
+
+write_behind = WriteBehind()
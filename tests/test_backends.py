@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+
+"""numpy后端与TA-Lib的计算结果一致，包括横盘（价格不变）的行情"""
+
+import unittest
+import numpy as np
+from purequant import vectorized
+from purequant.backends import NumpyBackend, TalibBackend, talib
+
+
+def random_walk(seed, bars=400):
+    """随机游走的k线数据，价格保留两位小数，包含几段收盘价不变与高低收完全相同的横盘行情"""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 1, bars)), 2)
+    for start in rng.integers(0, bars - 80, 3):
+        close[start:start + rng.integers(5, 70)] = close[start]
+    open = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open, close) + np.round(rng.random(bars), 2) * (rng.random(bars) > 0.3)
+    low = np.minimum(open, close) - np.round(rng.random(bars), 2) * (rng.random(bars) > 0.3)
+    flat = rng.integers(0, bars - 60)
+    high[flat:flat + 40] = low[flat:flat + 40] = close[flat:flat + 40] = close[flat]
+    volume = np.round(rng.random(bars) * 100, 3)
+    return open, high, low, close, volume
+
+
+# 指标名称与计算函数，参数为后端、k线数据与长度参数
+CASES = {
+    "SMA": lambda backend, o, h, l, c, v, n: backend.SMA(c, n),
+    "EMA": lambda backend, o, h, l, c, v, n: backend.EMA(c, n),
+    "KAMA": lambda backend, o, h, l, c, v, n: backend.KAMA(c, n),
+    "BBANDS": lambda backend, o, h, l, c, v, n: backend.BBANDS(c, n, 2, 2),
+    "ATR": lambda backend, o, h, l, c, v, n: backend.ATR(h, l, c, n),
+    "RSI": lambda backend, o, h, l, c, v, n: backend.RSI(c, n),
+    "MACD": lambda backend, o, h, l, c, v, n: backend.MACD(c, n, n * 2 + 1, n),
+    "STOCH": lambda backend, o, h, l, c, v, n: backend.STOCH(h, l, c, n, 3, 3),
+    "SAR": lambda backend, o, h, l, c, v, n: backend.SAR(h, l, 0.02, 0.2),
+    "TRIX": lambda backend, o, h, l, c, v, n: backend.TRIX(c, n),
+    "OBV": lambda backend, o, h, l, c, v, n: backend.OBV(c, v),
+    "ROC": lambda backend, o, h, l, c, v, n: backend.ROC(c, n),
+    "STOCHRSI": lambda backend, o, h, l, c, v, n: backend.STOCHRSI(c, n, n, 3),
+    "STDDEV": lambda backend, o, h, l, c, v, n: backend.STDDEV(c, n, 1),
+    "MAX": lambda backend, o, h, l, c, v, n: backend.MAX(h, n),
+    "MIN": lambda backend, o, h, l, c, v, n: backend.MIN(l, n),
+}
+
+
+@unittest.skipIf(talib is None, "未安装TA-Lib")
+class NumpyBackendParityTest(unittest.TestCase):
+
+    def assertSame(self, expected, actual, message):
+        expected = expected if isinstance(expected, tuple) else (expected,)
+        actual = actual if isinstance(actual, tuple) else (actual,)
+        self.assertEqual(len(expected), len(actual), message)
+        for output, (x, y) in enumerate(zip(expected, actual)):
+            np.testing.assert_allclose(y, x, rtol=1e-7, atol=1e-7, err_msg="{} 第{}个返回值".format(message, output))
+
+    def test_parity_on_random_walks(self):
+        numpy_backend, talib_backend = NumpyBackend(), TalibBackend()
+        for seed in range(20):
+            bars = random_walk(seed)
+            for name, case in CASES.items():
+                for length in (2, 3, 5, 14, 30):
+                    with self.subTest(indicator=name, seed=seed, length=length):
+                        self.assertSame(case(talib_backend, *bars, length), case(numpy_backend, *bars, length),
+                                        "{} seed={} length={}".format(name, seed, length))
+
+    def test_rsi_after_long_flat_run(self):
+        close = np.array([10, 11, 12] + [12] * 57 + list(np.linspace(12, 13, 10)), dtype=np.float64)
+        np.testing.assert_allclose(vectorized.rsi(close, 2), talib.RSI(close, 2), rtol=1e-7)
+
+    def test_stochastic_zero_range_is_relative(self):
+        for base in (0.01, 1.0, 100.0, 100000.0):
+            for step in (1e-15, 1e-13, 1e-11):
+                high = np.array([base, base + base * step, base + base * step])
+                low = np.full(3, base)
+                expected = talib.STOCH(high, low, high, 2, 1, 0, 1, 0)
+                actual = vectorized.stoch(high, low, high, 2, 1, 1)
+                self.assertSame(expected, actual, "base={} step={}".format(base, step))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+
+"""示例策略用begin_trade逐根k线回测的成交记录与向量化回测（double_ma、boll_breakout）逐笔一致"""
+
+import unittest
+from unittest import mock
+import numpy as np
+import mysql.connector
+from mysql.connector import errorcode
+from purequant.backtest import double_ma, boll_breakout, compare_records
+from purequant.config import config
+from purequant.kline import KlineFrame, replay
+from purequant.storage import storage
+from purequant.example.double_moving_average_strategy import fastly_backtest_doubale_ma_strategy as double_ma_example
+from purequant.example.boll_breakthrough_strategy import boll_breakthrough_strategy as boll_example
+
+INSTRUMENT_ID = "TEST-USDT-201225"
+CONTRACT_VALUE = 0.1
+
+
+class FakeExchange:
+    """回测模式下示例策略只用到合约面值，下单函数返回下单信息"""
+
+    def __init__(self, access_key, secret_key, passphrase, instrument_id):
+        self.instrument_id = instrument_id
+
+    def get_contract_value(self):
+        return {self.instrument_id: str(CONTRACT_VALUE)}
+
+    def __getattr__(self, name):    # buy、sell、sellshort、buytocover、BUY、SELL
+        return lambda *args: "{}{}".format(name, args)
+
+
+class RaisingLogger:
+    """示例策略在except中调用logger，测试时不吞掉异常"""
+
+    def __getattr__(self, name):
+        def log(*args, **kwargs):
+            raise
+        return log
+
+
+def _missing(sql, params=None, database=None, fetch=None, many=False, **server):
+    raise mysql.connector.errors.ProgrammingError(msg="missing", errno=errorcode.ER_BAD_DB_ERROR)
+
+
+def random_walk(seed, bars=400):
+    """随机游走的日k线，有足够的均线交叉与布林通道突破"""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.03, bars))), 2)
+    open = np.round(np.concatenate(([close[0]], close[:-1])) * (1 + rng.normal(0, 0.005, bars)), 2)
+    high = np.round(np.maximum(open, close) * (1 + rng.random(bars) * 0.03), 2)
+    low = np.round(np.minimum(open, close) * (1 - rng.random(bars) * 0.03), 2)
+    timestamp = 1577836800000 + np.arange(bars) * 86400000
+    return KlineFrame(timestamp, open, high, low, close, rng.random(bars) * 1000)
+
+
+class ExampleStrategyTest(unittest.TestCase):
+
+    def setUp(self):
+        settings = {"backtest": "enabled", "first_run": "true", "ledger_sink": "mysql", "ledger_flush_rows": 0,
+                    "access_key": "", "secret_key": "", "passphrase": ""}
+        self.saved = {name: getattr(config, name, None) for name in settings}
+        for name, value in settings.items():
+            setattr(config, name, value)
+        for patcher in (mock.patch.object(config, "loads"), mock.patch.object(storage, "mysql_execute", side_effect=_missing)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.clear()
+        for name, value in self.saved.items():
+            setattr(config, name, value)
+
+    def clear(self):
+        """结束一次回测，不写入测试数据"""
+        with mock.patch.object(storage, "mysql_save_strategy_run_infos"):
+            storage.reset_ledgers()
+
+    def run_example(self, module, history, **parameters):
+        """与示例中的回测模式相同：预计算指标后逐根k线回放，返回begin_trade保存的成交记录"""
+        self.clear()
+        with mock.patch.object(module, "OKEXFUTURES", FakeExchange), mock.patch.object(module, "logger", RaisingLogger()):
+            strategy = module.Strategy(instrument_id=INSTRUMENT_ID, time_frame="1d", start_asset=1000, **parameters)
+            strategy.indicators.preload(history)
+            for kline in replay(history):
+                strategy.begin_trade(kline=kline)
+        return storage.ledger(strategy.database, strategy.datasheet).rows()
+
+    def test_double_moving_average(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                history = random_walk(seed)
+                records = self.run_example(double_ma_example, history, fast_length=5, slow_length=10,
+                                           long_stop=0.95, short_stop=1.05)
+                result = double_ma(history, 5, 10, 0.95, 1.05, start_asset=1000, contract_value=CONTRACT_VALUE)
+                self.assertGreater(len(result.records), 10)
+                self.assertEqual(compare_records(records, result), [])
+
+    def test_boll_breakout(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                history = random_walk(seed)
+                records = self.run_example(boll_example, history, bollinger_lengths=50, filter_length=30)
+                result = boll_breakout(history, 50, 30, start_asset=1000, contract_value=CONTRACT_VALUE)
+                self.assertGreater(len(result.records), 10)
+                self.assertEqual(compare_records(records, result), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
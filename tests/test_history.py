@@ -0,0 +1,85 @@
+# -*- coding:utf-8 -*-
+
+"""本地历史k线数据文件的写入、合并、读取与按时间范围切片"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from purequant.history import HistoryStore
+from purequant.kline import KlineFrame
+
+MINUTE = 60000
+
+
+def _frame(start, bars, price=100.0):
+    timestamp = 1577836800000 + (start + np.arange(bars)) * MINUTE
+    close = price + np.arange(bars, dtype=np.float64)
+    return KlineFrame(timestamp, close - 0.5, close + 1, close - 1, close, np.full(bars, 10.0))
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.store = HistoryStore(self.directory)
+
+    def assertFrameEqual(self, actual, expected):
+        for name in ("timestamp", "open", "high", "low", "close", "volume"):
+            np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name), err_msg=name)
+
+    def test_round_trip(self):
+        frame = _frame(0, 100)
+        self.assertEqual(self.store.write("ltc_1m", frame), 100)
+        self.assertEqual(self.store.names(), ["ltc_1m"])
+        loaded = self.store.load("ltc_1m")
+        self.assertFrameEqual(loaded, frame)
+        self.assertFalse(loaded.close.flags.writeable)
+
+    def test_merge_sorts_and_prefers_new_rows(self):
+        self.store.write("ltc_1m", _frame(50, 50))
+        self.assertEqual(self.store.write("ltc_1m", _frame(0, 60, price=200.0)), 100)   # 第50至59根k线重复
+        loaded = self.store.load("ltc_1m")
+        self.assertTrue((np.diff(loaded.timestamp) == MINUTE).all())
+        np.testing.assert_array_equal(loaded.close[:60], _frame(0, 60, price=200.0).close)
+        np.testing.assert_array_equal(loaded.close[60:], _frame(50, 50).close[10:])
+
+    def test_overwrite(self):
+        self.store.write("ltc_1m", _frame(0, 100))
+        self.assertEqual(self.store.write("ltc_1m", _frame(10, 5), merge=False), 5)
+        self.assertFrameEqual(self.store.load("ltc_1m"), _frame(10, 5))
+
+    def test_time_range(self):
+        frame = _frame(0, 100)
+        self.store.write("ltc_1m", frame)
+        start, end = frame.timestamp[10], frame.timestamp[20]
+        self.assertFrameEqual(self.store.load("ltc_1m", start, end), frame[10:20])
+        self.assertFrameEqual(self.store.load("ltc_1m", start - 1, end + 1), frame[10:21])
+        self.assertFrameEqual(self.store.load("ltc_1m", "2020-01-01T00:10:00.000Z", "2020-01-01T00:20:00.000Z"),
+                              frame[10:20])
+        self.assertEqual(len(self.store.load("ltc_1m", end=frame.timestamp[0])), 0)
+        self.assertFrameEqual(self.store.load("ltc_1m", start=frame.timestamp[90]), frame[90:])
+
+    @unittest.skipIf(os.name == "nt", "Windows下文件被映射时不能替换")
+    def test_loaded_frames_survive_writes(self):
+        self.store.write("ltc_1m", _frame(0, 10))
+        before = self.store.load("ltc_1m")
+        self.store.write("ltc_1m", _frame(10, 10))
+        self.assertFrameEqual(before, _frame(0, 10))
+        self.assertEqual(len(self.store.load("ltc_1m")), 20)
+        self.assertFalse(os.path.exists(self.store.path("ltc_1m") + ".tmp"))
+
+    def test_failed_replace_keeps_old_data(self):
+        self.store.write("ltc_1m", _frame(0, 10))
+        with mock.patch("os.replace", side_effect=PermissionError("mapped")):     # 与Windows下文件仍被映射时相同
+            with self.assertRaises(PermissionError):
+                self.store.write("ltc_1m", _frame(10, 10))
+        self.assertFalse(os.path.exists(self.store.path("ltc_1m") + ".tmp"))
+        self.assertFrameEqual(self.store.load("ltc_1m"), _frame(0, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding:utf-8 -*-
+
+"""mysql连接池：读取后结束事务，写入时连接中断不重新执行"""
+
+import unittest
+from unittest import mock
+import mysql.connector
+from purequant.mysqlpool import MysqlPool, UncertainCommitError, commit
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.rollbacks = 0
+        self.closed = False
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def ping(self, **kwargs):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class MysqlPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = []
+
+        def connect(**kwargs):
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+        patcher = mock.patch.object(mysql.connector, "connect", side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = MysqlPool(size=2)
+
+    def test_read_transaction_is_ended_before_release(self):
+        self.assertEqual(self.pool.run(lambda conn: "rows", retry=True), "rows")
+        self.assertEqual(self.connections[0].rollbacks, 1)
+
+    def test_reads_are_retried_on_a_new_connection(self):
+        calls = []
+
+        def work(conn):
+            calls.append(conn)
+            if len(calls) == 1:
+                raise mysql.connector.errors.OperationalError("lost connection")
+            return "rows"
+        self.assertEqual(self.pool.run(work, retry=True), "rows")
+        self.assertTrue(self.connections[0].closed)
+        self.assertIs(calls[1], self.connections[1])
+
+    def test_writes_are_not_replayed(self):
+        calls = []
+
+        def work(conn):
+            calls.append(conn)
+            raise mysql.connector.errors.OperationalError("lost connection")
+        with self.assertRaises(mysql.connector.errors.OperationalError):
+            self.pool.run(work)
+        self.assertEqual(len(calls), 1)
+
+    def test_connect_failures_are_retried(self):
+        failures = [mysql.connector.errors.InterfaceError("refused")]
+
+        def connect(**kwargs):
+            if failures:
+                raise failures.pop()
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+        with mock.patch.object(mysql.connector, "connect", side_effect=connect):
+            self.assertEqual(self.pool.run(lambda conn: "done"), "done")
+
+    def test_lost_commit_is_uncertain(self):
+        conn = FakeConnection()
+        conn.commit = mock.Mock(side_effect=mysql.connector.errors.OperationalError("lost connection"))
+        with self.assertRaises(UncertainCommitError):
+            commit(conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
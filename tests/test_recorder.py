@@ -0,0 +1,89 @@
+# -*- coding:utf-8 -*-
+
+"""行情记录器：写入在后台线程中进行，mongodb断开时缓存有上限，关闭后的消息不会悄悄丢失"""
+
+import threading
+import time
+import unittest
+from pymongo.errors import PyMongoError
+from purequant.recorder import MongoRecorder
+
+
+class FakeCollection:
+    name = "depth5"
+
+    class database:
+        name = "trade"
+
+    def __init__(self):
+        self.documents = []
+        self.threads = set()
+        self.down = False
+
+    def insert_many(self, documents, ordered=True):
+        self.threads.add(threading.current_thread())
+        if self.down:
+            raise PyMongoError("connection refused")
+        self.documents.extend(documents)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class MongoRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+
+    def test_full_batches_are_written_off_the_caller_thread(self):
+        recorder = MongoRecorder(self.collection, batch_size=3, interval=0)
+        for i in range(3):
+            recorder.record(i)
+        self.assertTrue(wait_for(lambda: len(self.collection.documents) == 3))
+        self.assertNotIn(threading.current_thread(), self.collection.threads)
+        recorder.close()
+
+    def test_interval_flushes_partial_batches(self):
+        recorder = MongoRecorder(self.collection, batch_size=100, interval=0.05)
+        recorder.record("a")
+        self.assertTrue(wait_for(lambda: self.collection.documents == ["a"]))
+        recorder.close()
+
+    def test_buffer_is_capped_during_outage(self):
+        self.collection.down = True
+        recorder = MongoRecorder(self.collection, batch_size=2, interval=0, max_buffer=5)
+        for i in range(20):
+            recorder.record(i)
+        wait_for(lambda: self.collection.threads)
+        metrics = recorder.metrics()
+        self.assertEqual(metrics["缓存条数"], 5)
+        self.assertEqual(metrics["丢弃条数"], 15)
+        self.collection.down = False
+        recorder.close()
+        self.assertEqual(self.collection.documents, [15, 16, 17, 18, 19])
+
+    def test_records_after_close_are_written(self):
+        recorder = MongoRecorder(self.collection, batch_size=100, interval=0)
+        recorder.record("a")
+        recorder.close()
+        recorder.record("b")    # 程序退出时websocket线程还在收到消息
+        self.assertEqual(self.collection.documents, ["a", "b"])
+        self.assertEqual(recorder.metrics()["缓存条数"], 0)
+
+    def test_failed_final_flush_is_counted_as_dropped(self):
+        recorder = MongoRecorder(self.collection, batch_size=100, interval=0)
+        recorder.record("a")
+        self.collection.down = True
+        with self.assertLogs(level="ERROR"):
+            recorder.close()
+            recorder.record("b")
+        metrics = recorder.metrics()
+        self.assertEqual((metrics["丢弃条数"], metrics["缓存条数"]), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
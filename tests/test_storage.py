@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+
+"""回测模式下策略运行信息的读取，mysql中尚无回测数据库时不应出错；保存k线时不修改已有数据表的结构"""
+
+import unittest
+from unittest import mock
+import mysql.connector
+from mysql.connector import errorcode
+from purequant.config import config
+from purequant.storage import storage
+from purequant.writebehind import write_behind
+
+
+def _missing(errno):
+    """模拟空的mysql服务器：查询时数据库或数据表不存在"""
+    def execute(sql, params=None, database=None, fetch=None, many=False, **server):
+        raise mysql.connector.errors.ProgrammingError(msg="missing", errno=errno)
+    return execute
+
+
+class BacktestRunInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = {name: getattr(config, name, None) for name in ("backtest", "ledger_sink", "ledger_flush_rows")}
+        config.backtest = "enabled"
+        config.ledger_sink = "mysql"
+        config.ledger_flush_rows = 0
+
+    def tearDown(self):
+        with mock.patch.object(storage, "mysql_save_strategy_run_infos"):    # 程序退出时不再写入测试数据
+            storage.reset_ledgers()
+        for name, value in self.saved.items():
+            setattr(config, name, value)
+
+    def run_backtest(self, data_sheet, errno):
+        """与示例策略相同：第一次运行时保存初始资金，再读取总资金，之后保存一笔交易"""
+        with mock.patch.object(storage, "mysql_execute", side_effect=_missing(errno)):
+            storage.mysql_save_strategy_run_info("回测", data_sheet, "策略参数为5&10", "none", 0, 0, 0, 0, "none", 0, 0, 0, 1000)
+            total_asset = storage.read_mysql_datas(0, "回测", data_sheet, "总资金", ">")[-1][-1]
+            storage.mysql_save_strategy_run_info("回测", data_sheet, "2020-01-01", "买入开多", 10, 1, 10, 10, "long", 1, 0, 0, total_asset)
+            return storage.read_mysql_datas(0, "回测", data_sheet, "总资金", ">"), \
+                storage.last_strategy_run_info("回测", data_sheet)
+
+    def test_missing_database(self):
+        rows, last = self.run_backtest("test_bad_db", errorcode.ER_BAD_DB_ERROR)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][-1], 1000)
+        self.assertEqual(last[6], "long")
+
+    def test_missing_table(self):
+        rows, last = self.run_backtest("test_no_table", errorcode.ER_NO_SUCH_TABLE)
+        self.assertEqual([row[1] for row in rows], ["none", "买入开多"])
+
+    def test_other_errors_raise(self):
+        storage.mysql_save_strategy_run_info("回测", "test_other_error", "策略参数为5&10", "none", 0, 0, 0, 0, "none", 0, 0, 0, 1000)
+        with mock.patch.object(storage, "mysql_execute", side_effect=_missing(errorcode.ER_DUP_ENTRY)):
+            with self.assertRaises(mysql.connector.errors.ProgrammingError):
+                storage.read_mysql_datas(0, "回测", "test_other_error", "总资金", ">")
+
+    def test_reset_between_runs(self):
+        self.run_backtest("test_reset", errorcode.ER_BAD_DB_ERROR)
+        with mock.patch.object(storage, "mysql_save_strategy_run_infos") as save:
+            storage.reset_ledgers("回测", "test_reset")
+        self.assertEqual(len(save.call_args[0][2]), 2)  # 清除前写入了此次回测的两行
+        self.assertIsNone(storage.ledger("回测", "test_reset"))
+        with mock.patch.object(storage, "mysql_execute", return_value=[]):
+            with self.assertRaises(IndexError):     # 不再返回上一次回测缓存的持仓
+                storage.last_strategy_run_info("回测", "test_reset")
+
+    def test_delete_database_forgets_cache(self):
+        self.run_backtest("test_delete", errorcode.ER_BAD_DB_ERROR)
+        with mock.patch.object(storage, "mysql_execute", return_value=None), \
+                mock.patch.object(storage, "close_mysql_pools"):
+            storage.delete_mysql_database("回测")
+        self.assertIsNone(storage.ledger("回测", "test_delete"))
+        with mock.patch.object(storage, "mysql_execute", side_effect=_missing(errorcode.ER_BAD_DB_ERROR)):
+            with self.assertRaises(mysql.connector.errors.ProgrammingError):
+                storage.last_strategy_run_info("回测", "test_delete")
+
+
+class KlineIndexTest(unittest.TestCase):
+
+    KLINES = [["2020-01-01T00:00:00.000Z", 1, 2, 0.5, 1.5, 10], ["2020-01-01T00:01:00.000Z", 1.5, 2, 1, 1.8, 12]]
+
+    def save(self, data_sheet, indexed, **kwargs):
+        """批量与实时各保存一次k线，返回执行过的sql语句；indexed为数据表中是否已有时间字段的唯一索引"""
+        statements = []
+        cursor = mock.Mock()
+        cursor.execute.side_effect = cursor.executemany.side_effect = lambda sql, rows: statements.append(sql)
+
+        def execute(sql, params=None, database=None, fetch=None, many=False, **server):
+            statements.append(sql)
+            return [("kline", 0, "timestamp_unique")] if indexed and sql.startswith("SHOW INDEX") else None
+        pool = mock.Mock()
+        pool.run.side_effect = lambda work, retry=False: work(mock.Mock(cursor=mock.Mock(return_value=cursor)))
+        with mock.patch.object(storage, "mysql_execute", side_effect=execute), \
+                mock.patch.object(storage, "mysql_ensure_table"), \
+                mock.patch.object(storage, "mysql_pool", return_value=pool), \
+                mock.patch.object(write_behind, "put", side_effect=lambda kind, key, params: statements.append(key[3])):
+            storage.mysql_save_klines("kline_test", data_sheet, self.KLINES, **kwargs)
+            storage._Storage__binance_save_kline_func("kline_test", data_sheet, *self.KLINES[1])
+        return statements
+
+    def test_schema_is_not_changed_by_default(self):
+        statements = self.save("test_no_index", indexed=False)
+        self.assertFalse([sql for sql in statements if sql.startswith("ALTER")])
+        self.assertTrue(any(sql.startswith("DELETE") for sql in statements))
+        self.assertFalse([sql for sql in statements if "ON DUPLICATE KEY UPDATE" in sql])
+
+    def test_existing_index_is_used_by_live_saves(self):
+        statements = self.save("test_indexed", indexed=True)
+        inserts = [sql for sql in statements if sql.startswith("insert")]
+        self.assertEqual(len(inserts), 2)
+        self.assertTrue(all("ON DUPLICATE KEY UPDATE" in sql for sql in inserts))
+        self.assertFalse([sql for sql in statements if sql.startswith(("ALTER", "DELETE"))])
+
+    def test_index_is_added_on_request(self):
+        statements = self.save("test_opt_in", indexed=False, unique_index=True)
+        self.assertEqual(len([sql for sql in statements if sql.startswith("ALTER")]), 1)
+        self.assertTrue(all("ON DUPLICATE KEY UPDATE" in sql for sql in statements if sql.startswith("insert")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+
+"""增量指标逐根输入k线（包括同一根k线的多次价格变动）后，与TA-Lib在完整数据上的计算结果一致"""
+
+import unittest
+import numpy as np
+from purequant import streaming
+from purequant.backends import talib
+
+
+def random_walk(seed, bars=300):
+    """随机游走的k线数据，包含收盘价不变与高低收完全相同的横盘行情"""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 1, bars)), 2)
+    start = rng.integers(0, bars - 80)
+    close[start:start + 60] = close[start]
+    open = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open, close) + np.round(rng.random(bars), 2) * (rng.random(bars) > 0.3)
+    low = np.minimum(open, close) - np.round(rng.random(bars), 2) * (rng.random(bars) > 0.3)
+    high[start:start + 30] = low[start:start + 30] = close[start]
+    volume = np.round(rng.random(bars) * 100, 3)
+    return open, high, low, close, volume
+
+
+# 增量指标与对应的TA-Lib计算函数
+CASES = {
+    "SMA": (lambda n: streaming.SMA(n), lambda o, h, l, c, v, n: talib.SMA(c, n)),
+    "EMA": (lambda n: streaming.EMA(n), lambda o, h, l, c, v, n: talib.EMA(c, n)),
+    "ATR": (lambda n: streaming.ATR(n), lambda o, h, l, c, v, n: talib.ATR(h, l, c, n)),
+    "RSI": (lambda n: streaming.RSI(n), lambda o, h, l, c, v, n: talib.RSI(c, n)),
+    "BBANDS": (lambda n: streaming.BBANDS(n, 2, 2), lambda o, h, l, c, v, n: talib.BBANDS(c, n, 2, 2, 0)),
+    "STDDEV": (lambda n: streaming.STDDEV(n, 1), lambda o, h, l, c, v, n: talib.STDDEV(c, n, 1)),
+    "OBV": (lambda n: streaming.OBV(), lambda o, h, l, c, v, n: talib.OBV(c, v)),
+}
+
+
+@unittest.skipIf(talib is None, "未安装TA-Lib")
+class StreamingParityTest(unittest.TestCase):
+
+    def replay(self, indicator, bars, seed):
+        """逐根输入k线，每根k线先输入一个未收盘时的价格，再以相同的时间戳输入最终价格"""
+        rng = np.random.default_rng(seed)
+        open, high, low, close, volume = bars
+        for i in range(len(close)):
+            interim = close[i] + np.round(rng.normal(0, 1), 2)
+            indicator.update(i, open[i], max(high[i], interim), min(low[i], interim), interim, volume[i] / 2)
+            indicator.update(i, open[i], high[i], low[i], close[i], volume[i])
+        return indicator.values()
+
+    def test_parity_after_revisions(self):
+        for seed in range(10):
+            bars = random_walk(seed)
+            for name, (create, reference) in CASES.items():
+                for length in (2, 5, 14):
+                    with self.subTest(indicator=name, seed=seed, length=length):
+                        actual = self.replay(create(length), bars, seed)
+                        expected = reference(*bars, length)
+                        actual = actual if isinstance(actual, tuple) else (actual,)
+                        expected = expected if isinstance(expected, tuple) else (expected,)
+                        for x, y in zip(expected, actual):
+                            np.testing.assert_allclose(y, x, rtol=1e-9, atol=1e-9)
+
+    def test_rsi_after_long_flat_run(self):
+        close = np.array([10, 11, 12] + [12] * 57 + list(np.linspace(12, 13, 10)), dtype=np.float64)
+        indicator = streaming.RSI(2)
+        for i, price in enumerate(close):
+            indicator.update(i, price, price, price, price, 1.0)
+        np.testing.assert_allclose(indicator.values(), talib.RSI(close, 2), rtol=1e-9)
+
+    def test_earlier_bars_are_ignored(self):
+        indicator = streaming.SMA(2)
+        indicator.update(1, 1, 1, 1, 1, 1)
+        indicator.update(2, 3, 3, 3, 3, 1)
+        self.assertEqual(indicator.update(0, 9, 9, 9, 9, 1), 2.0)
+        self.assertEqual(len(indicator.values()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding:utf-8 -*-
+
+"""多进程参数优化：结果顺序与进程数无关，子进程不使用父进程的连接池，共享内存在出错时也会释放"""
+
+import time
+import unittest
+from multiprocessing import shared_memory
+from unittest import mock
+import numpy as np
+from purequant import sweep
+from purequant.kline import KlineFrame
+from purequant.storage import storage
+
+
+def _history(bars=50):
+    close = np.linspace(100, 150, bars)
+    return KlineFrame(np.arange(bars) * 60000, close, close + 1, close - 1, close, np.ones(bars))
+
+
+def _backtest(history, length, delay=0.0):
+    time.sleep(delay)   # 先提交的组合后完成
+    pool = storage.mysql_pool("sweep_test", user="test", password="test")
+    return {"均值": float(history.close[-length:].mean()), "复用父进程连接池": getattr(pool, "parent", False)}
+
+
+def _failing(history, length):
+    raise ValueError("回测出错")
+
+
+class _Recorded(sweep.SharedKlines):
+    """记录创建过的共享内存名称"""
+    names = []
+
+    def __init__(self, frame):
+        super().__init__(frame)
+        self.names.append(self.name)
+
+
+class SweepTest(unittest.TestCase):
+
+    def setUp(self):
+        _Recorded.names.clear()
+        patcher = mock.patch.object(sweep, "SharedKlines", _Recorded)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertReleased(self):
+        self.assertEqual(len(_Recorded.names), 1)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=_Recorded.names[0])
+
+    def test_results_follow_parameter_order(self):
+        storage.mysql_pool("sweep_test", user="test", password="test").parent = True    # 父进程中已经创建的连接池
+        self.addCleanup(storage.close_mysql_pools, "sweep_test")
+        grid = [{"length": length, "delay": 0.05 * (6 - length)} for length in range(1, 7)]
+        history = _history()
+        results = sweep.sweep(_backtest, grid, history, processes=2, progress=False)
+        expected = [dict(params, **_backtest(history, **dict(params, delay=0))) for params in grid]
+        expected = [dict(row, 复用父进程连接池=False) for row in expected]
+        self.assertEqual(results, expected)
+        self.assertReleased()
+
+    def test_shared_memory_is_released_on_error(self):
+        with self.assertRaises(ValueError):
+            sweep.sweep(_failing, {"length": [1, 2, 3]}, _history(), processes=2, progress=False)
+        self.assertReleased()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding:utf-8 -*-
+
+"""k线时间列的批量转换与逐个用strptime转换的结果一致，不合法的日期报错"""
+
+import calendar
+import datetime
+import unittest
+import numpy as np
+from purequant.time import utctime_str_column_to_mts, kline_time_to_mts
+
+
+def _strptime_mts(value):
+    """逐个用strptime转换，作为对照"""
+    text = value.rstrip("zZ").replace(" ", "T")
+    dt = datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%f" if "." in text else "%Y-%m-%dT%H:%M:%S")
+    return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+
+
+def _random_times(seed, count=2000, milliseconds=True):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("1900-01-01T00:00:00.000")
+    offsets = rng.integers(0, 250 * 365 * 86400000, count).astype("timedelta64[ms]")
+    times = np.datetime_as_string(start + offsets, unit="ms" if milliseconds else "s")
+    return [value + "Z" for value in times.tolist()]
+
+
+class ColumnToMtsTest(unittest.TestCase):
+
+    def assertSameAsStrptime(self, column):
+        np.testing.assert_array_equal(utctime_str_column_to_mts(column), [_strptime_mts(value) for value in column])
+
+    def test_with_milliseconds(self):
+        for seed in range(5):
+            self.assertSameAsStrptime(_random_times(seed))
+
+    def test_without_milliseconds(self):
+        self.assertSameAsStrptime(_random_times(0, milliseconds=False))
+        self.assertSameAsStrptime(["2020-03-01 08:00:00", "2020-03-01 09:00:00"])
+
+    def test_leap_days_and_month_ends(self):
+        self.assertSameAsStrptime(["2000-02-29T00:00:00.000Z", "2020-02-29T23:59:59.999Z", "2021-04-30T12:00:00Z",
+                                   "2021-12-31T23:59:59Z", "1970-01-01T00:00:00Z"])
+
+    def test_invalid_dates_raise(self):
+        for value in ("2020-02-30T00:00:00.000Z", "2021-02-29T00:00:00.000Z", "1900-02-29T00:00:00Z",
+                      "2020-04-31T00:00:00Z", "2020-01-01T24:00:00Z", "2020-01-01T00:60:00Z", "2020-13-01T00:00:00Z"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    _strptime_mts(value)
+                with self.assertRaises(ValueError):
+                    utctime_str_column_to_mts(["2020-01-01T00:00:00.000Z", value])
+
+    def test_numeric_columns(self):
+        milliseconds = [1577836800000, 1577836860000, 1609459199999]
+        seconds = [value // 1000 for value in milliseconds]
+        for column in (milliseconds, seconds, [str(value) for value in milliseconds], [float(value) for value in seconds],
+                       np.array(milliseconds), np.array(seconds, dtype=np.float64)):
+            with self.subTest(column=column):
+                expected = [kline_time_to_mts(value) for value in column]
+                np.testing.assert_array_equal(utctime_str_column_to_mts(column), expected)
+                self.assertEqual(utctime_str_column_to_mts(column).dtype, np.int64)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding:utf-8 -*-
+
+"""异步写入队列出错时的重试与逐条重新写入，读取前只等待要读取的数据写入"""
+
+import threading
+import unittest
+from purequant.writebehind import WriteBehind
+
+
+class Disconnected(Exception):
+    pass
+
+
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = WriteBehind(mode="async", interval=0.01, retries=2, backoff=0.001)
+        self.written = []
+        self.calls = 0
+
+    def tearDown(self):
+        self.queue.close()
+
+    def put_all(self, kind, items):
+        for item in items:
+            self.queue.put(kind, "sheet", item)
+        self.queue.flush()
+
+    def test_transient_errors_are_retried(self):
+        def handler(key, items):
+            self.calls += 1
+            if self.calls <= 2:
+                raise Disconnected()
+            self.written.extend(items)
+        self.queue.register("db", handler, transient=(Disconnected,), split=True)
+        self.put_all("db", [1, 2, 3])
+        self.assertEqual(self.written, [1, 2, 3])
+        metrics = self.queue.metrics()
+        self.assertEqual(metrics["重试次数"], 2)
+        self.assertEqual(metrics["丢弃条数"], 0)
+
+    def test_only_the_bad_row_is_dropped(self):
+        def handler(key, items):   # 与一个事务中的executemany相同：出错时整批都不写入
+            if "bad" in items:
+                raise ValueError("bad row")
+            self.written.extend(items)
+        self.queue.register("db", handler, transient=(Disconnected,), split=True)
+        self.put_all("db", [1, "bad", 3])
+        self.assertEqual(self.written, [1, 3])
+        self.assertEqual(self.queue.metrics()["丢弃条数"], 1)
+
+    def test_unsplittable_batches_are_not_rewritten(self):
+        def handler(key, items):
+            self.written.extend(items)
+            raise ValueError("partial write")
+        self.queue.register("file", handler)
+        self.put_all("file", [1, 2])
+        self.assertEqual(self.written, [1, 2])
+        self.assertEqual(self.queue.metrics()["丢弃条数"], 2)
+
+    def test_uncertain_writes_are_not_rewritten(self):
+        def handler(key, items):
+            self.calls += 1
+            raise LookupError("commit lost")
+        self.queue.register("db", handler, transient=(Disconnected,), split=True, uncertain=(LookupError,))
+        self.put_all("db", [1, 2])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.queue.metrics()["丢弃条数"], 2)
+
+    def test_calls_fail_independently(self):
+        def fail():
+            raise ValueError("push failed")
+        self.queue.call(self.written.append, 1)
+        self.queue.call(fail)
+        self.queue.call(self.written.append, 2)
+        self.queue.flush()
+        self.assertEqual(self.written, [1, 2])
+
+    def test_flush_waits_only_for_the_table_being_read(self):
+        release = threading.Event()
+        self.queue.register("db", lambda key, items: self.written.extend(items))
+        self.queue.call(release.wait)     # 推送消息在重试中，一直没有完成
+        self.queue.put("db", ("回测", "sheet", "columns"), 1)
+        self.queue.put("db", ("回测", "other", "columns"), 2)
+        self.queue.flush("db", ("回测", "sheet"))
+        self.assertIn(1, self.written)
+        self.assertEqual(self.queue.metrics()["队列长度"], 0)
+        release.set()
+        self.queue.flush()
+        self.assertEqual(sorted(self.written), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()